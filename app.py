@@ -1,8 +1,12 @@
 import streamlit as st
-import pandas as pd
 import datetime
 import database as db
+import archive
+import backup
+import export
+import profiling
 import calendar
+import json
 import time
 
 # Page config
@@ -13,10 +17,34 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+def route_to_user():
+    # Hosted for a team, ?user=<id> gives each user their own database. Every
+    # run, fragment rerun and callback may be on a fresh thread, so each sets
+    # the route before touching the database.
+    db.set_current_user(st.session_state.get('user_id'))
+
 # Initialize DB
 if 'db_initialized' not in st.session_state:
+    st.session_state.user_id = st.query_params.get("user")
+    st.session_state.profiling = st.query_params.get("profile") == "1"
+    st.session_state.slow_query_ms = profiling.SLOW_QUERY_MS
+    try:
+        route_to_user()
+    except ValueError as e:
+        st.error(f"{e}. User ids may contain letters, digits, '-', '_' and '.'.")
+        st.stop()
     db.init_db()
     st.session_state.db_initialized = True
+route_to_user()
+# Snapshot the database in the background if the last backup is old, and
+# move old reviews to the archive once a day
+backup.maybe_backup()
+archive.maybe_archive()
+
+# ?profile=1 records this run's statements and section timings for the
+# debug panel at the bottom of the sidebar
+if st.session_state.profiling:
+    profiling.start(st.session_state.slow_query_ms)
 
 # Custom CSS
 st.markdown("""
@@ -46,6 +74,8 @@ st.markdown("""
 
 # Sidebar
 st.sidebar.title("LeetRepeat 🔁")
+if st.session_state.user_id:
+    st.sidebar.caption(f"Signed in as **{st.session_state.user_id}**")
 st.sidebar.markdown("---")
 
 # Navigation
@@ -61,16 +91,81 @@ sim_date = st.sidebar.date_input("Simulate Date", value=st.session_state.current
 st.session_state.current_date = sim_date
 
 # Quick Stats in Sidebar
-due_revisions = db.get_due_revisions(st.session_state.current_date)
-overdue_count = sum(1 for r in due_revisions if datetime.datetime.strptime(r['due_date'], '%Y-%m-%d').date() < st.session_state.current_date)
-due_today_count = sum(1 for r in due_revisions if datetime.datetime.strptime(r['due_date'], '%Y-%m-%d').date() == st.session_state.current_date)
+with profiling.section("sidebar stats"):
+    due_summary = db.get_due_summary(st.session_state.current_date)
+    overdue_count = due_summary['overdue']
+    due_today_count = due_summary['due_today']
 
-st.sidebar.markdown(f"**Due Today:** {due_today_count}")
-st.sidebar.markdown(f"**Overdue:** {overdue_count}")
+    st.sidebar.markdown(f"**Due Today:** {due_today_count}")
+    st.sidebar.markdown(f"**Overdue:** {overdue_count}")
+    st.sidebar.markdown(f"**Upcoming (7 days):** {due_summary['upcoming']}")
+    if due_summary['by_difficulty']:
+        st.sidebar.caption(" | ".join(
+            f"{difficulty or 'N/A'}: {counts['overdue'] + counts['due_today']}"
+            for difficulty, counts in sorted(due_summary['by_difficulty'].items(), key=lambda item: str(item[0]))
+        ))
 
 # Helper functions
-def render_revision_card(revision):
-    due_date = datetime.datetime.strptime(revision['due_date'], '%Y-%m-%d').date()
+VIEW_MODES = {"All Due": "all", "Overdue Only": "overdue", "Today Only": "today"}
+PAGE_SIZE = 20
+
+SCHEDULER_LABELS = {"Fixed Intervals": "fixed", "SM-2": "sm2", "FSRS": "fsrs"}
+RECALL_QUALITY = {"Easy": 5, "Good": 4, "Hard": 3}
+SEARCH_LIMIT = 50
+EXPORT_FORMAT_LABELS = {"csv": "CSV", "csv.gz": "Compressed CSV (gzip)", "parquet": "Parquet"}
+
+ACTION_LABELS = {"done": "✓ Done", "failed": "✗ Failed", "snoozed": "⏰ Snoozed"}
+
+def submit_review(revision, action):
+    route_to_user()
+    current_date = st.session_state.current_date
+    if action == "done":
+        quality = RECALL_QUALITY[st.session_state[f"recall_sel_{revision['id']}"]]
+        args = (db.mark_revision_done, revision['id'], revision['problem_id'], current_date, quality)
+    elif action == "failed":
+        args = (db.mark_revision_failed, revision['id'], revision['problem_id'], current_date)
+    else:
+        args = (db.snooze_revision, revision['id'], st.session_state[f"snooze_sel_{revision['id']}"])
+    # Optimistic update: the card disappears on this rerun while the write
+    # waits on the database's writer thread, and is confirmed later
+    st.session_state.review_actions[revision['id']] = {
+        'title': revision['title'] or revision['problem_id'],
+        'action': action,
+        'future': db.submit_write(*args),
+    }
+
+def submit_bulk_review(revisions, action):
+    # One queued write for every selected card, applied in a single transaction
+    route_to_user()
+    selected = [r for r in revisions if st.session_state.get(f"select_{r['id']}")]
+    if not selected:
+        return
+    ids = [r['id'] for r in selected]
+    current_date = st.session_state.current_date
+    if action == "done":
+        args = (db.mark_revisions_done, ids, current_date, RECALL_QUALITY[st.session_state.bulk_recall])
+    elif action == "failed":
+        args = (db.mark_revisions_failed, ids, current_date)
+    else:
+        args = (db.snooze_revisions, ids, st.session_state.bulk_snooze)
+    future = db.submit_write(*args)
+    for r in selected:
+        st.session_state.review_actions[r['id']] = {
+            'title': r['title'] or r['problem_id'],
+            'action': action,
+            'future': future,
+        }
+
+def render_bulk_actions(revisions):
+    b0, b1, b2, b3, b4 = st.columns(5)
+    b0.selectbox("Recall", list(RECALL_QUALITY), index=1, key="bulk_recall", label_visibility="collapsed")
+    b1.button("Done selected ✓", on_click=submit_bulk_review, args=(revisions, "done"))
+    b2.button("Fail selected ✗", on_click=submit_bulk_review, args=(revisions, "failed"))
+    b3.selectbox("Snooze", [1, 2, 7], key="bulk_snooze", label_visibility="collapsed")
+    b4.button("Snooze selected ⏰", on_click=submit_bulk_review, args=(revisions, "snoozed"))
+
+def render_revision_card(revision, selectable=False):
+    due_date = revision['due_date']
     is_overdue = due_date < st.session_state.current_date
     card_class = "card-overdue" if is_overdue else "card"
     
@@ -83,53 +178,123 @@ def render_revision_card(revision):
         </div>
         """, unsafe_allow_html=True)
         
-        c1, c2, c3, c4 = st.columns(4)
+        if selectable:
+            st.checkbox("Select", key=f"select_{revision['id']}")
+            st.markdown("---")
+            return
+        
+        # Button callbacks run before the fragment reruns, so the acted-on
+        # card is already gone when the queue is redrawn.
+        c0, c1, c2, c3, c4 = st.columns(5)
+        with c0:
+            st.selectbox("Recall", list(RECALL_QUALITY), index=1, key=f"recall_sel_{revision['id']}", label_visibility="collapsed")
         with c1:
-            if st.button("Done ✓", key=f"done_{revision['id']}"):
-                db.mark_revision_done(revision['id'], revision['problem_id'], st.session_state.current_date, quality=5) # Default quality 5
-                st.success("Marked as done!")
-                time.sleep(0.5)
-                st.rerun()
+            st.button("Done ✓", key=f"done_{revision['id']}", on_click=submit_review, args=(revision, "done"))
         with c2:
-            if st.button("Fail ✗", key=f"fail_{revision['id']}"):
-                db.mark_revision_failed(revision['id'], revision['problem_id'], st.session_state.current_date)
-                st.error("Marked as failed. Rescheduled.")
-                time.sleep(0.5)
-                st.rerun()
+            st.button("Fail ✗", key=f"fail_{revision['id']}", on_click=submit_review, args=(revision, "failed"))
         with c3:
-            snooze_days = st.selectbox("Snooze", [1, 2, 7], key=f"snooze_sel_{revision['id']}", label_visibility="collapsed")
+            st.selectbox("Snooze", [1, 2, 7], key=f"snooze_sel_{revision['id']}", label_visibility="collapsed")
         with c4:
-            if st.button("Snooze ⏰", key=f"snooze_btn_{revision['id']}"):
-                db.snooze_revision(revision['id'], snooze_days)
-                st.info(f"Snoozed for {snooze_days} days.")
-                time.sleep(0.5)
-                st.rerun()
+            st.button("Snooze ⏰", key=f"snooze_btn_{revision['id']}", on_click=submit_review, args=(revision, "snoozed"))
         st.markdown("---")
 
+@st.fragment
+def render_review_queue():
+    # Runs as a Streamlit fragment: card actions, filters and paging rerun
+    # only this function, not the sidebar, calendar or the rest of the page.
+    route_to_user()
+    actions = st.session_state.setdefault('review_actions', {})
+    in_flight = {rev_id for rev_id, entry in actions.items() if not entry['future'].done()}
+    failed_writes = {rev_id: entry for rev_id, entry in actions.items()
+                     if entry['future'].done() and entry['future'].exception() is not None}
+    
+    summary = db.get_due_summary(st.session_state.current_date)
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Remaining", max(summary['overdue'] + summary['due_today'] - len(in_flight), 0))
+    m2.metric("Reviewed this session", len(actions) - len(failed_writes))
+    m3.metric("Saving…", len(in_flight))
+    
+    for rev_id, entry in failed_writes.items():
+        st.error(f"Could not save {ACTION_LABELS[entry['action']]} for {entry['title']}: {entry['future'].exception()}")
+        del actions[rev_id]  # show the card again so it can be retried
+    if actions:
+        recent = list(actions.values())[-5:]
+        st.caption(" · ".join(
+            f"{ACTION_LABELS[entry['action']]} {entry['title']}{' (saving…)' if not entry['future'].done() else ''}"
+            for entry in reversed(recent)
+        ))
+    
+    view_option = st.radio("Show", list(VIEW_MODES), horizontal=True)
+    multi_select = st.toggle("Select multiple")
+    f1, f2 = st.columns(2)
+    difficulty_filter = f1.multiselect("Difficulty", ["Easy", "Medium", "Hard"])
+    with f2:
+        tag_filter = pick_tags("queue_tags", difficulties=difficulty_filter, due_by=st.session_state.current_date)
+    
+    # Stack of keyset cursors: the (due_date, id) each visited page starts after.
+    # Changing the date or any filter starts again from the first page.
+    queue_key = (st.session_state.current_date, view_option, tuple(difficulty_filter), tuple(tag_filter))
+    if st.session_state.get('queue_key') != queue_key:
+        st.session_state.queue_key = queue_key
+        st.session_state.queue_cursors = [None]
+    cursors = st.session_state.queue_cursors
+    
+    page_rows, has_more = db.get_due_page(
+        st.session_state.current_date,
+        mode=VIEW_MODES[view_option],
+        difficulties=difficulty_filter,
+        tags=tag_filter,
+        after=cursors[-1],
+        limit=PAGE_SIZE,
+    )
+    # Cards whose write is still in flight stay hidden
+    to_show = [r for r in page_rows if r['id'] not in in_flight]
+            
+    if not to_show:
+        st.info("No revisions due!")
+    else:
+        if multi_select:
+            render_bulk_actions(to_show)
+        for r in to_show:
+            render_revision_card(r, selectable=multi_select)
+    
+    p1, p2, p3 = st.columns([1, 2, 1])
+    p1.button("← Prev", disabled=len(cursors) == 1, on_click=cursors.pop)
+    p2.markdown(f"<div style='text-align: center'>Page {len(cursors)}</div>", unsafe_allow_html=True)
+    if page_rows:
+        next_cursor = (page_rows[-1]['due_date'], page_rows[-1]['id'])
+        p3.button("Next →", disabled=not has_more, on_click=cursors.append, args=(next_cursor,))
+
+def pick_tags(key, **facets):
+    # Tag multiselect; each tag shows how many problems matching the other
+    # filters and the tags already chosen carry it
+    chosen = st.session_state.get(key, [])
+    counts = {row['tag']: row['problems'] for row in db.get_tag_counts(tags=chosen, **facets)}
+    options = list(counts) + [tag for tag in chosen if tag not in counts]
+    return st.multiselect("Tags", options, key=key, format_func=lambda tag: f"{tag} ({counts.get(tag, 0)})")
+
+def pick_problem(label, key):
+    # Search box plus a selectbox of the best matches (the most recently
+    # added problems while the search is empty); returns the chosen row
+    query = st.text_input("Search", key=f"{key}_query", placeholder="Title, id, tag or note")
+    matches = {row['problem_id']: row for row in db.search_problems(query, limit=SEARCH_LIMIT)}
+    if not matches:
+        st.info("No matching problems.")
+        return None
+    problem_id = st.selectbox(label, list(matches), key=key,
+                              format_func=lambda problem_id: f"{problem_id} | {matches[problem_id]['title']}")
+    return matches[problem_id]
+
 # Pages
+profiling.mark(f"page: {page}")
 if page == "Today":
     st.header(f"Today's Revisions ({st.session_state.current_date})")
     
     col_main, col_right = st.columns([2, 1])
     
     with col_main:
-        view_option = st.radio("Show", ["All Due", "Overdue Only", "Today Only"], horizontal=True)
-        
-        to_show = []
-        for r in due_revisions:
-            r_date = datetime.datetime.strptime(r['due_date'], '%Y-%m-%d').date()
-            if view_option == "Overdue Only" and r_date < st.session_state.current_date:
-                to_show.append(r)
-            elif view_option == "Today Only" and r_date == st.session_state.current_date:
-                to_show.append(r)
-            elif view_option == "All Due":
-                to_show.append(r)
-                
-        if not to_show:
-            st.info("No revisions due!")
-        else:
-            for r in to_show:
-                render_revision_card(r)
+        with profiling.section("review queue"):
+            render_review_queue()
 
     with col_right:
         st.subheader("Calendar")
@@ -152,37 +317,38 @@ if page == "Today":
             st.session_state.current_date = new_date
             st.rerun()
             
-        counts = db.get_counts_per_day(year, month)
-        cal = calendar.monthcalendar(year, month)
+        with profiling.section("calendar grid"):
+            counts = db.get_counts_per_day(year, month)
+            cal = calendar.monthcalendar(year, month)
         
-        # Small grid
-        cols = st.columns(7)
-        days = ["M", "T", "W", "T", "F", "S", "S"]
-        for i, day in enumerate(days):
-            cols[i].markdown(f"<small>{day}</small>", unsafe_allow_html=True)
-            
-        for week in cal:
+            # Small grid
             cols = st.columns(7)
-            for i, day in enumerate(week):
-                if day == 0:
-                    cols[i].write("")
-                else:
-                    d_str = f"{year}-{month:02d}-{day:02d}"
-                    count = counts.get(d_str, 0)
-                    # Highlight current day
-                    is_selected = (day == st.session_state.current_date.day and month == st.session_state.current_date.month and year == st.session_state.current_date.year)
+            days = ["M", "T", "W", "T", "F", "S", "S"]
+            for i, day in enumerate(days):
+                cols[i].markdown(f"<small>{day}</small>", unsafe_allow_html=True)
+            
+            for week in cal:
+                cols = st.columns(7)
+                for i, day in enumerate(week):
+                    if day == 0:
+                        cols[i].write("")
+                    else:
+                        d_str = f"{year}-{month:02d}-{day:02d}"
+                        count = counts.get(datetime.date(year, month, day), 0)
+                        # Highlight current day
+                        is_selected = (day == st.session_state.current_date.day and month == st.session_state.current_date.month and year == st.session_state.current_date.year)
                     
-                    label = f"{day}"
-                    if count > 0:
-                        label += f" •" # Dot to indicate tasks
+                        label = f"{day}"
+                        if count > 0:
+                            label += f" •" # Dot to indicate tasks
                     
-                    if cols[i].button(label, key=f"mini_cal_{d_str}", help=f"{count} tasks"):
-                        st.session_state.current_date = datetime.date(year, month, day)
-                        st.rerun()
+                        if cols[i].button(label, key=f"mini_cal_{d_str}", help=f"{count} tasks"):
+                            st.session_state.current_date = datetime.date(year, month, day)
+                            st.rerun()
         
         st.markdown("---")
         st.subheader("Quick Stats")
-        stats = db.get_analytics_stats()
+        stats = db.get_analytics_stats(st.session_state.current_date)
         st.metric("Total Solved", stats['total_solved'])
         st.metric("Due Today", due_today_count)
         st.metric("Overdue", overdue_count)
@@ -218,36 +384,24 @@ elif page == "Add Problem":
     if uploaded_file is not None:
         if st.button("Import CSV"):
             try:
-                df = pd.read_csv(uploaded_file)
-                success_count = 0
-                fail_count = 0
-                for _, row in df.iterrows():
-                    # Basic validation
-                    if 'problem_id' not in row:
-                        continue
-                    
-                    p_id = str(row['problem_id']).strip()
-                    title = row.get('title', None)
-                    difficulty = row.get('difficulty', None)
-                    tags = row.get('tags', None)
-                    
-                    # Date handling
-                    date_added = st.session_state.current_date
-                    if 'date' in row and pd.notna(row['date']):
-                        try:
-                            date_added = datetime.datetime.strptime(str(row['date']), '%Y-%m-%d').date()
-                        except:
-                            pass # Fallback to current date
-                    
-                    if db.add_problem(p_id, title, difficulty, tags, date_added):
-                        success_count += 1
-                    else:
-                        fail_count += 1
-                st.success(f"Imported {success_count} problems. {fail_count} failed (duplicates).")
+                report = db.bulk_import(uploaded_file, st.session_state.current_date)
+                st.success(f"Imported {report['inserted']} problems. {len(report['duplicates'])} duplicates, {len(report['invalid'])} invalid rows.")
+                if report['duplicates']:
+                    with st.expander("Duplicates (skipped)"):
+                        st.write(", ".join(report['duplicates']))
+                if report['invalid']:
+                    import pandas as pd
+                    with st.expander("Invalid rows"):
+                        st.dataframe(pd.DataFrame(report['invalid'], columns=["line", "reason"]), use_container_width=True)
             except Exception as e:
                 st.error(f"Error processing CSV: {e}")
 
 elif page == "Calendar":
+    # pandas and altair take longer to import than the rest of the app, so
+    # only the pages that use them do
+    import altair as alt
+    import pandas as pd
+    
     st.header("Calendar View")
     
     # Simple month view
@@ -274,58 +428,98 @@ elif page == "Calendar":
             st.session_state.current_date = new_date
             st.rerun()
 
-    counts = db.get_counts_per_day(year, month)
+    with profiling.section("calendar grid"):
+        counts = db.get_counts_per_day(year, month)
     
-    cal = calendar.monthcalendar(year, month)
+        cal = calendar.monthcalendar(year, month)
     
-    cols = st.columns(7)
-    days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-    for i, day in enumerate(days):
-        cols[i].markdown(f"**{day}**")
-        
-    for week in cal:
         cols = st.columns(7)
-        for i, day in enumerate(week):
-            if day == 0:
-                cols[i].write("")
-            else:
-                d_str = f"{year}-{month:02d}-{day:02d}"
-                count = counts.get(d_str, 0)
-                if cols[i].button(f"{day} {'(' + str(count) + ')' if count > 0 else ''}", key=f"cal_{d_str}"):
-                    st.session_state.current_date = datetime.date(year, month, day)
-                    st.rerun()
+        days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+        for i, day in enumerate(days):
+            cols[i].markdown(f"**{day}**")
+        
+        for week in cal:
+            cols = st.columns(7)
+            for i, day in enumerate(week):
+                if day == 0:
+                    cols[i].write("")
+                else:
+                    d_str = f"{year}-{month:02d}-{day:02d}"
+                    count = counts.get(datetime.date(year, month, day), 0)
+                    if cols[i].button(f"{day} {'(' + str(count) + ')' if count > 0 else ''}", key=f"cal_{d_str}"):
+                        st.session_state.current_date = datetime.date(year, month, day)
+                        st.rerun()
+    st.markdown("---")
+    st.subheader("Next 365 Days")
+    start = st.session_state.current_date
+    load = db.get_daily_load(start, start + datetime.timedelta(days=365))
+    if not load:
+        st.info("Nothing scheduled.")
+    else:
+        load_df = pd.DataFrame(load, columns=["day", "difficulty", "count"])
+        load_df = load_df.groupby("day", as_index=False)["count"].sum()
+        load_df["day"] = pd.to_datetime(load_df["day"])
+        load_df["week"] = load_df["day"].dt.to_period("W").dt.start_time
+        load_df["weekday"] = load_df["day"].dt.day_name().str[:3]
+        heatmap = alt.Chart(load_df).mark_rect().encode(
+            x=alt.X("week:T", title=None),
+            y=alt.Y("weekday:O", sort=["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"], title=None),
+            color=alt.Color("count:Q", scale=alt.Scale(scheme="blues"), title="Due"),
+            tooltip=[alt.Tooltip("day:T"), "count:Q"],
+        ).properties(height=180)
+        st.altair_chart(heatmap, use_container_width=True)
+
+    st.markdown("---")
+    st.subheader("Rebalance Backlog")
+    st.caption("Spread overdue and upcoming reviews so no day has more than you can handle. "
+               "Failed, harder and longer-overdue problems are scheduled first.")
+    r1, r2 = st.columns(2)
+    capacity = r1.number_input("Reviews per day", min_value=1, value=10)
+    horizon = r2.number_input("Horizon (days)", min_value=1, max_value=90, value=14)
+    moves = db.rebalance(st.session_state.current_date, capacity, horizon, dry_run=True)
+    if moves.empty:
+        st.info("Nothing to move: every day is within capacity.")
+    else:
+        # Preview: daily load now and after the moves
+        span_end = start + datetime.timedelta(days=horizon + len(moves) // capacity + 1)
+        before = pd.Series(db.get_load_between(start, span_end), dtype=int)
+        after = before.sub(moves['due_date'].value_counts(), fill_value=0).add(moves['new_due_date'].value_counts(), fill_value=0)
+        preview_df = pd.concat([before.rename("Before"), after.rename("After")], axis=1).fillna(0)
+        preview_df = preview_df[preview_df.index >= start].sort_index()
+        st.bar_chart(preview_df, stack=False)
+        st.caption(f"{len(moves)} revisions would move.")
+        with st.expander("Moves"):
+            st.dataframe(moves, use_container_width=True)
+        if st.button("Apply Rebalance"):
+            moved = db.rebalance(st.session_state.current_date, capacity, horizon)
+            st.success(f"Moved {len(moved)} revisions.")
+            st.rerun()
 
 elif page == "All Problems":
     st.header("All Problems")
-    df = db.get_all_problems_df()
+    f1, f2, f3 = st.columns([1, 2, 1])
+    difficulty_filter = f1.multiselect("Difficulty", ["Easy", "Medium", "Hard"], key="problems_difficulty")
+    due_only = f3.checkbox("Due only", help=f"Only problems with a revision due by {st.session_state.current_date}")
+    due_by = st.session_state.current_date if due_only else None
+    with f2:
+        tag_filter = pick_tags("problems_tags", difficulties=difficulty_filter, due_by=due_by)
+    df = db.filter_problems(difficulty_filter, tag_filter, due_by)
     st.dataframe(df, use_container_width=True)
     
     st.markdown("---")
     
     # Edit Problem Section
     with st.expander("Edit Problem Details"):
-        if not df.empty:
-            # Select problem to edit
-            edit_options = [f"{row['problem_id']} | {row['title']}" for _, row in df.iterrows()]
-            edit_sel = st.selectbox("Select Problem to Edit", edit_options, key="edit_sel")
-            
-            # Get current data
-            edit_id = edit_sel.split(" | ")[0]
-            current_row = df[df['problem_id'] == edit_id].iloc[0]
+        current_row = pick_problem("Select Problem to Edit", "edit_sel")
+        if current_row is not None:
+            edit_id = current_row['problem_id']
             
             with st.form("edit_problem_form"):
                 new_title = st.text_input("Title", value=current_row['title'] if current_row['title'] else "")
                 new_difficulty = st.selectbox("Difficulty", ["Easy", "Medium", "Hard"], index=["Easy", "Medium", "Hard"].index(current_row['difficulty']) if current_row['difficulty'] in ["Easy", "Medium", "Hard"] else 1)
                 new_tags = st.text_input("Tags", value=current_row['tags'] if current_row['tags'] else "")
                 
-                # Date handling
-                curr_date_val = datetime.date.today()
-                if pd.notna(current_row['date_added']):
-                    try:
-                        curr_date_val = datetime.datetime.strptime(str(current_row['date_added']), '%Y-%m-%d').date()
-                    except:
-                        pass
-                
+                curr_date_val = current_row['date_added'] or datetime.date.today()
                 new_date = st.date_input("Date Added (Changing this resets schedule!)", value=curr_date_val)
                 
                 if st.form_submit_button("Update Problem"):
@@ -341,76 +535,184 @@ elif page == "All Problems":
                         st.rerun()
                     else:
                         st.error("Failed to update problem.")
-        else:
-            st.info("No problems to edit.")
 
     with st.expander("Danger Zone: Delete Problem"):
         st.warning("This will permanently delete the problem, its revision schedule, and history.")
         
-        if not df.empty:
-            # Create a list of "ID | Title" for the selectbox
-            problem_options = [f"{row['problem_id']} | {row['title']}" for _, row in df.iterrows()]
-            selected_option = st.selectbox("Select Problem to Delete", problem_options)
-            
+        selected = pick_problem("Select Problem to Delete", "delete_sel")
+        if selected is not None:
             if st.button("Delete Selected Problem", type="primary"):
-                # Extract problem_id
-                selected_id = selected_option.split(" | ")[0]
+                selected_id = selected['problem_id']
                 if db.delete_problem(selected_id):
                     st.success(f"Deleted problem {selected_id}")
                     time.sleep(1)
                     st.rerun()
                 else:
                     st.error("Failed to delete problem.")
-        else:
-            st.info("No problems to delete.")
 
 elif page == "Analytics":
     st.header("Analytics")
-    stats = db.get_analytics_stats()
+    stats = db.get_analytics_stats(st.session_state.current_date)
     
-    c1, c2 = st.columns(2)
+    c1, c2, c3 = st.columns(3)
     c1.metric("Total Problems", stats['total_problems'])
     c2.metric("Total Solved (Unique)", stats['total_solved'])
+    c3.metric("Total Reviews", stats['total_reviews'])
+    c4, c5, c6, c7 = st.columns(4)
+    c4.metric("Current Streak", f"{stats['current_streak']} days")
+    c5.metric("Longest Streak", f"{stats['longest_streak']} days")
+    c6.metric("Retention", f"{stats['retention']:.0%}" if stats['retention'] is not None else "N/A")
+    c7.metric("Avg. Review Lag", f"{stats['avg_lag_days']:.1f} days" if stats['avg_lag_days'] is not None else "N/A")
+    
+    st.subheader("Last 90 Days")
+    activity = db.get_review_activity(st.session_state.current_date - datetime.timedelta(days=89),
+                                      st.session_state.current_date + datetime.timedelta(days=1))
+    if activity.empty:
+        st.info("No reviews in the last 90 days.")
+    else:
+        st.bar_chart(activity.set_index("day")[["solved", "failed"]])
+    
+    d1, d2 = st.columns(2)
+    with d1:
+        st.subheader("By Difficulty")
+        st.dataframe(db.get_retention_by_difficulty(), use_container_width=True, hide_index=True)
+    with d2:
+        st.subheader("By Tag")
+        st.dataframe(db.get_tag_stats(), use_container_width=True, hide_index=True)
     
-    st.subheader("History")
-    hist_df = db.get_history_df()
-    st.dataframe(hist_df, use_container_width=True)
+    with st.expander("Recent History"):
+        st.dataframe(db.get_recent_history(), use_container_width=True)
 
 elif page == "Settings":
     st.header("Settings")
     
-    current_intervals = db.get_config('intervals')
-    intervals_str = st.text_input("Intervals (JSON list)", value=current_intervals)
+    settings = db.get_settings()
+    intervals_str = st.text_input("Intervals (JSON list)", value=json.dumps(list(settings.intervals)))
     
     if st.button("Save Intervals"):
         try:
-            import json
-            json.loads(intervals_str) # Validate
             db.set_config('intervals', intervals_str)
             st.success("Saved!")
-        except:
-            st.error("Invalid JSON format")
+        except ValueError:
+            st.error("Invalid intervals: expected a JSON list of non-negative whole days")
             
-    fail_behavior = st.selectbox("Fail Behavior", ["short_repeat", "restart"], index=0 if db.get_config('fail_behavior') == 'short_repeat' else 1)
+    fail_behavior = st.selectbox("Fail Behavior", list(db.FAIL_BEHAVIORS), index=db.FAIL_BEHAVIORS.index(settings.fail_behavior))
     if st.button("Save Fail Behavior"):
         db.set_config('fail_behavior', fail_behavior)
         st.success("Saved!")
+    
+    st.markdown("---")
+    st.subheader("Scheduler")
+    st.caption("Fixed uses the intervals above. SM-2 and FSRS adapt each problem's interval to how well you recall it.")
+    scheduler_name = st.selectbox("Scheduler", list(SCHEDULER_LABELS), index=list(SCHEDULER_LABELS.values()).index(settings.scheduler))
+    desired_retention = st.slider("Desired Retention (FSRS)", 0.70, 0.97, settings.desired_retention, 0.01)
+    if st.button("Save Scheduler"):
+        # Switching recomputes every pending due date
+        db.set_configs({'scheduler': SCHEDULER_LABELS[scheduler_name], 'desired_retention': str(desired_retention)})
+        st.success("Saved! Due dates recomputed.")
+    
+    st.markdown("---")
+    st.subheader("Maintenance")
+    if st.button("Rebuild Calendar Counts"):
+        fixed = db.rebuild_daily_load()
+        st.success("Calendar counts were consistent." if fixed == 0 else f"Rebuilt calendar counts ({fixed} days corrected).")
+    if st.button("Rebuild Analytics"):
+        db.rebuild_analytics()
+        st.success("Rebuilt analytics from history.")
+    if st.button("Rebuild Search Index"):
+        db.rebuild_search_index()
+        st.success("Rebuilt the search index.")
+    if st.button("Rebuild Tag Index"):
+        db.rebuild_tag_index()
+        st.success("Rebuilt the tag index.")
+    
+    st.markdown("---")
+    st.subheader("Archive")
+    st.caption(
+        "Completed revisions and history older than this are moved to an archive file once a day, keeping the "
+        "everyday database small. Analytics and exports still include them."
+    )
+    archive_after_days = st.number_input("Archive after (days)", min_value=1, value=settings.archive_after_days, step=30)
+    if st.button("Save Archive Age"):
+        db.set_config('archive_after_days', str(int(archive_after_days)))
+        st.success("Saved!")
+    import pandas as pd
+    if st.button("Archive Now"):
+        result = archive.archive_old()
+        st.success(f"Archived {result['rows']} rows in {result['seconds'] * 1000:.0f} ms"
+                   + (" and compacted the database." if result['compacted'] else "."))
+    st.dataframe(pd.DataFrame([
+        {"Tier": tier.title(), "Revisions": counts['revisions'], "History": counts['history'],
+         "Size (KB)": counts['bytes'] // 1024}
+        for tier, counts in db.get_archive_stats().items()
+    ]), hide_index=True)
 
 elif page == "Export/Backup":
     st.header("Export Data")
     
-    if st.button("Export Problems CSV"):
-        df = db.get_all_problems_df()
-        st.download_button("Download Problems CSV", df.to_csv(index=False), "problems.csv", "text/csv")
-        
-    if st.button("Export Revisions CSV"):
-        df = db.get_revisions_df()
-        st.download_button("Download Revisions CSV", df.to_csv(index=False), "revisions.csv", "text/csv")
-        
-    if st.button("Export History CSV"):
-        df = db.get_history_df()
-        st.download_button("Download History CSV", df.to_csv(index=False), "history.csv", "text/csv")
-        
-    with open(db.DB_FILE, "rb") as f:
-        st.download_button("Download SQLite DB", f, "leetrepeat.db")
+    # Exports are written only when a download is clicked, from a snapshot
+    # of the data at that moment. The download runs outside this script, so
+    # it is given the user's database path.
+    path = db.db_path()
+    export_format = st.radio("Format", export.available_formats(), horizontal=True, format_func=EXPORT_FORMAT_LABELS.get)
+    extension, mime = export.FORMATS[export_format]
+    for table in export.EXPORT_TABLES:
+        st.download_button(
+            f"Download {table.title()}", lambda table=table: export.export_bytes(table, export_format, path),
+            f"{table}{extension}", mime, on_click="ignore",
+        )
+    
+    st.download_button("Download SQLite DB", lambda: export.snapshot_bytes(path), "leetrepeat.db",
+                       "application/vnd.sqlite3", on_click="ignore")
+    
+    st.markdown("---")
+    st.header("Backups")
+    st.caption(
+        f"A backup is taken automatically when the app is used and the last one is over "
+        f"{backup.BACKUP_INTERVAL.total_seconds() / 3600:g} hours old. The {backup.BACKUP_KEEP_LAST} newest are kept, "
+        f"plus the newest of each of the last {backup.BACKUP_KEEP_DAILY} days."
+    )
+    if st.button("Back up now"):
+        taken, stats = backup.take_backup()
+        backup.prune_backups()
+        st.success(f"Saved {taken.name}: {stats['bytes'] / 1e6:.1f} MB in {stats['seconds'] * 1000:.0f} ms "
+                   f"({stats['mb_per_s']:.0f} MB/s).")
+    
+    backups = backup.list_backups()
+    if not backups:
+        st.info("No backups yet.")
+    else:
+        import pandas as pd
+        st.dataframe(pd.DataFrame([
+            {"Backup": b.name, "Taken (UTC)": b.created.strftime("%Y-%m-%d %H:%M:%S"), "Size (KB)": b.size // 1024}
+            for b in backups
+        ]), hide_index=True)
+        chosen = st.selectbox("Backup to restore", [b.name for b in backups])
+        confirm = st.checkbox("Replace my current data with this backup")
+        if st.button("Restore", disabled=not confirm):
+            safety = backup.restore_backup(chosen)
+            st.success(f"Restored {chosen}. The data it replaced was backed up as {safety.name}.")
+
+# Debug panel for ?profile=1, rendered last so it covers the whole run
+def render_profile(profile):
+    import pandas as pd
+    report = profile.to_dict()
+    with st.sidebar.expander("Profiling 🐢"):
+        st.caption(f"Run: {report['total_ms']:.0f} ms · SQL: {report['sql_ms']:.0f} ms in {len(report['statements'])} statements")
+        st.number_input("Slow query threshold (ms)", min_value=0.0, step=10.0, key="slow_query_ms")
+        if report['sections']:
+            st.dataframe(pd.DataFrame(report['sections']), hide_index=True)
+        statements = pd.DataFrame(report['statements'], columns=['sql', 'ms', 'rows', 'thread'])
+        if not statements.empty:
+            by_text = statements.groupby('sql', as_index=False).agg(
+                calls=('ms', 'size'), ms=('ms', 'sum'), rows=('rows', 'sum')
+            ).sort_values('ms', ascending=False)
+            st.dataframe(by_text, hide_index=True)
+        slow = profile.slow_queries()
+        if slow:
+            st.warning(f"{len(slow)} slow queries (≥ {profile.slow_query_ms:g} ms)")
+            st.dataframe(pd.DataFrame(slow), hide_index=True)
+        st.download_button("Export JSON", profile.to_json(), "leetrepeat-profile.json", "application/json")
 
+if st.session_state.profiling:
+    render_profile(profiling.stop())
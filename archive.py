@@ -0,0 +1,66 @@
+import concurrent.futures
+import contextvars
+import datetime
+import logging
+import threading
+import time
+import database as db
+
+# Moves completed revisions and history older than the 'archive_after_days'
+# setting into the archive tier (see db.archive_batch), one batch of
+# db.ARCHIVE_BATCH_ROWS rows per table at a time. Each batch is its own
+# write on the writer thread, so reviews queue behind at most one batch;
+# ARCHIVE_BATCH_PAUSE between batches lets them through. Once a run has
+# moved rows the hot file is compacted if enough of it has been freed.
+
+ARCHIVE_INTERVAL = datetime.timedelta(days=1)
+ARCHIVE_BATCH_PAUSE = 0.01  # seconds between batches
+
+logger = logging.getLogger(__name__)
+
+# Runs in the background on one thread, at most one per database and
+# ARCHIVE_INTERVAL
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-archive")
+_scheduled = set()
+_last_run = {}
+_scheduled_lock = threading.Lock()
+
+def archive_old(today=None, batch_rows=db.ARCHIVE_BATCH_ROWS, pause=ARCHIVE_BATCH_PAUSE):
+    # Archives the current user's rows from before today - archive_after_days;
+    # returns {'rows': rows moved, 'batches', 'seconds', 'compacted'}
+    today = today or datetime.date.today()
+    cutoff = today - datetime.timedelta(days=db.get_settings().archive_after_days)
+    rows = batches = 0
+    start = time.perf_counter()
+    while moved := db.archive_batch(cutoff, batch_rows):
+        rows += moved
+        batches += 1
+        time.sleep(pause)
+    compacted = bool(rows) and db.compact()
+    stats = {'rows': rows, 'batches': batches, 'seconds': time.perf_counter() - start, 'compacted': compacted}
+    if rows:
+        logger.info("archived %d rows of %s from before %s in %d batches (%.3f s)",
+                    rows, db.db_path(), cutoff, batches, stats['seconds'])
+    return stats
+
+def maybe_archive(interval=ARCHIVE_INTERVAL):
+    # Starts a background archive run for the current user's database if
+    # none has run in this process within `interval`; returns its future,
+    # or None
+    path = db.db_path()
+    now = time.monotonic()
+    with _scheduled_lock:
+        last = _last_run.get(path)
+        if path in _scheduled or (last is not None and now - last < interval.total_seconds()):
+            return None
+        _scheduled.add(path)
+        _last_run[path] = now
+
+    def run():
+        try:
+            return archive_old()
+        finally:
+            with _scheduled_lock:
+                _scheduled.discard(path)
+    # The run keeps the caller's user (db.set_current_user)
+    return _executor.submit(contextvars.copy_context().run, run)
@@ -0,0 +1,164 @@
+import collections
+import concurrent.futures
+import datetime
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import database as db
+
+# Snapshot backups of a database file (DB_FILE or a user's shard), kept
+# in a backups/<name>/ directory next to it. A backup copies the database
+# with the online backup API in steps of BACKUP_STEP_PAGES pages; between
+# steps no lock is held, so checkpoints keep the WAL short and writers are
+# never stalled (with WAL they do not wait on readers anyway). A write from
+# another connection mid-backup makes SQLite restart the copy, so each
+# snapshot is still consistent. The archive tier (db.archive_path) is
+# copied the same way right after, into the backup's own archive file: the
+# archive only gains rows before the hot file loses them, so together the
+# two hold every row (restoring drops any held twice, see
+# db.restore_from). Finished snapshots are renamed into place, archive
+# first, and pruned to the BACKUP_KEEP_LAST newest plus the newest of each of the
+# last BACKUP_KEEP_DAILY days.
+
+BACKUP_DIR = "backups"
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_PAUSE = 0.001  # seconds between steps
+BACKUP_INTERVAL = datetime.timedelta(hours=6)
+BACKUP_KEEP_LAST = 5
+BACKUP_KEEP_DAILY = 7
+
+Backup = collections.namedtuple('Backup', 'name path created size')
+_NAME = re.compile(r"(\d{8}T\d{12})Z\.db")
+logger = logging.getLogger(__name__)
+
+# Periodic backups run on one background thread, at most one per database
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-backup")
+_scheduled = set()
+_scheduled_lock = threading.Lock()
+
+def backup_dir(path=None):
+    path = path or db.db_path()
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path) or ".", BACKUP_DIR, name)
+
+def list_backups(path=None):
+    # Newest first
+    directory = backup_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for name in os.listdir(directory):
+        match = _NAME.fullmatch(name)
+        if match:
+            created = datetime.datetime.strptime(match[1], "%Y%m%dT%H%M%S%f").replace(tzinfo=datetime.timezone.utc)
+            file = os.path.join(directory, name)
+            backups.append(Backup(name, file, created, _size(file)))
+    return sorted(backups, key=lambda b: b.created, reverse=True)
+
+def _size(file):
+    # The backup and its archive, if it has one
+    archive = db.archive_path(file)
+    return os.path.getsize(file) + (os.path.getsize(archive) if os.path.exists(archive) else 0)
+
+def take_backup(path=None, pages=BACKUP_STEP_PAGES, pause=BACKUP_STEP_PAUSE):
+    # Snapshots the database now; returns the Backup and the copy's
+    # throughput: {'bytes', 'steps', 'seconds', 'mb_per_s'}
+    path = path or db.db_path()
+    directory = backup_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    created = datetime.datetime.now(datetime.timezone.utc)
+    name = f"{created:%Y%m%dT%H%M%S%f}Z.db"
+    file = os.path.join(directory, name)
+
+    steps = 0
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+        if remaining and pause:
+            time.sleep(pause)
+
+    source = db.get_connection(path)
+    size = seconds = 0
+    partials = []
+    try:
+        for schema, dest in (('main', file), ('archive', db.archive_path(file))):
+            partials.append(dest + ".partial")
+            target = sqlite3.connect(partials[-1])
+            try:
+                start = time.perf_counter()
+                source.backup(target, pages=pages, progress=progress, name=schema)
+                seconds += time.perf_counter() - start
+                size += target.execute(
+                    "SELECT page_count * page_size FROM pragma_page_count(), pragma_page_size()"
+                ).fetchone()[0]
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+    except BaseException:
+        for partial in partials:
+            if os.path.exists(partial):
+                os.remove(partial)
+        raise
+    finally:
+        source.close()
+    # A backup is listed once its hot file is in place, so the archive goes first
+    for partial in reversed(partials):
+        os.replace(partial, partial[:-len(".partial")])
+
+    stats = {'bytes': size, 'steps': steps, 'seconds': seconds, 'mb_per_s': size / 1e6 / max(seconds, 1e-9)}
+    logger.info("backed up %s to %s: %.1f MB in %.3f s (%.1f MB/s)", path, name, size / 1e6, seconds, stats['mb_per_s'])
+    return Backup(name, file, created, _size(file)), stats
+
+def prune_backups(path=None, keep_last=BACKUP_KEEP_LAST, keep_daily=BACKUP_KEEP_DAILY, now=None):
+    # Deletes the backups outside the retention policy; returns them
+    backups = list_backups(path)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    keep = {b.name for b in backups[:keep_last]}
+    days = set()
+    for b in backups:
+        day = b.created.date()
+        if (now.date() - day).days < keep_daily and day not in days:
+            days.add(day)
+            keep.add(b.name)
+    removed = [b for b in backups if b.name not in keep]
+    for b in removed:
+        os.remove(b.path)
+        if os.path.exists(db.archive_path(b.path)):
+            os.remove(db.archive_path(b.path))
+    return removed
+
+def maybe_backup(path=None, interval=BACKUP_INTERVAL):
+    # Starts a background backup (and prune) of `path` if its newest backup
+    # is older than `interval`; returns its future, or None
+    path = path or db.db_path()
+    backups = list_backups(path)
+    if backups and datetime.datetime.now(datetime.timezone.utc) - backups[0].created < interval:
+        return None
+    with _scheduled_lock:
+        if path in _scheduled:
+            return None
+        _scheduled.add(path)
+
+    def run():
+        try:
+            result = take_backup(path)
+            prune_backups(path)
+            return result
+        finally:
+            with _scheduled_lock:
+                _scheduled.discard(path)
+    return _executor.submit(run)
+
+def restore_backup(name):
+    # Restores the current user's backup `name` into place atomically (see
+    # db.restore_from), after backing up the current state so the restore
+    # can itself be undone. Returns that backup.
+    chosen = {b.name: b for b in list_backups()}.get(name)
+    if chosen is None:
+        raise ValueError(f"no such backup: {name!r}")
+    safety, _ = take_backup()
+    db.restore_from(chosen.path)
+    return safety
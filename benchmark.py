@@ -0,0 +1,332 @@
+import argparse
+import datetime
+import inspect
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+import backup
+import database as db
+import export
+
+# Benchmarks for database.py and the app's pages against a synthetic
+# collection. generate() builds the same database for the same arguments;
+# run() times every public database.py function (and, optionally, a render
+# of every page through Streamlit's AppTest) and compare() checks the
+# medians against the baselines stored in BASELINE_FILE.
+#
+#   python benchmark.py --revisions 100000 --pages
+#   python benchmark.py --revisions 100000 --save-baseline
+
+BASELINE_FILE = "benchmark_baselines.json"
+TODAY = datetime.date(2025, 1, 1)  # synthetic history ends here
+DIFFICULTIES = ["Easy", "Medium", "Hard"]
+TAGS = ["array", "string", "hash-table", "dp", "math", "sorting", "greedy", "dfs", "bfs", "tree",
+        "binary-search", "matrix", "two-pointers", "bit-manipulation", "stack", "heap", "graph",
+        "sliding-window", "linked-list", "backtracking"]
+NOTES = ["off by one", "forgot the base case", "use a monotonic stack", "two passes", "prefix sums",
+         "sort first", "union find", "memoize the recursion", "binary search on the answer", "watch overflow"]
+PAGES = ["Today", "Calendar", "Add Problem", "All Problems", "Analytics", "Settings", "Export/Backup"]
+
+# Plumbing that every timed case goes through anyway
+NOT_TIMED = {'transaction', 'cached_read', 'write', 'user_scope', 'close_connections'}
+
+def generate(path, revisions=10_000, years=3, seed=0):
+    # Writes a fresh database at `path` with about `revisions` revision rows:
+    # one problem per ten revisions, each with a multi-year review history
+    # (one done revision and one history row per review) and one pending
+    # revision. Returns the number of problems.
+    for suffix in ("", "-wal", "-shm", "-archive", "-archive-wal", "-archive-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.close_connections()
+    db.DB_FILE = path
+    db.init_db()
+    # The app's daily archive run leaves the synthetic history alone
+    db.set_config('archive_after_days', str(100 * 365))
+
+    rng = np.random.default_rng(seed)
+    n = max(revisions // 10, 1)
+    start = np.datetime64(TODAY, 'D') - 365 * years
+    added = start + rng.integers(0, 365 * years, n).astype('timedelta64[D]')
+
+    # Reviews: gaps of 1-60 days after the problem was added, up to TODAY
+    per_problem = rng.poisson(9, n)
+    owner = np.repeat(np.arange(n), per_problem)
+    gaps = rng.integers(1, 60, len(owner))
+    group_start = np.repeat(np.cumsum(per_problem) - per_problem, per_problem)
+    cumulative = np.cumsum(gaps)
+    offsets = cumulative - (cumulative[group_start] - gaps[group_start])
+    review_dates = added[owner] + offsets.astype('timedelta64[D]')
+    keep = review_dates < np.datetime64(TODAY, 'D')
+    owner, review_dates = owner[keep], review_dates[keep]
+    failed = rng.random(len(owner)) < 0.15
+    quality = np.where(failed, 0, rng.integers(3, 6, len(owner)))
+    lag = rng.integers(0, 4, len(owner))
+    notes = np.where(rng.random(len(owner)) < 0.2, rng.choice(NOTES, len(owner)), None)
+
+    reviews = np.bincount(owner, minlength=n)
+    last_review = np.full(n, np.datetime64('NaT'), dtype='datetime64[D]')
+    last_review[reviews > 0] = review_dates[np.cumsum(reviews)[reviews > 0] - 1]
+    pending_due = np.where(np.isnat(last_review), added + 1,
+                           last_review + rng.integers(1, 30, n).astype('timedelta64[D]'))
+
+    ids = [f"problem-{i:07d}" for i in range(n)]
+    tags = [",".join(rng.choice(TAGS, rng.integers(1, 4), replace=False)) for _ in range(n)]
+    difficulty = rng.choice(DIFFICULTIES, n, p=[0.4, 0.4, 0.2])
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO problems (problem_id, title, difficulty, tags, date_added, anchor_date) VALUES (?, ?, ?, ?, ?, ?)",
+            zip(ids, (f"Problem {i}" for i in range(n)), difficulty.tolist(), tags,
+                added.astype('int64').tolist(), added.astype('int64').tolist())
+        )
+        owner_ids = [ids[i] for i in owner]
+        dates = review_dates.astype('int64').tolist()
+        conn.executemany(
+            "INSERT INTO revisions (problem_id, due_date, status, date_completed, step) VALUES (?, ?, 'done', ?, 0)",
+            zip(owner_ids, (review_dates - lag.astype('timedelta64[D]')).astype('int64').tolist(), dates)
+        )
+        conn.executemany(
+            "INSERT INTO history (problem_id, date, result, quality, lag_days, notes) VALUES (?, ?, ?, ?, ?, ?)",
+            zip(owner_ids, dates, np.where(failed, 'failed', 'solved').tolist(), quality.tolist(), lag.tolist(),
+                notes.tolist())
+        )
+        conn.executemany(
+            "INSERT INTO revisions (problem_id, due_date, status, step) VALUES (?, ?, 'pending', ?)",
+            zip(ids, pending_due.astype('int64').tolist(), np.minimum(reviews, 8).tolist())
+        )
+    db.rebuild_memory_state()
+    return n
+
+class _Rollback(Exception):
+    pass
+
+def _rolled_back(fn):
+    # Runs fn in a transaction that is then rolled back, so every repeat of
+    # a write sees the same data. The write itself runs directly (the
+    # caller holds a transaction), without the writer thread or a commit,
+    # and in a savepoint; rebuilds, which are idempotent, are timed
+    # committed instead.
+    def run():
+        try:
+            with db.transaction():
+                fn()
+                raise _Rollback()
+        except _Rollback:
+            pass
+    return run
+
+def _cold(fn):
+    # Times a read on an empty read cache, i.e. the query itself
+    def run():
+        db._bump_write_generation()
+        fn()
+    return run
+
+def cases():
+    # name -> callable, one or more per public database.py function
+    sample = db.get_due_revisions(TODAY + datetime.timedelta(days=30))[:100]
+    first = sample[0]
+    sample_ids = [r['id'] for r in sample]
+    year = (TODAY, TODAY + datetime.timedelta(days=365))
+    db.connection().execute(
+        "CREATE TEMP TABLE IF NOT EXISTS iso_dates AS SELECT date(due_date * 86400, 'unixepoch') AS due_date FROM revisions"
+    )
+    csv = "problem_id,title,difficulty,tags,date\n" + "".join(
+        f"bench-import-{i},Bench {i},Easy,array,2024-06-01\n" for i in range(1000)
+    )
+    added = iter(range(10**9))
+    snapshot = os.path.join(os.path.dirname(db.db_path()), "snapshot.db")
+    export.snapshot(snapshot)
+
+    def open_close():
+        db.get_connection().close()
+
+    return {
+        'get_connection': open_close,
+        'connection': db.connection,
+        'db_path': db.db_path,
+        'shard_path': lambda: db.shard_path("alice"),
+        'archive_path': db.archive_path,
+        'set_current_user': lambda: db.set_current_user(None),
+        'init_db': db.init_db,
+        'init_db (bootstrap)': db._bootstrap,
+        'get_schema_version': db.get_schema_version,
+        'migrate': db.migrate,
+        'get_settings': db.get_settings,
+        'get_config': lambda: db.get_config('intervals'),
+        'validate_config': lambda: db.validate_config('intervals', '[1, 2, 3, 5, 9, 15, 20, 30, 60]'),
+        'set_config': _rolled_back(lambda: db.set_config('fail_behavior', 'restart')),
+        'set_configs': _rolled_back(lambda: db.set_configs({'scheduler': 'fsrs', 'desired_retention': '0.8'})),
+        'first_due_date': lambda: db.first_due_date(TODAY),
+        'get_scheduler': db.get_scheduler,
+        'add_problem': _rolled_back(lambda: db.add_problem("bench-new", "Bench", "Easy", "array", TODAY)),
+        'bulk_import': _rolled_back(lambda: db.bulk_import(io.StringIO(csv), TODAY)),
+        'get_due_revisions': _cold(lambda: db.get_due_revisions(TODAY)),
+        'get_due_revisions (cached)': lambda: db.get_due_revisions(TODAY),
+        'get_due_page': _cold(lambda: db.get_due_page(TODAY)),
+        'get_due_page (filtered)': _cold(lambda: db.get_due_page(TODAY, mode='overdue', difficulties=["Hard"], tags=["dp"])),
+        'get_due_summary': _cold(lambda: db.get_due_summary(TODAY)),
+        'get_all_problems_df': _cold(db.get_all_problems_df),
+        'filter_problems': _cold(lambda: db.filter_problems(["Hard"], ["graph"], due_by=TODAY)),
+        'get_tag_counts': _cold(db.get_tag_counts),
+        'get_tag_counts (filtered)': _cold(lambda: db.get_tag_counts(["Hard"], ["graph"], due_by=TODAY)),
+        'get_revisions_df': _cold(db.get_revisions_df),
+        'get_history_df': _cold(db.get_history_df),
+        'get_history_df (archived)': _cold(lambda: db.get_history_df(archived=True)),
+        'search_problems': _cold(lambda: db.search_problems("bin sea")),
+        'search_problems (notes)': _cold(lambda: db.search_problems("monotonic")),
+        'search_problems (recent)': _cold(lambda: db.search_problems("")),
+        'mark_revision_done': _rolled_back(lambda: db.mark_revision_done(first['id'], first['problem_id'], TODAY, 4)),
+        'mark_revision_failed': _rolled_back(lambda: db.mark_revision_failed(first['id'], first['problem_id'], TODAY)),
+        'snooze_revision': _rolled_back(lambda: db.snooze_revision(first['id'], 2)),
+        'mark_revisions_done': _rolled_back(lambda: db.mark_revisions_done(sample_ids, TODAY, 4)),
+        'mark_revisions_failed': _rolled_back(lambda: db.mark_revisions_failed(sample_ids, TODAY)),
+        'snooze_revisions': _rolled_back(lambda: db.snooze_revisions(sample_ids, 2)),
+        'rebalance': _cold(lambda: db.rebalance(TODAY, 50, 14, dry_run=True)),
+        'rebalance (apply)': _rolled_back(lambda: db.rebalance(TODAY, 50, 14)),
+        'get_counts_per_day': _cold(lambda: db.get_counts_per_day(TODAY.year, TODAY.month)),
+        'get_load_between': _cold(lambda: db.get_load_between(*year)),
+        'get_daily_load': _cold(lambda: db.get_daily_load(*year)),
+        'rebuild_daily_load': db.rebuild_daily_load,
+        'get_analytics_stats': _cold(lambda: db.get_analytics_stats(TODAY)),
+        'get_review_activity': _cold(lambda: db.get_review_activity(TODAY - datetime.timedelta(days=90), TODAY)),
+        'get_retention_by_difficulty': _cold(db.get_retention_by_difficulty),
+        'get_tag_stats': _cold(db.get_tag_stats),
+        'get_recent_history': _cold(db.get_recent_history),
+        # Reading every revision's due date: stored as ISO text and parsed row
+        # by row, as before day numbers, and as day numbers with the converter
+        'date parsing (ISO text)': lambda: [
+            datetime.datetime.strptime(row[0], '%Y-%m-%d').date()
+            for row in db.connection().execute("SELECT due_date FROM iso_dates")
+        ],
+        'date parsing (day numbers)': lambda: db.connection().execute("SELECT due_date FROM revisions").fetchall(),
+        # The body, without the savepoint reschedule_all() would run in here
+        'reschedule_all': _rolled_back(lambda: db._reschedule(db.connection())),
+        'rebuild_memory_state': db.rebuild_memory_state,
+        'rebuild_analytics': db.rebuild_analytics,
+        'rebuild_search_index': db.rebuild_search_index,
+        'rebuild_tag_index': db.rebuild_tag_index,
+        'archive_batch': _rolled_back(lambda: db.archive_batch(TODAY - datetime.timedelta(days=365))),
+        'get_archive_stats': _cold(db.get_archive_stats),
+        'compact': db.compact,
+        'delete_problem': _rolled_back(lambda: db.delete_problem(first['problem_id'])),
+        'update_problem': _rolled_back(lambda: db.update_problem(first['problem_id'], {
+            'title': "Renamed", 'difficulty': "Hard", 'tags': "dp", 'date_added': TODAY,
+        })),
+        'take_backup': lambda: backup.take_backup(),
+        'restore_from': lambda: db.restore_from(snapshot),
+        # Through the writer thread, committed
+        'submit_write': lambda: db.submit_write(db.get_schema_version).result(),
+        'add_problem (committed)': lambda: db.add_problem(f"bench-{next(added)}", "Bench", "Easy", "array", TODAY),
+    }
+
+def untimed_functions(timed):
+    # Public database.py functions with no case, apart from NOT_TIMED
+    public = {name for name, value in inspect.getmembers(db, inspect.isfunction)
+              if not name.startswith('_') and value.__module__ == db.__name__}
+    covered = {name.split(' ')[0] for name in timed}
+    return sorted(public - covered - NOT_TIMED)
+
+def time_case(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def time_pages(repeat):
+    # Each render is a full script run with the page selected, on a cold
+    # read cache; the app is loaded once beforehand
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("app.py", default_timeout=300)
+    at.session_state['current_date'] = TODAY
+    at.run()
+    results = {}
+    for page in PAGES:
+        def render():
+            db._bump_write_generation()
+            at.sidebar.radio[0].set_value(page).run()
+            if at.exception:
+                raise RuntimeError(f"{page}: {at.exception}")
+        results[f"page: {page}"] = time_case(render, repeat)
+    return results
+
+def run(revisions=10_000, repeat=5, pages=False):
+    # Generates the collection and returns {case name: median seconds}
+    original = db.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            start = time.perf_counter()
+            generate(os.path.join(tmp, "benchmark.db"), revisions)
+            results = {'generate': time.perf_counter() - start}
+            timed = cases()
+            missing = untimed_functions(timed)
+            if missing:
+                print(f"warning: no benchmark for {', '.join(missing)}", file=sys.stderr)
+            for name, fn in timed.items():
+                results[name] = time_case(fn, repeat)
+            if pages:
+                results.update(time_pages(max(repeat // 2, 1)))
+        finally:
+            db.close_connections()
+            db.DB_FILE = original
+    return results
+
+def compare(results, baseline, tolerance=0.25, min_delta=0.002):
+    # Returns [(name, seconds, baseline seconds or None, regressed)]. A case
+    # regresses when it is over `tolerance` slower than its baseline and by
+    # more than min_delta seconds, so noise on sub-millisecond calls is ignored.
+    rows = []
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        regressed = before is not None and seconds > before * (1 + tolerance) and seconds - before > min_delta
+        rows.append((name, seconds, before, regressed))
+    return rows
+
+def load_baselines(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(key, results, path=BASELINE_FILE):
+    baselines = load_baselines(path)
+    baselines[key] = {name: round(seconds, 6) for name, seconds in results.items()}
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark database.py and page renders on synthetic data")
+    parser.add_argument("--revisions", type=int, default=10_000, help="approximate number of revision rows")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case; the median is reported")
+    parser.add_argument("--pages", action="store_true", help="also time full page renders with AppTest")
+    parser.add_argument("--save-baseline", action="store_true", help=f"store these results in {BASELINE_FILE}")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    key = f"revisions={args.revisions}"
+    results = run(args.revisions, args.repeat, args.pages)
+    rows = compare(results, load_baselines().get(key, {}), args.tolerance)
+
+    print(f"{'case':<36}{'median ms':>12}{'baseline ms':>14}{'change':>10}")
+    for name, seconds, before, regressed in rows:
+        change = f"{seconds / before - 1:+.0%}" if before else ""
+        baseline_ms = f"{before * 1000:.2f}" if before is not None else "-"
+        print(f"{name:<36}{seconds * 1000:>12.2f}{baseline_ms:>14}{change:>10}{'  REGRESSION' if regressed else ''}")
+
+    if args.save_baseline:
+        save_baseline(key, results)
+        print(f"saved baseline {key} to {BASELINE_FILE}")
+        return 0
+    return 1 if any(row[3] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import pytest
+import database as db
+import os
+
+# Use a temporary DB for testing
+TEST_DB = "test_leetrepeat.db"
+
+@pytest.fixture
+def setup_db():
+    # Override DB_FILE in database module for testing
+    # This is a bit hacky, better to have a class or pass db path, but for this script it works if we patch it or just swap the variable
+    original_db = db.DB_FILE
+    db.DB_FILE = TEST_DB
+    
+    db.close_connections()
+    for path in (TEST_DB, db.archive_path(TEST_DB)):
+        if os.path.exists(path):
+            os.remove(path)
+        
+    db.init_db()
+    yield
+    
+    db.close_connections()
+    db.DB_FILE = original_db
+    for path in (TEST_DB, db.archive_path(TEST_DB)):
+        if os.path.exists(path):
+            os.remove(path)
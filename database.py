@@ -1,92 +1,1376 @@
 import sqlite3
 import datetime
 import json
-import pandas as pd
+import threading
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import dataclasses
+import functools
+import os
+import re
+import queue
+import sys
+import time
+import numpy as np
+import profiling
+import scheduler
 
 DB_FILE = "leetrepeat.db"
 
-def get_connection():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+# Multi-user hosting: each user gets their own database file (shard) under
+# SHARD_DIR, with the same schema as DB_FILE. set_current_user() routes the
+# calling thread's (or context's) database calls to a shard; with no user
+# they go to DB_FILE. Every shard holds only its user's rows, so per-user
+# queries cost the same however many users there are.
+SHARD_DIR = "users"
+SHARD_POOL_SIZE = 16  # open shard connections kept per thread
+_USER_ID = re.compile(r"[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}")
+_current_user = contextvars.ContextVar('current_user', default=None)
+_ready_shards = set()
+
+# Applied once to every connection when it is opened, after the archive
+# is attached (journal_mode applies to both files).
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # 16 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",  # other processes wait up to 5 s for the write lock
+    "PRAGMA archive.synchronous=NORMAL",
+)
+
+# Dates are stored as day numbers, days since 1970-01-01 (also the epoch
+# of NumPy's datetime64[D]), so date ranges, sorting and date arithmetic
+# are integer operations. datetime.date parameters are adapted to day
+# numbers, and DATE columns read back as datetime.date through the
+# converter (expressions can ask for it with AS "name [DATE]"). Vectorized
+# code selects CAST(column AS INTEGER) instead to get the raw numbers.
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+def _adapt_date(date):
+    return date.toordinal() - _EPOCH_ORDINAL
+
+@functools.lru_cache(maxsize=1 << 16)  # a collection spans a few thousand distinct days
+def _convert_date(value):
+    try:
+        return datetime.date.fromordinal(int(value) + _EPOCH_ORDINAL)
+    except ValueError:
+        # ISO text, as stored before migration 9
+        return datetime.date.fromisoformat(value.decode())
+
+sqlite3.register_adapter(datetime.date, _adapt_date)
+sqlite3.register_converter("DATE", _convert_date)
+
+# Every day a pending revision occupies: the revision itself plus the later
+# steps of its schedule, projected from the problem's anchor_date. {r} and
+# {p} name the revision and problem rows, which come from {source}/{where};
+# projections are only made while {gate} holds. {step_day} is the day of
+# step j: day-number arithmetic, or date() on the ISO text dates stored
+# before migration 9.
+_OCCURRENCES_SQL = """
+    SELECT {r}.due_date AS day, COALESCE({p}.difficulty, '') AS difficulty
+    FROM {source} WHERE {where}
+    UNION ALL
+    SELECT {step_day}, COALESCE({p}.difficulty, '')
+    FROM {source}, json_each((SELECT value FROM config WHERE key = 'intervals')) j
+    WHERE {where} AND {gate} AND j.key > {r}.step AND {step_day} > {r}.due_date
+"""
+
+_STEP_DAY = "{p}.anchor_date + j.value"
+_TEXT_STEP_DAY = "date({p}.anchor_date, '+' || j.value || ' days')"
+
+# Adaptive schedulers have no fixed steps to project
+_FIXED_SCHEDULE_GATE = "COALESCE((SELECT value FROM config WHERE key = 'scheduler'), 'fixed') = 'fixed'"
+
+def _daily_load_delta(sign, r, p, source, where, gate, step_day):
+    occurrences = _OCCURRENCES_SQL.format(r=r, p=p, source=source, where=where, gate=gate,
+                                          step_day=step_day.format(p=p))
+    return f"""
+        INSERT INTO daily_load (day, difficulty, pending)
+        SELECT day, difficulty, {sign} FROM ({occurrences}) WHERE true
+        ON CONFLICT (day, difficulty) DO UPDATE SET pending = pending + excluded.pending;
+    """
+
+# A pending revision's load is added when it appears and removed when it is
+# completed, snoozed (re-added at the new date) or deleted. Changing a
+# problem's anchor or difficulty moves its load. Changing the intervals
+# or scheduler config requires rebuild_daily_load().
+_DAILY_LOAD_TRIGGER_NAMES = (
+    'daily_load_revision_insert', 'daily_load_revision_delete', 'daily_load_revision_update_old',
+    'daily_load_revision_update_new', 'daily_load_problem_update',
+)
+
+def _daily_load_triggers(gate, step_day=_STEP_DAY):
+    return (
+        f"""CREATE TRIGGER daily_load_revision_insert AFTER INSERT ON revisions WHEN NEW.status = 'pending'
+            BEGIN {_daily_load_delta(1, 'NEW', 'p', 'problems AS p', 'p.problem_id = NEW.problem_id', gate, step_day)} END""",
+        f"""CREATE TRIGGER daily_load_revision_delete AFTER DELETE ON revisions WHEN OLD.status = 'pending'
+            BEGIN {_daily_load_delta(-1, 'OLD', 'p', 'problems AS p', 'p.problem_id = OLD.problem_id', gate, step_day)} END""",
+        f"""CREATE TRIGGER daily_load_revision_update_old AFTER UPDATE OF status, due_date, step ON revisions
+            WHEN OLD.status = 'pending'
+            BEGIN {_daily_load_delta(-1, 'OLD', 'p', 'problems AS p', 'p.problem_id = OLD.problem_id', gate, step_day)} END""",
+        f"""CREATE TRIGGER daily_load_revision_update_new AFTER UPDATE OF status, due_date, step ON revisions
+            WHEN NEW.status = 'pending'
+            BEGIN {_daily_load_delta(1, 'NEW', 'p', 'problems AS p', 'p.problem_id = NEW.problem_id', gate, step_day)} END""",
+        f"""CREATE TRIGGER daily_load_problem_update AFTER UPDATE OF anchor_date, difficulty ON problems
+            BEGIN
+            {_daily_load_delta(-1, 'r', 'OLD', 'revisions AS r', "r.problem_id = OLD.problem_id AND r.status = 'pending'", gate, step_day)}
+            {_daily_load_delta(1, 'r', 'NEW', 'revisions AS r', "r.problem_id = NEW.problem_id AND r.status = 'pending'", gate, step_day)}
+            END""",
+    )
+
+def _daily_load_rebuild_sql(gate, step_day=_STEP_DAY):
+    return """
+        SELECT day, difficulty, COUNT(*) AS pending FROM ({occurrences}) GROUP BY day, difficulty
+    """.format(occurrences=_OCCURRENCES_SQL.format(
+        r='r', p='p', source='revisions AS r JOIN problems AS p ON p.problem_id = r.problem_id',
+        where="r.status = 'pending'", gate=gate, step_day=step_day.format(p='p')
+    ))
+
+_DAILY_LOAD_REBUILD_SQL = _daily_load_rebuild_sql(_FIXED_SCHEDULE_GATE)
+
+# Analytics rollups over history: history_daily holds per-day review counts
+# and review lag (days past due), problem_stats the per-problem totals and
+# latest result. Both are updated by triggers as history rows come and go.
+_PROBLEM_STATS_REFRESH = """
+    DELETE FROM problem_stats WHERE problem_id = {problem_id};
+    INSERT INTO problem_stats (problem_id, solved, failed, first_day, last_day, last_result)
+    SELECT problem_id, SUM(result = 'solved'), SUM(result = 'failed'), MIN(date), MAX(date),
+           (SELECT result FROM history WHERE problem_id = {problem_id} ORDER BY date DESC, id DESC LIMIT 1)
+    FROM history WHERE problem_id = {problem_id} GROUP BY problem_id;
+"""
+
+_HISTORY_DAILY_DELTA = """
+    INSERT INTO history_daily (day, solved, failed, lag_sum, lag_count)
+    VALUES ({row}.date, {sign} * ({row}.result = 'solved'), {sign} * ({row}.result = 'failed'),
+            {sign} * COALESCE({row}.lag_days, 0), {sign} * ({row}.lag_days IS NOT NULL))
+    ON CONFLICT (day) DO UPDATE SET
+        solved = solved + excluded.solved,
+        failed = failed + excluded.failed,
+        lag_sum = lag_sum + excluded.lag_sum,
+        lag_count = lag_count + excluded.lag_count;
+"""
+
+# Since migration 10 history no longer holds every review (see
+# archive_batch), so a new review is folded into problem_stats instead of
+# recomputing the row. The rollups keep counting archived reviews: the
+# deletes that move them are gated off by _ARCHIVING. Reviews are otherwise
+# only deleted together with their problem, from both tiers.
+_PROBLEM_STATS_DELTA = """
+    INSERT INTO problem_stats (problem_id, solved, failed, first_day, last_day, last_result)
+    VALUES (NEW.problem_id, NEW.result = 'solved', NEW.result = 'failed', NEW.date, NEW.date, NEW.result)
+    ON CONFLICT (problem_id) DO UPDATE SET
+        solved = solved + excluded.solved,
+        failed = failed + excluded.failed,
+        first_day = MIN(first_day, excluded.first_day),
+        last_day = MAX(last_day, excluded.last_day),
+        last_result = CASE WHEN excluded.last_day >= last_day THEN excluded.last_result ELSE last_result END;
+"""
+
+# Set (as a config row) for the duration of an archive_batch() delete
+_ARCHIVING = "EXISTS (SELECT 1 FROM config WHERE key = 'archiving')"
+
+_ANALYTICS_TRIGGER_NAMES = ('analytics_history_insert', 'analytics_history_delete')
+
+def _analytics_triggers(tiered=True):
+    # tiered=False gives the triggers as migration 5 created them
+    stats_insert = _PROBLEM_STATS_DELTA if tiered else _PROBLEM_STATS_REFRESH.format(problem_id='NEW.problem_id')
+    return (
+        f"""CREATE TRIGGER analytics_history_insert AFTER INSERT ON history
+            BEGIN
+            {_HISTORY_DAILY_DELTA.format(row='NEW', sign=1)}
+            {stats_insert}
+            END""",
+        f"""CREATE TRIGGER analytics_history_delete AFTER DELETE ON history
+            {f'WHEN NOT {_ARCHIVING}' if tiered else ''}
+            BEGIN
+            {_HISTORY_DAILY_DELTA.format(row='OLD', sign=-1)}
+            DELETE FROM history_daily WHERE day = OLD.date AND solved = 0 AND failed = 0;
+            {_PROBLEM_STATS_REFRESH.format(problem_id='OLD.problem_id')}
+            END""",
+    )
+
+def _analytics_rebuild(history):
+    # Recomputes both rollups from the `history` table or view
+    return (
+        "DELETE FROM history_daily",
+        f"""INSERT INTO history_daily (day, solved, failed, lag_sum, lag_count)
+            SELECT date, SUM(result = 'solved'), SUM(result = 'failed'), COALESCE(SUM(lag_days), 0), COUNT(lag_days)
+            FROM {history} GROUP BY date""",
+        "DELETE FROM problem_stats",
+        f"""INSERT INTO problem_stats (problem_id, solved, failed, first_day, last_day, last_result)
+            SELECT problem_id, solved, failed, first_day, last_day, last_result FROM (
+                SELECT problem_id,
+                       SUM(result = 'solved') OVER w AS solved,
+                       SUM(result = 'failed') OVER w AS failed,
+                       MIN(date) OVER w AS first_day,
+                       MAX(date) OVER w AS last_day,
+                       result AS last_result,
+                       ROW_NUMBER() OVER (PARTITION BY problem_id ORDER BY date DESC, id DESC) AS rn
+                FROM {history}
+                WINDOW w AS (PARTITION BY problem_id)
+            ) WHERE rn = 1""",
+    )
+
+# As the migrations ran it, over the hot history alone
+_ANALYTICS_REBUILD = _analytics_rebuild("history")
+
+# Full-text search over problems: one problem_search (FTS5) row per
+# problem with its id, title, tags and the notes of its revisions and
+# history. search_docs gives each problem a stable integer docid (the FTS
+# rowid), since problems' own rowids may change on VACUUM. Triggers keep
+# the index in step with the three tables.
+_SEARCH_NOTES = """
+    (SELECT group_concat(notes, ' ') FROM (
+        SELECT notes FROM revisions WHERE problem_id = {problem_id} AND notes <> ''
+        UNION SELECT notes FROM history WHERE problem_id = {problem_id} AND notes <> ''
+    ))
+"""
+
+_SEARCH_DOC = "(SELECT doc FROM search_docs WHERE problem_id = {problem_id})"
+
+_SEARCH_NOTES_REFRESH = f"""
+    UPDATE problem_search SET notes = {_SEARCH_NOTES}
+    WHERE rowid = {_SEARCH_DOC};
+"""
+
+_SEARCH_TRIGGERS = (
+    f"""CREATE TRIGGER search_problem_insert AFTER INSERT ON problems
+        BEGIN
+        INSERT INTO search_docs (problem_id) VALUES (NEW.problem_id);
+        INSERT INTO problem_search (rowid, problem_id, title, tags, notes)
+        VALUES ({_SEARCH_DOC.format(problem_id='NEW.problem_id')}, NEW.problem_id, NEW.title, NEW.tags, NULL);
+        END""",
+    f"""CREATE TRIGGER search_problem_update AFTER UPDATE OF title, tags ON problems
+        BEGIN
+        UPDATE problem_search SET title = NEW.title, tags = NEW.tags
+        WHERE rowid = {_SEARCH_DOC.format(problem_id='NEW.problem_id')};
+        END""",
+    f"""CREATE TRIGGER search_problem_delete AFTER DELETE ON problems
+        BEGIN
+        DELETE FROM problem_search WHERE rowid = {_SEARCH_DOC.format(problem_id='OLD.problem_id')};
+        DELETE FROM search_docs WHERE problem_id = OLD.problem_id;
+        END""",
+    *(
+        trigger
+        for table in ("revisions", "history")
+        for trigger in (
+            f"""CREATE TRIGGER search_{table}_notes_insert AFTER INSERT ON {table}
+                WHEN NEW.notes <> ''
+                BEGIN {_SEARCH_NOTES_REFRESH.format(problem_id='NEW.problem_id')} END""",
+            f"""CREATE TRIGGER search_{table}_notes_update AFTER UPDATE OF notes ON {table}
+                WHEN NEW.notes IS NOT OLD.notes
+                BEGIN {_SEARCH_NOTES_REFRESH.format(problem_id='NEW.problem_id')} END""",
+            f"""CREATE TRIGGER search_{table}_notes_delete AFTER DELETE ON {table}
+                WHEN OLD.notes <> ''
+                BEGIN {_SEARCH_NOTES_REFRESH.format(problem_id='OLD.problem_id')} END""",
+        )
+    ),
+)
+
+_SEARCH_REBUILD = (
+    "DELETE FROM problem_search",
+    "DELETE FROM search_docs",
+    "INSERT INTO search_docs (problem_id) SELECT problem_id FROM problems",
+    f"""INSERT INTO problem_search (rowid, problem_id, title, tags, notes)
+        SELECT d.doc, p.problem_id, p.title, p.tags, {_SEARCH_NOTES.format(problem_id='p.problem_id')}
+        FROM problems AS p JOIN search_docs AS d ON d.problem_id = p.problem_id""",
+)
+
+# Normalized tags: one tags row per distinct tag (compared case-
+# insensitively, first spelling kept) and one problem_tags row per tag of
+# a problem, parsed from the comma-separated problems.tags. Triggers keep
+# them in step with problems, so add_problem, update_problem and
+# bulk_import all maintain them; a tag with no problems left is dropped.
+# problem_tags is keyed both ways for filtering by problem and by tag.
+_TAG_SPLIT = """json_each('[' || REPLACE(json_quote(COALESCE({tags}, '')), ',', '","') || ']')"""
+
+_TAG_NAMES = f"""
+    SELECT DISTINCT TRIM(j.value) AS name FROM {_TAG_SPLIT} AS j WHERE TRIM(j.value) <> ''
+"""
+
+_TAG_LINKS = """
+    INSERT OR IGNORE INTO tags (name) SELECT name FROM ({names});
+    INSERT OR IGNORE INTO problem_tags (problem_id, tag_id)
+    SELECT {problem_id}, t.id FROM ({names}) AS n JOIN tags AS t ON t.name = n.name;
+"""
+
+_TAG_UNLINK = """
+    DELETE FROM problem_tags WHERE problem_id = {problem_id};
+    DELETE FROM tags WHERE name IN ({names})
+        AND NOT EXISTS (SELECT 1 FROM problem_tags WHERE tag_id = tags.id);
+"""
+
+_TAG_TRIGGERS = (
+    f"""CREATE TRIGGER tags_problem_insert AFTER INSERT ON problems
+        BEGIN {_TAG_LINKS.format(problem_id='NEW.problem_id', names=_TAG_NAMES.format(tags='NEW.tags'))} END""",
+    f"""CREATE TRIGGER tags_problem_update AFTER UPDATE OF tags ON problems
+        WHEN NEW.tags IS NOT OLD.tags
+        BEGIN
+        {_TAG_UNLINK.format(problem_id='OLD.problem_id', names=_TAG_NAMES.format(tags='OLD.tags'))}
+        {_TAG_LINKS.format(problem_id='NEW.problem_id', names=_TAG_NAMES.format(tags='NEW.tags'))}
+        END""",
+    f"""CREATE TRIGGER tags_problem_delete AFTER DELETE ON problems
+        BEGIN {_TAG_UNLINK.format(problem_id='OLD.problem_id', names=_TAG_NAMES.format(tags='OLD.tags'))} END""",
+)
+
+_TAG_REBUILD = (
+    "DELETE FROM problem_tags",
+    "DELETE FROM tags",
+    f"""INSERT OR IGNORE INTO tags (name)
+        SELECT TRIM(j.value) FROM problems AS p, {_TAG_SPLIT.format(tags='p.tags')} AS j
+        WHERE TRIM(j.value) <> ''""",
+    f"""INSERT OR IGNORE INTO problem_tags (problem_id, tag_id)
+        SELECT p.problem_id, t.id FROM problems AS p, {_TAG_SPLIT.format(tags='p.tags')} AS j
+        JOIN tags AS t ON t.name = TRIM(j.value)""",
+)
+
+# Archival tier. Completed revisions and history older than the
+# 'archive_after_days' setting are moved out of the hot database into its
+# archive, a second file next to it (archive_path()) that every connection
+# attaches as `archive`. The app's queries only read the hot tables, so
+# they (and the file the page cache has to hold) stay the size of the
+# recent data; the daily_load, history_daily and problem_stats rollups
+# stay hot and keep counting archived rows. The temp views all_revisions
+# and all_history put both tiers back together, archived rows first, for
+# exports and rebuilds that need the full history. Search keeps finding
+# archived notes: problem_search holds them in its archived_notes column,
+# refreshed whenever rows move in or out of the archive.
+_ARCHIVE_TABLES = {
+    'revisions': (('id', 'INTEGER PRIMARY KEY'), ('problem_id', 'TEXT'), ('due_date', 'DATE'), ('status', 'TEXT'),
+                  ('date_completed', 'DATE'), ('notes', 'TEXT'), ('step', 'INTEGER')),
+    'history': (('id', 'INTEGER PRIMARY KEY'), ('problem_id', 'TEXT'), ('date', 'DATE'), ('result', 'TEXT'),
+                ('quality', 'INTEGER'), ('notes', 'TEXT'), ('lag_days', 'INTEGER')),
+}
+ARCHIVED_TABLES = tuple(_ARCHIVE_TABLES)
+
+# The rows of each table that are archived, given the :cutoff day
+_ARCHIVE_WHERE = {
+    'revisions': "status IN ('done', 'skipped') AND due_date < :cutoff AND COALESCE(date_completed, due_date) < :cutoff",
+    'history': "date < :cutoff",
+}
+
+_ARCHIVE_SCHEMA = (
+    *(
+        f"CREATE TABLE IF NOT EXISTS archive.{table} ({', '.join(f'{name} {type_}' for name, type_ in columns)})"
+        for table, columns in _ARCHIVE_TABLES.items()
+    ),
+    "CREATE INDEX IF NOT EXISTS archive.idx_revisions_problem ON revisions(problem_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_history_problem ON history(problem_id)",
+)
+
+# The notes of a problem's archived rows, and the statement refreshing
+# them for the problems in :problem_ids (a JSON list), or all problems
+_SEARCH_ARCHIVED_NOTES = """
+    (SELECT group_concat(notes, ' ') FROM (
+        SELECT notes FROM archive.revisions WHERE problem_id = {problem_id} AND notes <> ''
+        UNION SELECT notes FROM archive.history WHERE problem_id = {problem_id} AND notes <> ''
+    ))
+"""
+
+def _search_archived_notes_refresh(all_problems=False):
+    where = "" if all_problems else (
+        "WHERE rowid IN (SELECT doc FROM search_docs WHERE problem_id IN (SELECT value FROM json_each(:problem_ids)))"
+    )
+    return (f"UPDATE problem_search SET archived_notes = "
+            f"{_SEARCH_ARCHIVED_NOTES.format(problem_id='problem_search.problem_id')} {where}")
+
+_ARCHIVE_VIEWS = tuple(
+    f"""CREATE TEMP VIEW all_{table} AS
+        SELECT {', '.join(name for name, _ in columns)} FROM archive.{table}
+        UNION ALL SELECT {', '.join(name for name, _ in columns)} FROM main.{table}"""
+    for table, columns in _ARCHIVE_TABLES.items()
+)
+
+# The analytics triggers only see the hot history, so delete_problem()
+# takes the problem's archived reviews out of history_daily itself
+_ARCHIVED_HISTORY_DAILY_REMOVE = (
+    """INSERT INTO history_daily (day, solved, failed, lag_sum, lag_count)
+       SELECT date, -SUM(result = 'solved'), -SUM(result = 'failed'), -COALESCE(SUM(lag_days), 0), -COUNT(lag_days)
+       FROM archive.history WHERE problem_id = :problem_id GROUP BY date
+       ON CONFLICT (day) DO UPDATE SET
+           solved = solved + excluded.solved,
+           failed = failed + excluded.failed,
+           lag_sum = lag_sum + excluded.lag_sum,
+           lag_count = lag_count + excluded.lag_count""",
+    """DELETE FROM history_daily WHERE solved = 0 AND failed = 0
+       AND day IN (SELECT date FROM archive.history WHERE problem_id = :problem_id)""",
+)
+
+# Numbered schema migrations applied by init_db() on top of db_schema.sql.
+# Each is a sequence of SQL statements or callables taking the connection.
+# The schedules stored before migration 3: every step a pending row dated
+# anchor + intervals[step], counted from date_added or, after a restart,
+# from the failure. A short_repeat failure added one more row, 2 days
+# later, and snoozing moved rows off their days. current holds each
+# problem's latest run still in progress (a restart's whole run was
+# written at once, so its final step is still pending), the first of its
+# steps still pending and that step's due date.
+_LEGACY_SCHEDULE = """
+    WITH intervals_config (value) AS (SELECT value FROM config WHERE key = 'intervals'),
+    intervals AS (SELECT key, value FROM json_each((SELECT value FROM intervals_config))),
+    anchors (problem_id, anchor, added) AS (
+        SELECT problem_id, date_added, 1 FROM problems
+        UNION SELECT problem_id, date, 0 FROM history WHERE result = 'failed'
+    ),
+    runs AS (
+        SELECT a.* FROM anchors AS a
+        WHERE a.added OR EXISTS (
+            SELECT 1 FROM revisions AS r WHERE r.problem_id = a.problem_id AND r.status = 'pending'
+            AND r.due_date = date(a.anchor, '+' || (SELECT value FROM intervals ORDER BY key DESC LIMIT 1) || ' days')
+        )
+    ),
+    current AS (
+        SELECT problem_id, anchor, step, due FROM (
+            SELECT a.problem_id, a.anchor, j.key AS step, r.due_date AS due,
+                   ROW_NUMBER() OVER (PARTITION BY a.problem_id ORDER BY a.anchor DESC, j.key) AS rn
+            FROM runs AS a
+            JOIN revisions AS r ON r.problem_id = a.problem_id AND r.status = 'pending'
+            JOIN intervals AS j ON r.due_date = date(a.anchor, '+' || j.value || ' days')
+                OR (j.key = 0 AND a.added AND r.due_date = a.anchor)
+        ) WHERE rn = 1
+    )
+"""
+
+# PRAGMA user_version records how many have been applied; append new
+# migrations to the end and never edit one that has shipped.
+MIGRATIONS = [
+    # 1: due queue, calendar counts and per-problem revision lookups
+    (
+        "CREATE INDEX IF NOT EXISTS idx_revisions_status_due ON revisions(status, due_date)",
+        "CREATE INDEX IF NOT EXISTS idx_revisions_problem ON revisions(problem_id)",
+    ),
+    # 2: solved counts and per-problem history lookups
+    (
+        "CREATE INDEX IF NOT EXISTS idx_history_problem ON history(problem_id, result, date)",
+        "CREATE INDEX IF NOT EXISTS idx_history_result ON history(result, problem_id)",
+    ),
+    # 3: lazy schedules. A problem keeps exactly one pending revision, tagged
+    # with the interval step it stands for; later steps are projected from
+    # problems.anchor_date (the day the intervals count from) on demand.
+    (
+        "ALTER TABLE problems ADD COLUMN anchor_date DATE",
+        "ALTER TABLE revisions ADD COLUMN step INTEGER NOT NULL DEFAULT 0",
+        _LEGACY_SCHEDULE + """
+            UPDATE problems SET anchor_date = COALESCE(
+                (SELECT anchor FROM current WHERE current.problem_id = problems.problem_id), date_added
+            )""",
+        _LEGACY_SCHEDULE + """
+            UPDATE revisions SET step = COALESCE(
+                (SELECT CASE WHEN revisions.due_date = current.due THEN current.step ELSE MAX(current.step - 1, 0) END
+                 FROM current WHERE current.problem_id = revisions.problem_id),
+                MAX(json_array_length((SELECT value FROM intervals_config)) - (
+                    SELECT COUNT(*) FROM revisions AS r WHERE r.problem_id = revisions.problem_id AND r.status = 'pending'
+                ), 0)
+            ) WHERE status = 'pending'""",
+        """DELETE FROM revisions WHERE id IN (
+               SELECT id FROM (
+                   SELECT id, ROW_NUMBER() OVER (PARTITION BY problem_id ORDER BY due_date, id) AS rn
+                   FROM revisions WHERE status = 'pending'
+               ) WHERE rn > 1
+           )""",
+        "CREATE UNIQUE INDEX idx_revisions_one_pending ON revisions(problem_id) WHERE status = 'pending'",
+    ),
+    # 4: daily_load rollup of pending revisions per day and difficulty,
+    # projected schedule steps included, kept current by triggers
+    (
+        """CREATE TABLE daily_load (
+               day DATE NOT NULL,
+               difficulty TEXT NOT NULL,
+               pending INTEGER NOT NULL,
+               PRIMARY KEY (day, difficulty)
+           ) WITHOUT ROWID""",
+        *_daily_load_triggers("true", _TEXT_STEP_DAY),
+        "INSERT INTO daily_load (day, difficulty, pending) " + _daily_load_rebuild_sql("true", _TEXT_STEP_DAY),
+    ),
+    # 5: analytics rollups; history rows now also record how many days
+    # after the due date the review happened
+    (
+        "ALTER TABLE history ADD COLUMN lag_days INTEGER",
+        """CREATE TABLE history_daily (
+               day DATE PRIMARY KEY,
+               solved INTEGER NOT NULL,
+               failed INTEGER NOT NULL,
+               lag_sum INTEGER NOT NULL,
+               lag_count INTEGER NOT NULL
+           ) WITHOUT ROWID""",
+        """CREATE TABLE problem_stats (
+               problem_id TEXT PRIMARY KEY,
+               solved INTEGER NOT NULL,
+               failed INTEGER NOT NULL,
+               first_day DATE,
+               last_day DATE,
+               last_result TEXT
+           ) WITHOUT ROWID""",
+        *_analytics_triggers(tiered=False),
+        *_ANALYTICS_REBUILD,
+    ),
+    # 6: adaptive scheduling. Problems carry their SM-2 (ease, interval_days,
+    # reps) and FSRS (stability, memory_difficulty) memory state, replayed
+    # from history; daily_load only projects steps under the fixed scheduler.
+    (
+        "ALTER TABLE problems ADD COLUMN ease REAL NOT NULL DEFAULT 2.5",
+        "ALTER TABLE problems ADD COLUMN interval_days REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE problems ADD COLUMN reps INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE problems ADD COLUMN stability REAL",
+        "ALTER TABLE problems ADD COLUMN memory_difficulty REAL",
+        "ALTER TABLE problems ADD COLUMN last_review DATE",
+        *(f"DROP TRIGGER {name}" for name in _DAILY_LOAD_TRIGGER_NAMES),
+        *_daily_load_triggers(_FIXED_SCHEDULE_GATE, _TEXT_STEP_DAY),
+        lambda conn: rebuild_memory_state(),
+    ),
+    # 7: full-text search. Prefix indexes serve search-as-you-type, and
+    # matches in titles and ids rank above tags, then notes.
+    (
+        "CREATE TABLE search_docs (doc INTEGER PRIMARY KEY, problem_id TEXT NOT NULL UNIQUE)",
+        """CREATE VIRTUAL TABLE problem_search USING fts5(
+               problem_id, title, tags, notes,
+               tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+           )""",
+        "INSERT INTO problem_search (problem_search, rank) VALUES ('rank', 'bm25(4.0, 4.0, 2.0, 1.0)')",
+        *_SEARCH_TRIGGERS,
+        *_SEARCH_REBUILD,
+    ),
+    # 8: normalized tags for faceted filtering and per-tag counts
+    (
+        "CREATE TABLE tags (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE COLLATE NOCASE)",
+        """CREATE TABLE problem_tags (
+               problem_id TEXT NOT NULL,
+               tag_id INTEGER NOT NULL,
+               PRIMARY KEY (problem_id, tag_id)
+           ) WITHOUT ROWID""",
+        "CREATE INDEX idx_problem_tags_tag ON problem_tags(tag_id, problem_id)",
+        *_TAG_TRIGGERS,
+        *_TAG_REBUILD,
+    ),
+    # 9: dates as day numbers (see _adapt_date). The daily_load triggers are
+    # dropped while the columns are rewritten, and the rollups and memory
+    # state (computed from day numbers since) are rebuilt afterwards.
+    (
+        *(f"DROP TRIGGER {name}" for name in _DAILY_LOAD_TRIGGER_NAMES),
+        *(
+            f"""UPDATE {table} SET {column} = CAST(julianday({column}) - 2440587.5 AS INTEGER)
+                WHERE typeof({column}) = 'text' AND julianday({column}) IS NOT NULL"""
+            for table, columns in (
+                ("problems", ("date_added", "anchor_date", "last_review")),
+                ("revisions", ("due_date", "date_completed")),
+                ("history", ("date",)),
+            )
+            for column in columns
+        ),
+        *_daily_load_triggers(_FIXED_SCHEDULE_GATE),
+        "DELETE FROM daily_load",
+        "INSERT INTO daily_load (day, difficulty, pending) " + _DAILY_LOAD_REBUILD_SQL,
+        *_ANALYTICS_REBUILD,
+        lambda conn: rebuild_memory_state(),
+    ),
+    # 10: archival tier (see _ARCHIVE_TABLES). Old history is found by
+    # date, and the analytics triggers no longer need all of history.
+    (
+        "CREATE INDEX idx_history_date ON history(date)",
+        *(f"DROP TRIGGER {name}" for name in _ANALYTICS_TRIGGER_NAMES),
+        *_analytics_triggers(),
+    ),
+    # 11: archived notes stay searchable, ranked like the hot ones
+    (
+        "DROP TABLE problem_search",
+        """CREATE VIRTUAL TABLE problem_search USING fts5(
+               problem_id, title, tags, notes, archived_notes,
+               tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+           )""",
+        "INSERT INTO problem_search (problem_search, rank) VALUES ('rank', 'bm25(4.0, 4.0, 2.0, 1.0, 1.0)')",
+        *_SEARCH_REBUILD,
+        _search_archived_notes_refresh(all_problems=True),
+    ),
+]
+
+DAY1_BEHAVIORS = ('next_day', 'same_day')
+FAIL_BEHAVIORS = ('short_repeat', 'restart')
+
+DEFAULT_CONFIG = {
+    'intervals': json.dumps([1, 2, 3, 5, 9, 15, 20, 30, 60]),
+    'day1_behavior': 'next_day',
+    'fail_behavior': 'short_repeat',
+    'scheduler': 'fixed',
+    'desired_retention': '0.9',
+    'archive_after_days': '365',
+}
+
+# Parsed view of the config table. Cached in-process and invalidated by
+# the 'generation' config row, which every set_config() bumps, so other
+# sessions and processes notice a change with a single lookup.
+@dataclasses.dataclass(frozen=True)
+class Settings:
+    intervals: tuple
+    day1_behavior: str
+    fail_behavior: str
+    scheduler: str
+    desired_retention: float
+    archive_after_days: int
+
+_config_cache = {}
+
+# Results of the read functions below, shared by every session in this
+# process and keyed by database file. A commit bumps that file's entry in
+# _shard_generations and drops its cached results (close_connections()
+# bumps _write_generation, dropping everything); entries are also evicted least recently
+# used once the cache holds more than READ_CACHE_MAX_ENTRIES results or
+# roughly READ_CACHE_MAX_BYTES. Cached results are shared, so callers must
+# treat them as read-only. Commits from other processes are caught by the
+# 'data_generation' config row: every commit sets it to a new random
+# token, and a cached result is only used while the token it was read
+# under is current.
+READ_CACHE_MAX_ENTRIES = 256
+READ_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_read_cache = collections.OrderedDict()
+_read_cache_bytes = 0
+_read_cache_lock = threading.Lock()
+_write_generation = 0
+_shard_generations = {}
+
+# Per-thread connection pool, one connection per database file, the least
+# recently used closed once a thread holds more than SHARD_POOL_SIZE. Every
+# pooled connection is also kept in _pool so close_connections() can close
+# them from any thread; bumping _pool_generation makes each thread reopen
+# on its next call. Streamlit runs every rerun on a new thread, so a
+# thread's connections are also closed when it exits and its _local goes
+# with it (see _ThreadConnections).
+_local = threading.local()
+_pool = set()
+_pool_lock = threading.RLock()
+_pool_generation = 0
+
+def shard_path(user_id):
+    if not isinstance(user_id, str) or not _USER_ID.fullmatch(user_id):
+        raise ValueError(f"invalid user id: {user_id!r}")
+    return os.path.join(SHARD_DIR, f"{user_id}.db")
+
+def archive_path(path=None):
+    # The archive of the database file `path` (the current user's by default)
+    return (path or db_path()) + "-archive"
+
+def db_path():
+    # The database file the current user's calls go to
+    user_id = _current_user.get()
+    return DB_FILE if user_id is None else shard_path(user_id)
+
+def set_current_user(user_id):
+    # Routes this thread's (or context's) calls to user_id's shard, creating
+    # and migrating it on first use; None routes back to DB_FILE. Returns
+    # the token for _current_user.reset().
+    path = DB_FILE if user_id is None else shard_path(user_id)
+    token = _current_user.set(user_id)
+    if user_id is not None and path not in _ready_shards:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        init_db()
+        _ready_shards.add(path)
+    return token
+
+@contextlib.contextmanager
+def user_scope(user_id):
+    token = set_current_user(user_id)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+class _ProfiledCursor(sqlite3.Cursor):
+    # Records each statement in the bound profile (see profiling.py); its
+    # fetches then add their time and rows to the same entry
+    _entry = None
+
+    def _run(self, method, sql, *args):
+        profile = profiling.current.get()
+        if profile is None:
+            self._entry = None
+            return method(sql, *args)
+        start = time.perf_counter()
+        try:
+            method(sql, *args)
+        finally:
+            self._entry = profile.statement(sql, time.perf_counter() - start, max(self.rowcount, 0))
+        return self
+
+    def _fetch(self, method, *args):
+        if self._entry is None:
+            return method(*args)
+        start = time.perf_counter()
+        result = method(*args)
+        self._entry[1] += time.perf_counter() - start
+        if isinstance(result, list):
+            self._entry[2] += len(result)
+        elif result is not None:
+            self._entry[2] += 1
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._run(super().executescript, sql_script)
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        row = self._fetch(super().fetchone)
+        if row is None:
+            raise StopIteration
+        return row
+
+class _Connection(sqlite3.Connection):
+    # Hands out profiled cursors while a profile is bound; otherwise plain
+    # sqlite3 cursors, so an unprofiled run pays one context variable lookup
+    # per statement
+    def cursor(self, factory=sqlite3.Cursor):
+        if factory is sqlite3.Cursor and profiling.current.get() is not None:
+            factory = _ProfiledCursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if profiling.current.get() is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if profiling.current.get() is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        if profiling.current.get() is None:
+            return super().executescript(sql_script)
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        self._timed("COMMIT", super().commit)
+
+    def rollback(self):
+        self._timed("ROLLBACK", super().rollback)
+
+    def _timed(self, sql, method):
+        profile = profiling.current.get()
+        if profile is None:
+            return method()
+        start = time.perf_counter()
+        try:
+            method()
+        finally:
+            profile.statement(sql, time.perf_counter() - start, 0)
+
+def get_connection(path=None):
+    # Opens a new, fully configured connection to `path` (the current
+    # user's database by default). The app's own queries go through
+    # connection()/transaction() instead, which reuse one per thread.
+    path = path or db_path()
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, factory=_Connection,
+                           detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
     conn.row_factory = sqlite3.Row
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(path),))
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    for view in _ARCHIVE_VIEWS:
+        conn.execute(view)
+    return conn
+
+class _ThreadConnections(collections.OrderedDict):
+    # One thread's pooled connections. Only its _local refers to it, so it
+    # is dropped (and its connections closed) as soon as the thread exits;
+    # the connections themselves would wait for the cyclic GC.
+    def __del__(self):
+        with _pool_lock:
+            for conn in self.values():
+                _pool.discard(conn)
+                conn.close()
+
+def connection():
+    path = db_path()
+    conns = getattr(_local, 'conns', None)
+    if conns is None or _local.generation != _pool_generation:
+        conns = _local.conns = _ThreadConnections()
+        _local.generation = _pool_generation
+    conn = conns.get(path)
+    if conn is not None:
+        conns.move_to_end(path)
+        return conn
+
+    conn = conns[path] = get_connection(path)
+    with _pool_lock:
+        _pool.add(conn)
+    # Close the least recently used shards, skipping any mid-transaction
+    for idle_path, idle in list(conns.items()):
+        if len(conns) <= SHARD_POOL_SIZE:
+            break
+        if idle is not conn and not idle.in_transaction:
+            del conns[idle_path]
+            with _pool_lock:
+                _pool.discard(idle)
+            idle.close()
     return conn
 
+@contextlib.contextmanager
+def transaction():
+    # Joins the caller's transaction if there is one (as a savepoint, so a
+    # failing inner block only undoes its own work), otherwise starts one.
+    conn = connection()
+    path = db_path()
+    if conn.in_transaction:
+        conn.execute("SAVEPOINT nested")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO nested")
+            conn.execute("RELEASE nested")
+            raise
+        conn.execute("RELEASE nested")
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute(
+            "INSERT INTO config (key, value) VALUES ('data_generation', lower(hex(randomblob(8)))) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+        )
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    _bump_write_generation(path)
+
+def _bump_write_generation(path=None):
+    # Drops the cached reads of `path`, or of every database
+    global _write_generation, _read_cache_bytes
+    with _read_cache_lock:
+        if path is None:
+            _write_generation += 1
+            _read_cache.clear()
+            _read_cache_bytes = 0
+            return
+        _shard_generations[path] = _shard_generations.get(path, 0) + 1
+        for key in [key for key in _read_cache if key[0] == path]:
+            _read_cache_bytes -= _read_cache.pop(key)[1]
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+def _result_size(result):
+    pd = sys.modules.get('pandas')  # no DataFrame without it
+    if pd is not None and isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, (list, tuple, dict)):
+        # sqlite3.Row and small dicts; a rough per-item estimate is enough
+        return sys.getsizeof(result) + 256 * len(result)
+    return sys.getsizeof(result)
+
+def cached_read(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        global _read_cache_bytes
+        # Inside a transaction the caller may see its own uncommitted writes
+        conn = connection()
+        if conn.in_transaction:
+            return fn(*args, **kwargs)
+        
+        path = db_path()
+        key = (path, fn.__name__, _freeze(args), _freeze(kwargs))
+        # A plain cursor: the lookup is cache plumbing, not part of a profile
+        row = sqlite3.Cursor(conn).execute("SELECT value FROM config WHERE key = 'data_generation'").fetchone()
+        token = row[0] if row else None
+        with _read_cache_lock:
+            generation = (_write_generation, _shard_generations.get(path, 0))
+            entry = _read_cache.get(key)
+            if entry is not None and entry[2] == token:
+                _read_cache.move_to_end(key)
+                return entry[0]
+        
+        result = fn(*args, **kwargs)
+        size = _result_size(result)
+        with _read_cache_lock:
+            # Skip storing if a write committed while we were reading
+            if generation == (_write_generation, _shard_generations.get(path, 0)) and size <= READ_CACHE_MAX_BYTES:
+                if key in _read_cache:  # read under an older token
+                    _read_cache_bytes -= _read_cache.pop(key)[1]
+                _read_cache[key] = (result, size, token)
+                _read_cache_bytes += size
+                while len(_read_cache) > READ_CACHE_MAX_ENTRIES or _read_cache_bytes > READ_CACHE_MAX_BYTES:
+                    _, (_, evicted, _) = _read_cache.popitem(last=False)
+                    _read_cache_bytes -= evicted
+        return result
+    
+    wrapper.uncached = fn
+    return wrapper
+
+# Single writer. Mutations run on one background thread that takes queued
+# calls off _write_queue and commits up to WRITE_BATCH_MAX of them as one
+# transaction (a group commit), each call in its own savepoint so a failing
+# call only undoes itself. Reads stay on the callers' own connections, which
+# WAL lets run in parallel with the writer.
+WRITE_BATCH_MAX = 64
+_WriteJob = collections.namedtuple('_WriteJob', 'fn args kwargs future batch user profile')
+_write_queue = queue.Queue()
+_writer_thread = None
+_writer_lock = threading.Lock()
+
+def submit_write(fn, *args, **kwargs):
+    # Queues fn(*args, **kwargs) for the writer thread and returns a
+    # concurrent.futures.Future for its result; the future completes once
+    # the write is committed.
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _writer_thread.start()
+    future = concurrent.futures.Future()
+    job = _WriteJob(getattr(fn, 'direct', fn), args, kwargs, future, getattr(fn, 'batch', True),
+                    _current_user.get(), profiling.current.get())
+    _write_queue.put(job)
+    return future
+
+def write(fn=None, *, batch=True):
+    # Routes calls through the writer thread and waits for the result;
+    # fn.submit() returns the future instead. Calls made on the writer
+    # thread, or inside a transaction the caller already holds, run
+    # directly. batch=False is for long jobs that commit on their own
+    # (bulk imports, migrations, whole-table rewrites): they run alone,
+    # outside a group commit. Inside one they would run in a savepoint, which
+    # makes SQLite journal every page they touch a second time.
+    if fn is None:
+        return functools.partial(write, batch=batch)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if threading.current_thread() is _writer_thread or connection().in_transaction:
+            return fn(*args, **kwargs)
+        return submit_write(wrapper, *args, **kwargs).result()
+
+    wrapper.direct = fn
+    wrapper.batch = batch
+    wrapper.submit = functools.partial(submit_write, wrapper)
+    return wrapper
+
+def _writer_loop():
+    held = None
+    while True:
+        job = held or _write_queue.get()
+        held = None
+        if not job.batch:
+            _run_writes([job], group=False)
+            continue
+        batch = [job]
+        while len(batch) < WRITE_BATCH_MAX:
+            try:
+                job = _write_queue.get_nowait()
+            except queue.Empty:
+                break
+            if not job.batch or job.user != batch[0].user:
+                held = job  # runs after this batch, in a commit of its own
+                break
+            batch.append(job)
+        _run_writes(batch, group=True)
+
+def _run_writes(jobs, group):
+    # All jobs belong to the same user; run them against that user's
+    # database. Each job's statements go to its submitter's profile, the
+    # group's BEGIN/COMMIT to the first job's.
+    token = _current_user.set(jobs[0].user)
+    group_profile = profiling.current.set(jobs[0].profile)
+    outcomes = []
+    try:
+        with (transaction() if group else contextlib.nullcontext()):
+            for job in jobs:
+                if not job.future.set_running_or_notify_cancel():
+                    outcomes.append(None)
+                    continue
+                job_profile = profiling.current.set(job.profile)
+                try:
+                    with (transaction() if group else contextlib.nullcontext()):
+                        outcomes.append((True, job.fn(*job.args, **job.kwargs)))
+                except Exception as e:
+                    outcomes.append((False, e))
+                finally:
+                    profiling.current.reset(job_profile)
+    except Exception as e:
+        # The group commit itself failed; none of the calls took effect
+        outcomes = [outcome and (False, e) for outcome in outcomes]
+        outcomes += [(False, e)] * (len(jobs) - len(outcomes))
+    finally:
+        profiling.current.reset(group_profile)
+        _current_user.reset(token)
+    for job, outcome in zip(jobs, outcomes):
+        if outcome is not None:
+            ok, value = outcome
+            if ok:
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(value)
+        _write_queue.task_done()
+
+def close_connections():
+    global _pool_generation
+    # Let queued writes finish before their connection goes away
+    _write_queue.join()
+    with _pool_lock:
+        for conn in list(_pool):
+            conn.close()
+        _pool.clear()
+        _pool_generation += 1
+    # The files may be replaced before they are opened again
+    _config_cache.clear()
+    _ready_shards.clear()
+    _bump_write_generation()
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_schema.sql")
+
+# Whether a database is fully set up: (schema version, config defaults
+# present, archive tables present)
+_SETUP_CHECK = """
+    SELECT (SELECT user_version FROM pragma_user_version()),
+           (SELECT COUNT(*) FROM config WHERE key IN (SELECT value FROM json_each(:config))),
+           (SELECT COUNT(*) FROM archive.sqlite_master WHERE type = 'table' AND name IN (SELECT value FROM json_each(:archive)))
+"""
+
 def init_db():
-    conn = get_connection()
-    with open("db_schema.sql", "r") as f:
-        schema = f.read()
-    conn.executescript(schema)
+    # Creates, migrates and fills in the current database as needed. Every
+    # new session calls it, and the database is nearly always current
+    # already: that is checked with one read on the caller's thread, and
+    # only otherwise does the bootstrap queue up for the writer.
+    if not _is_set_up():
+        _bootstrap()
+
+def _is_set_up():
+    try:
+        row = connection().execute(_SETUP_CHECK, {
+            'config': json.dumps(list(DEFAULT_CONFIG)), 'archive': json.dumps(ARCHIVED_TABLES),
+        }).fetchone()
+    except sqlite3.OperationalError:
+        return False  # a new database, without a config table yet
+    return tuple(row) == (len(MIGRATIONS), len(DEFAULT_CONFIG), len(ARCHIVED_TABLES))
+
+@functools.lru_cache(maxsize=None)
+def _schema_sql():
+    with open(SCHEMA_FILE, "r") as f:
+        return f.read()
+
+@write(batch=False)
+def _bootstrap():
+    connection().executescript(_schema_sql())
+    # The archive first: rebuilds in the migrations read all_history
+    for statement in _ARCHIVE_SCHEMA:
+        connection().execute(statement)
+    migrate()
     
     # Initialize default config if not exists
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM config WHERE key='intervals'")
-    if not cursor.fetchone():
-        default_intervals = json.dumps([1, 2, 3, 5, 9, 15, 20, 30, 60])
-        cursor.execute("INSERT INTO config (key, value) VALUES (?, ?)", ('intervals', default_intervals))
-    
-    cursor.execute("SELECT value FROM config WHERE key='day1_behavior'")
-    if not cursor.fetchone():
-        cursor.execute("INSERT INTO config (key, value) VALUES (?, ?)", ('day1_behavior', 'next_day')) # or 'same_day'
-        
-    cursor.execute("SELECT value FROM config WHERE key='fail_behavior'")
-    if not cursor.fetchone():
-        cursor.execute("INSERT INTO config (key, value) VALUES (?, ?)", ('fail_behavior', 'short_repeat')) # or 'restart'
+    with transaction() as conn:
+        inserted = conn.execute(
+            "INSERT INTO config (key, value) SELECT key, value FROM json_each(?) WHERE true ON CONFLICT (key) DO NOTHING",
+            (json.dumps(DEFAULT_CONFIG),)
+        ).rowcount
+        if inserted:
+            _bump_config_generation(conn)
 
-    conn.commit()
-    conn.close()
+def _copy_file(source_file, target):
+    # Copies the database file `source_file` over target's main database
+    # and closes target
+    source = sqlite3.connect(source_file)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+@write(batch=False)
+def restore_from(snapshot_file):
+    # Replaces the current database's contents with those of the database
+    # file `snapshot_file`, and its archive with the snapshot's archive
+    # (archive_path(snapshot_file)) if it has one. The backup API copies
+    # each file in one write transaction, so other connections see either
+    # the old data or the new, never a mix; the archive goes first, as
+    # until the hot file follows it can only lack rows, not repeat them.
+    # An older snapshot is then migrated.
+    path = db_path()
+    if os.path.exists(archive_path(snapshot_file)):
+        _copy_file(archive_path(snapshot_file), sqlite3.connect(archive_path(path)))
+    _copy_file(snapshot_file, get_connection(path))
+    _config_cache.pop(path, None)
+    _bump_write_generation(path)
+    init_db()
+    # Rows archived while the snapshot was taken, or since if it has no
+    # archive of its own, are hot again in it; drop their archived copies.
+    # Which notes are archived has changed with them.
+    with transaction() as conn:
+        for table in ARCHIVED_TABLES:
+            conn.execute(f"DELETE FROM archive.{table} WHERE id IN (SELECT id FROM main.{table})")
+    rebuild_search_index()
+
+def get_schema_version():
+    return connection().execute("PRAGMA user_version").fetchone()[0]
+
+def migrate():
+    # Each migration runs in its own transaction together with the version
+    # bump, so a failed migration leaves the schema at the previous version.
+    while get_schema_version() < len(MIGRATIONS):
+        with transaction() as conn:
+            # Re-read inside the write lock in case another session migrated first
+            version = get_schema_version()
+            if version >= len(MIGRATIONS):
+                break
+            for statement in MIGRATIONS[version]:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+
+def _bump_config_generation(conn):
+    conn.execute(
+        "INSERT INTO config (key, value) VALUES ('generation', '1') "
+        "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+    _config_cache.pop(db_path(), None)
+
+def _parse_settings(raw):
+    # Values that fail validation (e.g. edited by hand) fall back to the defaults
+    values = {}
+    for key, default in DEFAULT_CONFIG.items():
+        value = raw.get(key)
+        try:
+            validate_config(key, value)
+        except (ValueError, TypeError):
+            value = default
+        values[key] = value
+    return Settings(
+        intervals=tuple(json.loads(values['intervals'])),
+        day1_behavior=values['day1_behavior'],
+        fail_behavior=values['fail_behavior'],
+        scheduler=values['scheduler'],
+        desired_retention=float(values['desired_retention']),
+        archive_after_days=int(values['archive_after_days']),
+    )
+
+def _load_config():
+    # Returns (raw values, Settings), re-reading the table only when the
+    # generation row has moved since the cached copy was taken.
+    path = db_path()
+    row = connection().execute("SELECT value FROM config WHERE key='generation'").fetchone()
+    generation = row['value'] if row else None
+    cache = _config_cache.get(path)
+    if cache is not None and cache[0] == generation:
+        return cache[1], cache[2]
+
+    raw = {row['key']: row['value'] for row in connection().execute("SELECT key, value FROM config")}
+    settings = _parse_settings(raw)
+    _config_cache[path] = (generation, raw, settings)
+    return raw, settings
+
+def get_settings():
+    return _load_config()[1]
 
 def get_config(key):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM config WHERE key=?", (key,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return row['value']
-    return None
+    return _load_config()[0].get(key)
 
+def validate_config(key, value):
+    if key == 'intervals':
+        intervals = json.loads(value)
+        if not isinstance(intervals, list) or not intervals or not all(isinstance(days, int) and days >= 0 for days in intervals):
+            raise ValueError("intervals must be a non-empty JSON list of non-negative integers")
+    elif key == 'day1_behavior' and value not in DAY1_BEHAVIORS:
+        raise ValueError(f"day1_behavior must be one of {DAY1_BEHAVIORS}")
+    elif key == 'fail_behavior' and value not in FAIL_BEHAVIORS:
+        raise ValueError(f"fail_behavior must be one of {FAIL_BEHAVIORS}")
+    elif key == 'scheduler' and value not in scheduler.SCHEDULERS:
+        raise ValueError(f"scheduler must be one of {scheduler.SCHEDULERS}")
+    elif key == 'desired_retention' and not 0 < float(value) < 1:
+        raise ValueError("desired_retention must be between 0 and 1")
+    elif key == 'archive_after_days' and int(value) < 1:
+        raise ValueError("archive_after_days must be a whole number of days, at least 1")
+
+@write(batch=False)
 def set_config(key, value):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, value))
-    conn.commit()
-    conn.close()
+    set_configs({key: value})
+
+@write(batch=False)
+def set_configs(values):
+    # Saves several settings in one transaction; due dates and the calendar
+    # rollup are recomputed once for all of them
+    for key, value in values.items():
+        validate_config(key, value)
+    with transaction() as conn:
+        conn.executemany("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", values.items())
+        _bump_config_generation(conn)
+        if values.keys() & {'scheduler', 'desired_retention'}:
+            _reschedule(conn)
+        if values.keys() & {'intervals', 'scheduler'}:
+            # Projected schedule steps in daily_load depend on both
+            rebuild_daily_load()
+
+def first_due_date(date_added):
+    settings = get_settings()
+    if settings.day1_behavior == 'same_day':
+        return date_added
+    return date_added + datetime.timedelta(days=settings.intervals[0])
+
+def get_scheduler():
+    return scheduler.from_settings(get_settings())
+
+_MEMORY_COLUMNS = ('ease', 'interval_days', 'reps', 'stability', 'memory_difficulty', 'last_review')
+
+def _record_review(cursor, problem_id, date, quality):
+    # Folds one review into the problem's memory state and returns the
+    # updated state (anchor_date included), or None if the problem is gone.
+    cursor.execute(f"SELECT anchor_date, {', '.join(_MEMORY_COLUMNS)} FROM problems WHERE problem_id=?", (problem_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    state = dict(row)
+    state.update(scheduler.update_memory(state, quality, date))
+    cursor.execute(
+        f"UPDATE problems SET {', '.join(f'{column}=?' for column in _MEMORY_COLUMNS)} WHERE problem_id=?",
+        (*(state[column] for column in _MEMORY_COLUMNS), problem_id)
+    )
+    return state
 
+def _schedule_next(cursor, problem_id, state, plan):
+    # Creates the pending revision the scheduler planned (see
+    # scheduler.FixedIntervalScheduler.next_review); None means finished.
+    if plan is None:
+        return
+    if plan['anchor_date'] != state['anchor_date']:
+        cursor.execute("UPDATE problems SET anchor_date=? WHERE problem_id=?", (plan['anchor_date'], problem_id))
+    cursor.execute(
+        "INSERT INTO revisions (problem_id, due_date, status, step) VALUES (?, ?, 'pending', ?)",
+        (problem_id, plan['due_date'], plan['step'])
+    )
+
+@write
 def add_problem(problem_id, title, difficulty, tags, date_added=None):
     if date_added is None:
         date_added = datetime.date.today()
     
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            "INSERT INTO problems (problem_id, title, difficulty, tags, date_added) VALUES (?, ?, ?, ?, ?)",
-            (problem_id, title, difficulty, tags, date_added)
-        )
-        
-        # Schedule revisions
-        intervals = json.loads(get_config('intervals'))
-        day1_behavior = get_config('day1_behavior')
-        
-        for i, days in enumerate(intervals):
-            if i == 0 and day1_behavior == 'same_day':
-                due_date = date_added
-            else:
-                due_date = date_added + datetime.timedelta(days=days)
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO problems (problem_id, title, difficulty, tags, date_added, anchor_date) VALUES (?, ?, ?, ?, ?, ?)",
+                (problem_id, title, difficulty, tags, date_added, date_added)
+            )
             
+            # Schedule the first revision; later ones are created as each is completed
             cursor.execute(
-                "INSERT INTO revisions (problem_id, due_date, status) VALUES (?, ?, 'pending')",
-                (problem_id, due_date)
+                "INSERT INTO revisions (problem_id, due_date, status, step) VALUES (?, ?, 'pending', 0)",
+                (problem_id, first_due_date(date_added))
             )
-        conn.commit()
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
+@write(batch=False)
+def bulk_import(source, default_date=None, chunksize=5000):
+    # Imports problems from a CSV file (path or file-like) with columns
+    # problem_id, title, difficulty, tags and an optional date (YYYY-MM-DD).
+    # The CSV is read in chunks; each chunk is normalized in pandas and
+    # written with executemany in a single transaction. Rows with an
+    # unparseable date fall back to default_date, like the single-add form.
+    import pandas as pd
+
+    if default_date is None:
+        default_date = datetime.date.today()
+    default_ts = pd.Timestamp(default_date)
+
+    settings = get_settings()
+    first_offset = np.timedelta64(0 if settings.day1_behavior == 'same_day' else settings.intervals[0], 'D')
+
+    report = {'inserted': 0, 'duplicates': [], 'invalid': []}
+
+    for chunk in pd.read_csv(source, dtype=str, chunksize=chunksize):
+        # CSV line numbers for the report (line 1 is the header)
+        lines = chunk.index + 2
+
+        if 'problem_id' not in chunk.columns:
+            report['invalid'].extend((int(line), 'missing problem_id column') for line in lines)
+            continue
+
+        ids = chunk['problem_id'].fillna('').str.strip()
+        slugs = ids.str.extract(r'leetcode\.com/problems/([^/?#]+)', expand=False).fillna(ids)
+        missing = slugs == ''
+        report['invalid'].extend((int(line), 'missing problem_id') for line in lines[missing.to_numpy()])
+
+        frame = pd.DataFrame({'problem_id': slugs})
+        for column in ('title', 'difficulty', 'tags'):
+            frame[column] = chunk[column] if column in chunk.columns else None
+        if 'date' in chunk.columns:
+            dates = pd.to_datetime(chunk['date'], format='%Y-%m-%d', errors='coerce')
+            frame['date_added'] = dates.fillna(default_ts)
+        else:
+            frame['date_added'] = default_ts
+        frame = frame[~missing.to_numpy()]
+
+        # Duplicates inside the chunk; repeats of earlier chunks are already
+        # in the database by now and are caught below
+        repeated = frame['problem_id'].duplicated()
+        report['duplicates'].extend(frame.loc[repeated, 'problem_id'])
+        frame = frame[~repeated]
+        if frame.empty:
+            continue
+
+        with transaction() as conn:
+            # Duplicates of problems already in the database
+            existing = {row[0] for row in conn.execute(
+                "SELECT problem_id FROM problems WHERE problem_id IN (SELECT value FROM json_each(?))",
+                (json.dumps(frame['problem_id'].tolist()),)
+            )}
+            if existing:
+                is_existing = frame['problem_id'].isin(existing)
+                report['duplicates'].extend(frame.loc[is_existing, 'problem_id'])
+                frame = frame[~is_existing]
+            if frame.empty:
+                continue
+
+            days = frame['date_added'].to_numpy(dtype='datetime64[D]')
+            problems = frame[['problem_id', 'title', 'difficulty', 'tags']]
+            problems = problems.astype(object).where(problems.notna(), None)
+            conn.executemany(
+                "INSERT INTO problems (problem_id, title, difficulty, tags, date_added, anchor_date) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (problem_id) DO NOTHING",
+                (row + (day, day) for row, day in zip(problems.itertuples(index=False, name=None), days.astype('int64').tolist()))
+            )
+
+            # First revision of each new problem
+            due = (days + first_offset).astype('int64').tolist()
+            conn.executemany(
+                "INSERT INTO revisions (problem_id, due_date, status, step) VALUES (?, ?, 'pending', 0)",
+                zip(frame['problem_id'], due)
+            )
+            report['inserted'] += len(frame)
+
+    return report
+
+def _read_sql_query(sql, conn, params=None):
+    # pandas takes longer to import than the rest of the app's modules
+    # together, and most runs never build a DataFrame; it is imported on
+    # first use
+    import pandas as pd
+    return pd.read_sql_query(sql, conn, params=params)
+
+@cached_read
 def get_due_revisions(date):
-    conn = get_connection()
-    cursor = conn.cursor()
+    cursor = connection().cursor()
     cursor.execute("""
         SELECT r.*, p.title, p.difficulty, p.tags, p.date_added as original_date
         FROM revisions r
@@ -94,104 +1378,399 @@ def get_due_revisions(date):
         WHERE r.due_date <= ? AND r.status = 'pending'
         ORDER BY r.due_date ASC
     """, (date,))
-    rows = cursor.fetchall()
-    conn.close()
-    return rows
+    return cursor.fetchall()
 
-def get_all_problems_df():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM problems", conn)
-    conn.close()
-    return df
-
-def get_revisions_df():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM revisions", conn)
-    conn.close()
-    return df
-
-def get_history_df():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM history", conn)
-    conn.close()
-    return df
+DUE_MODES = ('all', 'overdue', 'today')
 
-def mark_revision_done(revision_id, problem_id, date_completed, quality=None, notes=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE revisions SET status='done', date_completed=?, notes=? WHERE id=?",
-        (date_completed, notes, revision_id)
-    )
+def _facet_conditions(params, difficulties=None, tags=None, due_by=None):
+    # WHERE conditions on problems `p` for the faceted filters shared by the
+    # due queue, the problem list and the tag counts: any of `difficulties`,
+    # every one of `tags`, and with `due_by`, a pending revision due by then.
+    # Fills in their parameters in `params`.
+    conditions = []
+    if difficulties:
+        conditions.append("p.difficulty IN (SELECT value FROM json_each(:difficulties))")
+        params['difficulties'] = json.dumps(list(difficulties))
+    names = {tag.strip().lower(): tag.strip() for tag in tags or () if tag.strip()}
+    if names:
+        conditions.append("""p.problem_id IN (
+            SELECT pt.problem_id FROM tags AS t JOIN problem_tags AS pt ON pt.tag_id = t.id
+            WHERE t.name IN (SELECT value FROM json_each(:tags))
+            GROUP BY pt.problem_id HAVING COUNT(*) = :tag_count
+        )""")
+        params['tags'], params['tag_count'] = json.dumps(list(names.values())), len(names)
+    if due_by is not None:
+        conditions.append("""EXISTS (
+            SELECT 1 FROM revisions AS r WHERE r.problem_id = p.problem_id AND r.status = 'pending' AND r.due_date <= :due_by
+        )""")
+        params['due_by'] = due_by
+    return conditions
+
+@cached_read
+def get_due_page(date, mode='all', difficulties=None, tags=None, after=None, limit=20):
+    # One page of the due queue ordered by (due_date, id). `after` is the
+    # (due_date, id) of the last row of the previous page (keyset
+    # pagination), so every page costs the same however deep it is.
+    # Returns (rows, has_more).
+    conditions = ["r.status = 'pending'"]
+    params = {'date': date, 'limit': limit + 1}
+    if mode == 'overdue':
+        conditions.append("r.due_date < :date")
+    elif mode == 'today':
+        conditions.append("r.due_date = :date")
+    elif mode == 'all':
+        conditions.append("r.due_date <= :date")
+    else:
+        raise ValueError(f"mode must be one of {DUE_MODES}")
+    conditions.extend(_facet_conditions(params, difficulties, tags))
+    if after is not None:
+        conditions.append("(r.due_date, r.id) > (:after_date, :after_id)")
+        params['after_date'], params['after_id'] = after
     
-    # Add history
-    cursor.execute(
-        "INSERT INTO history (problem_id, date, result, quality, notes) VALUES (?, ?, 'solved', ?, ?)",
-        (problem_id, date_completed, quality, notes)
-    )
-    conn.commit()
-    conn.close()
+    cursor = connection().cursor()
+    cursor.execute(f"""
+        SELECT r.*, p.title, p.difficulty, p.tags, p.date_added as original_date
+        FROM revisions r
+        JOIN problems p ON r.problem_id = p.problem_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY r.due_date ASC, r.id ASC
+        LIMIT :limit
+    """, params)
+    rows = cursor.fetchall()
+    return rows[:limit], len(rows) > limit
 
-def mark_revision_failed(revision_id, problem_id, date_failed):
-    conn = get_connection()
-    cursor = conn.cursor()
+@cached_read
+def get_due_summary(date, upcoming_days=7):
+    # Overdue / due-today / upcoming pending counts, overall and per
+    # difficulty, in a single aggregate over the (status, due_date) index.
+    cursor = connection().cursor()
+    cursor.execute("""
+        SELECT p.difficulty,
+               SUM(r.due_date < :date) AS overdue,
+               SUM(r.due_date = :date) AS due_today,
+               SUM(r.due_date > :date) AS upcoming
+        FROM revisions r
+        JOIN problems p ON r.problem_id = p.problem_id
+        WHERE r.status = 'pending' AND r.due_date <= :horizon
+        GROUP BY p.difficulty
+    """, {'date': date, 'horizon': date + datetime.timedelta(days=upcoming_days)})
     
-    # Record failure in history
-    cursor.execute(
-        "INSERT INTO history (problem_id, date, result, quality) VALUES (?, ?, 'failed', 0)",
-        (problem_id, date_failed)
+    summary = {'overdue': 0, 'due_today': 0, 'upcoming': 0, 'by_difficulty': {}}
+    for row in cursor.fetchall():
+        counts = {key: row[key] for key in ('overdue', 'due_today', 'upcoming')}
+        summary['by_difficulty'][row['difficulty']] = counts
+        for key, count in counts.items():
+            summary[key] += count
+    return summary
+
+# The columns shown and exported; problems also holds the scheduler's
+# anchor and memory state
+PROBLEM_COLUMNS = ('problem_id', 'title', 'difficulty', 'tags', 'date_added')
+
+@cached_read
+def get_all_problems_df():
+    return _read_sql_query(f"SELECT {', '.join(PROBLEM_COLUMNS)} FROM problems", connection())
+
+@cached_read
+def filter_problems(difficulties=None, tags=None, due_by=None):
+    # The problems matching the faceted filters (see _facet_conditions), as
+    # a DataFrame like get_all_problems_df(); "due Hard graph problems" is
+    # filter_problems(["Hard"], ["graph"], due_by=today)
+    params = {}
+    conditions = _facet_conditions(params, difficulties, tags, due_by)
+    return _read_sql_query(
+        f"SELECT {', '.join(f'p.{column}' for column in PROBLEM_COLUMNS)} FROM problems AS p "
+        f"WHERE {' AND '.join(conditions) or 'true'}", connection(), params=params
     )
-    
-    fail_behavior = get_config('fail_behavior')
-    
-    if fail_behavior == 'restart':
-        # Delete future pending revisions
-        cursor.execute("DELETE FROM revisions WHERE problem_id=? AND status='pending' AND due_date > ?", (problem_id, date_failed))
-        # Re-schedule from today
-        intervals = json.loads(get_config('intervals'))
-        for days in intervals:
-            due_date = date_failed + datetime.timedelta(days=days)
-            cursor.execute(
-                "INSERT INTO revisions (problem_id, due_date, status) VALUES (?, ?, 'pending')",
-                (problem_id, due_date)
-            )
-        # Mark current revision as skipped or just leave it? 
-        # The prompt says "move that problem to restart". 
-        # Usually we mark the current one as done/failed or just delete it.
-        # Let's mark the current revision as 'skipped' (since we failed it and are restarting)
-        cursor.execute("UPDATE revisions SET status='skipped' WHERE id=?", (revision_id,))
-
-    else: # short_repeat (default)
-        # Insert a short repeat revision today + 2 days
-        due_date = date_failed + datetime.timedelta(days=2)
+
+@cached_read
+def get_tag_counts(difficulties=None, tags=None, due_by=None):
+    # (tag, problems) rows: how many of the problems matching the faceted
+    # filters carry each tag, most common first. Grouped along the
+    # (tag_id, problem_id) index.
+    params = {}
+    conditions = _facet_conditions(params, difficulties, tags, due_by)
+    join = "JOIN problems AS p ON p.problem_id = pt.problem_id" if conditions else ""
+    return connection().execute(f"""
+        SELECT t.name AS tag, COUNT(*) AS problems
+        FROM problem_tags AS pt {join}
+        JOIN tags AS t ON t.id = pt.tag_id
+        WHERE {' AND '.join(conditions) or 'true'}
+        GROUP BY pt.tag_id
+        ORDER BY problems DESC, t.name
+    """, params).fetchall()
+
+# The hot rows; with archived=True, those in the archive as well
+@cached_read
+def get_revisions_df(archived=False):
+    return _read_sql_query(f"SELECT * FROM {'all_revisions' if archived else 'revisions'}", connection())
+
+@cached_read
+def get_history_df(archived=False):
+    return _read_sql_query(f"SELECT * FROM {'all_history' if archived else 'history'}", connection())
+
+_SEARCH_WORD = re.compile(r"\w+")
+
+@cached_read
+def search_problems(query, limit=20):
+    # Problems matching every word of `query` as a prefix ("two su" finds
+    # Two Sum) in their id, title, tags or notes, best matches first. An
+    # empty query lists the most recently added problems.
+    words = _SEARCH_WORD.findall(query or "")
+    if not words:
+        return connection().execute(
+            "SELECT problem_id, title, difficulty, tags, date_added FROM problems ORDER BY rowid DESC LIMIT ?", (limit,)
+        ).fetchall()
+    return connection().execute("""
+        SELECT p.problem_id, p.title, p.difficulty, p.tags, p.date_added
+        FROM problem_search AS s
+        JOIN problems AS p ON p.problem_id = s.problem_id
+        WHERE problem_search MATCH ?
+        ORDER BY s.rank
+        LIMIT ?
+    """, (" ".join(f'"{word}"*' for word in words), limit)).fetchall()
+
+def _lag_days(revision, date):
+    # Days between a pending revision's due date and when it was reviewed
+    if not revision or revision['status'] != 'pending':
+        return None
+    return (date - revision['due_date']).days
+
+@write
+def mark_revision_done(revision_id, problem_id, date_completed, quality=None, notes=None):
+    day = datetime.date.fromisoformat(str(date_completed))
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT problem_id, step, status, due_date FROM revisions WHERE id=?", (revision_id,))
+        revision = cursor.fetchone()
         cursor.execute(
-            "INSERT INTO revisions (problem_id, due_date, status) VALUES (?, ?, 'pending')",
-            (problem_id, due_date)
+            "UPDATE revisions SET status='done', date_completed=?, notes=? WHERE id=?",
+            (day, notes, revision_id)
         )
-        # Keep the current revision as pending? No, we failed it.
-        # The prompt says "If a revision day passes without completion, keep it pending".
-        # But here we explicitly clicked fail.
-        # So we should probably mark this specific revision instance as 'done' (but failed) or 'skipped'.
-        # Since we have a history entry for failure, let's mark this revision row as 'done' (completed the attempt) 
-        # or maybe we should just leave it?
-        # If we leave it pending, it will show up again.
-        # Let's mark it as 'done' so it clears from the list, but the history records the failure.
-        cursor.execute("UPDATE revisions SET status='done', date_completed=? WHERE id=?", (date_failed, revision_id))
+        
+        # Add history
+        cursor.execute(
+            "INSERT INTO history (problem_id, date, result, quality, notes, lag_days) VALUES (?, ?, 'solved', ?, ?, ?)",
+            (problem_id, day, quality, notes, _lag_days(revision, day))
+        )
+        
+        state = _record_review(cursor, problem_id, day, quality)
+        if revision and revision['status'] == 'pending' and state:
+            plan = get_scheduler().next_review({**state, 'step': revision['step']}, True, day)
+            _schedule_next(cursor, problem_id, state, plan)
 
-    conn.commit()
-    conn.close()
+@write
+def mark_revision_failed(revision_id, problem_id, date_failed):
+    day = datetime.date.fromisoformat(str(date_failed))
+    with transaction() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT problem_id, step, status, due_date FROM revisions WHERE id=?", (revision_id,))
+        revision = cursor.fetchone()
+        
+        # Record failure in history
+        cursor.execute(
+            "INSERT INTO history (problem_id, date, result, quality, lag_days) VALUES (?, ?, 'failed', 0, ?)",
+            (problem_id, day, _lag_days(revision, day))
+        )
+        
+        state = _record_review(cursor, problem_id, day, 0)
+        if not revision or revision['status'] != 'pending' or state is None:
+            return
+        
+        plan = get_scheduler().next_review({**state, 'step': revision['step']}, False, day)
+        if plan['restarted']:
+            # The fixed schedule starts over from date_failed; the current
+            # revision is skipped
+            cursor.execute("UPDATE revisions SET status='skipped' WHERE id=?", (revision_id,))
+        else:
+            # Mark this attempt 'done' so it clears from the list (history
+            # records the failure); the scheduler decides when it comes back
+            cursor.execute("UPDATE revisions SET status='done', date_completed=? WHERE id=?", (day, revision_id))
+        _schedule_next(cursor, problem_id, state, plan)
 
+@write
 def snooze_revision(revision_id, days):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT due_date FROM revisions WHERE id=?", (revision_id,))
-    row = cursor.fetchone()
-    if row:
-        current_due = datetime.datetime.strptime(row['due_date'], '%Y-%m-%d').date()
-        new_due = current_due + datetime.timedelta(days=days)
-        cursor.execute("UPDATE revisions SET due_date=? WHERE id=?", (new_due, revision_id))
-    conn.commit()
-    conn.close()
+    snooze_revisions([revision_id], days)
+
+# Bulk review actions. Each runs as a handful of set-based statements in one
+# transaction, whatever the number of revisions; ids that are not pending
+# are ignored. They return how many revisions were acted on.
+@write
+def mark_revisions_done(revision_ids, date_completed, quality=None):
+    return _review_revisions(revision_ids, date_completed, 'solved', quality)
+
+@write
+def mark_revisions_failed(revision_ids, date_failed):
+    return _review_revisions(revision_ids, date_failed, 'failed', 0)
+
+@write
+def snooze_revisions(revision_ids, days):
+    with transaction() as conn:
+        return conn.execute(
+            "UPDATE revisions SET due_date = due_date + ? "
+            "WHERE id IN (SELECT value FROM json_each(?)) AND status = 'pending'",
+            (int(days), json.dumps([int(i) for i in revision_ids]))
+        ).rowcount
+
+def _review_revisions(revision_ids, date, result, quality):
+    # Same outcome as calling mark_revision_done/failed once per revision:
+    # history rows, memory state (scheduler.advance_memory) and the next
+    # revisions (Scheduler.plan) are computed for the whole batch at once.
+    day = np.datetime64(str(date), 'D')
+    day_number = int(day.astype('int64'))
+    with transaction() as conn:
+        frame = _read_sql_query("""
+            SELECT r.id, r.problem_id, r.step, CAST(p.anchor_date AS INTEGER) AS anchor_date,
+                   p.ease, p.interval_days, p.reps, p.stability, p.memory_difficulty,
+                   CAST(p.last_review AS INTEGER) AS last_review
+            FROM revisions AS r JOIN problems AS p ON p.problem_id = r.problem_id
+            WHERE r.id IN (SELECT value FROM json_each(?)) AND r.status = 'pending'
+        """, conn, params=(json.dumps([int(i) for i in revision_ids]),))
+        if frame.empty:
+            return 0
+        ids = json.dumps(frame['id'].tolist())
+
+        conn.execute("""
+            INSERT INTO history (problem_id, date, result, quality, lag_days)
+            SELECT problem_id, :day, :result, :quality, :day - due_date
+            FROM revisions WHERE id IN (SELECT value FROM json_each(:ids))
+        """, {'day': day_number, 'result': result, 'quality': quality, 'ids': ids})
+
+        memory = scheduler.advance_memory({
+            'ease': frame['ease'].to_numpy(dtype=float),
+            'interval_days': frame['interval_days'].to_numpy(dtype=float),
+            'reps': frame['reps'].to_numpy(dtype=int),
+            'stability': frame['stability'].to_numpy(dtype=float),
+            'memory_difficulty': frame['memory_difficulty'].to_numpy(dtype=float),
+            'last_review': frame['last_review'].to_numpy(dtype=float).astype('datetime64[D]'),
+        }, np.nan if quality is None else quality, day)
+        plan = get_scheduler().plan({
+            **memory,
+            'step': frame['step'].to_numpy(),
+            'anchor_date': frame['anchor_date'].to_numpy(dtype='int64').astype('datetime64[D]'),
+        }, result == 'solved', day)
+
+        if plan['restarted'].any():
+            # A restarted fixed schedule skips the current revisions
+            conn.execute("UPDATE revisions SET status='skipped' WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+        else:
+            conn.execute(
+                "UPDATE revisions SET status='done', date_completed=? WHERE id IN (SELECT value FROM json_each(?))",
+                (day_number, ids)
+            )
+
+        problem_ids = frame['problem_id'].to_numpy()
+        memory['last_review'] = memory['last_review'].astype('int64')
+        conn.execute(f"""
+            UPDATE problems SET anchor_date = json_extract(j.value, '$[1]'),
+                {', '.join(f"{column} = json_extract(j.value, '$[{i + 2}]')" for i, column in enumerate(_MEMORY_COLUMNS))}
+            FROM json_each(?) AS j WHERE problems.problem_id = json_extract(j.value, '$[0]')
+        """, (json.dumps(list(zip(
+            problem_ids.tolist(), plan['anchor_date'].astype('int64').tolist(),
+            *(memory[column].tolist() for column in _MEMORY_COLUMNS)
+        ))),))
+
+        scheduled = ~plan['finished']
+        conn.execute("""
+            INSERT INTO revisions (problem_id, due_date, status, step)
+            SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), 'pending', json_extract(value, '$[2]')
+            FROM json_each(?)
+        """, (json.dumps(list(zip(
+            problem_ids[scheduled].tolist(), plan['due_date'][scheduled].astype('int64').tolist(), plan['step'][scheduled].tolist()
+        ))),))
+    return len(frame)
+
+# Rebalance order: recently failed problems first, then harder ones, then
+# the longest overdue
+DIFFICULTY_PRIORITY = {'Hard': 0, 'Medium': 1, 'Easy': 2}
+
+def rebalance(today, capacity, horizon_days=14, dry_run=False):
+    # Spreads the pending revisions due before today + horizon_days over the
+    # days from today on, so that no day holds more than `capacity` reviews
+    # (projected schedule steps count towards it). A revision never moves
+    # before its due date, and with one pending revision per problem each
+    # schedule stays in order. Returns the moves as a DataFrame (id,
+    # problem_id, title, difficulty, due_date, new_due_date); with dry_run
+    # nothing is written.
+    if capacity < 1 or horizon_days < 1:
+        raise ValueError("capacity and horizon_days must be at least 1")
+    if dry_run:
+        return _plan_rebalance(today, capacity, horizon_days)
+    return _apply_rebalance(today, capacity, horizon_days)
+
+@write
+def _apply_rebalance(today, capacity, horizon_days):
+    with transaction() as conn:
+        moves = _plan_rebalance(today, capacity, horizon_days)
+        conn.execute("""
+            UPDATE revisions SET due_date = json_extract(j.value, '$[1]')
+            FROM json_each(?) AS j WHERE revisions.id = json_extract(j.value, '$[0]')
+        """, (json.dumps(list(zip(moves['id'].tolist(), map(_adapt_date, moves['new_due_date'])))),))
+    return moves
+
+# Cached until the next write: the Calendar page previews it on every render
+@cached_read
+def _plan_rebalance(today, capacity, horizon_days):
+    start = datetime.date.fromisoformat(str(today))
+    candidates = _read_sql_query("""
+        SELECT r.id, r.problem_id, p.title, p.difficulty, CAST(r.due_date AS INTEGER) AS due_date,
+               COALESCE(s.last_result = 'failed', 0) AS failed
+        FROM revisions AS r
+        JOIN problems AS p ON p.problem_id = r.problem_id
+        LEFT JOIN problem_stats AS s ON s.problem_id = r.problem_id
+        WHERE r.status = 'pending' AND r.due_date < ?
+    """, connection(), params=(start + datetime.timedelta(days=horizon_days),))
+    if candidates.empty:
+        return candidates.drop(columns='failed').assign(new_due_date=[])
+
+    # Day index (0 = today) each revision may be placed from
+    due = candidates['due_date'].to_numpy(dtype='int64').astype('datetime64[D]')
+    release = np.maximum((due - np.datetime64(start, 'D')).astype(int), 0)
+
+    # Free capacity per day. Past the horizon there is room for the whole
+    # backlog at `capacity` a day; anything beyond that stays on the last day.
+    n_days = horizon_days + -(-len(candidates) // capacity) + 1
+    load = np.zeros(n_days, dtype=int)
+    for day, count in get_load_between(start, start + datetime.timedelta(days=n_days)).items():
+        load[(day - start).days] += count
+    # The candidates' own current slots are being reassigned
+    upcoming = due >= np.datetime64(start, 'D')
+    np.subtract.at(load, release[upcoming], 1)
+    free = np.maximum(capacity - load, 0)
+
+    # Greedy in priority order, each revision on the first day from its
+    # release with room left. next_free is a disjoint-set forest over the
+    # days pointing past full ones, so finding that day is near O(1).
+    next_free = list(range(n_days + 1))
+    for d in range(n_days):
+        if free[d] == 0:
+            next_free[d] = d + 1
+
+    def find(d):
+        while next_free[d] != d:
+            next_free[d] = next_free[next_free[d]]
+            d = next_free[d]
+        return d
+
+    difficulty_rank = candidates['difficulty'].map(DIFFICULTY_PRIORITY).fillna(len(DIFFICULTY_PRIORITY)).to_numpy()
+    order = np.lexsort((candidates['id'].to_numpy(), due, difficulty_rank, -candidates['failed'].to_numpy()))
+    placed = np.empty(len(candidates), dtype=int)
+    for i in order:
+        d = find(release[i])
+        if d == n_days:
+            d = n_days - 1
+        else:
+            free[d] -= 1
+            if free[d] == 0:
+                next_free[d] = d + 1
+        placed[i] = d
+
+    new_due = np.datetime64(start, 'D') + placed.astype('timedelta64[D]')
+    moved = new_due != due
+    return candidates[moved].drop(columns='failed').reset_index(drop=True).assign(
+        due_date=due[moved].astype(object), new_due_date=new_due[moved].astype(object)
+    )
 
 def get_counts_per_day(year, month):
     # Return a dictionary of date -> count of pending revisions
@@ -201,139 +1780,319 @@ def get_counts_per_day(year, month):
         end_date = datetime.date(year + 1, 1, 1)
     else:
         end_date = datetime.date(year, month + 1, 1)
-        
-    conn = get_connection()
-    cursor = conn.cursor()
+    return get_load_between(start_date, end_date)
+
+@cached_read
+def get_load_between(start_date, end_date):
+    # Pending revisions per day in [start_date, end_date), including the
+    # later steps of each schedule that are not materialized yet.
+    cursor = connection().cursor()
     cursor.execute("""
-        SELECT due_date, COUNT(*) as count
-        FROM revisions
-        WHERE status='pending' AND due_date >= ? AND due_date < ?
-        GROUP BY due_date
+        SELECT day, SUM(pending) AS count
+        FROM daily_load
+        WHERE day >= ? AND day < ?
+        GROUP BY day
+        HAVING count > 0
     """, (start_date, end_date))
-    rows = cursor.fetchall()
-    conn.close()
-    return {row['due_date']: row['count'] for row in rows}
+    return {row['day']: row['count'] for row in cursor.fetchall()}
+
+@cached_read
+def get_daily_load(start_date, end_date):
+    # Like get_load_between, broken down by difficulty: a list of
+    # (day, difficulty, count) rows for calendars and heatmaps.
+    cursor = connection().cursor()
+    cursor.execute("""
+        SELECT day, difficulty, pending
+        FROM daily_load
+        WHERE day >= ? AND day < ? AND pending > 0
+        ORDER BY day
+    """, (start_date, end_date))
+    return [(row['day'], row['difficulty'] or None, row['pending']) for row in cursor.fetchall()]
+
+@write(batch=False)
+def rebuild_daily_load():
+    # Recomputes daily_load from revisions and returns the number of
+    # (day, difficulty) rows that were wrong; 0 means it was consistent.
+    with transaction() as conn:
+        expected = {(row[0], row[1]): row[2] for row in conn.execute(_DAILY_LOAD_REBUILD_SQL)}
+        actual = {(row[0], row[1]): row[2] for row in conn.execute(
+            "SELECT CAST(day AS INTEGER), difficulty, pending FROM daily_load WHERE pending != 0"
+        )}
+        mismatched = sum(1 for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key))
+        conn.execute("DELETE FROM daily_load")
+        conn.execute("INSERT INTO daily_load (day, difficulty, pending) " + _DAILY_LOAD_REBUILD_SQL)
+    return mismatched
 
-def get_analytics_stats():
-    conn = get_connection()
-    cursor = conn.cursor()
+@cached_read
+def get_analytics_stats(today=None):
+    # Served from the history_daily/problem_stats rollups, never from history
+    if today is None:
+        today = datetime.date.today()
+    cursor = connection().cursor()
     
     # Total problems
     cursor.execute("SELECT COUNT(*) FROM problems")
     total_problems = cursor.fetchone()[0]
     
     # Total solved (unique problems solved at least once)
-    cursor.execute("SELECT COUNT(DISTINCT problem_id) FROM history WHERE result='solved'")
+    cursor.execute("SELECT COUNT(*) FROM problem_stats WHERE solved > 0")
     total_solved = cursor.fetchone()[0]
     
-    # Streak (consecutive days with at least one solved)
-    # This is a bit complex in SQL, might be easier in Python with pandas
-    conn.close()
+    cursor.execute("SELECT SUM(solved), SUM(failed), SUM(lag_sum), SUM(lag_count) FROM history_daily")
+    solved, failed, lag_sum, lag_count = cursor.fetchone()
+    reviews = (solved or 0) + (failed or 0)
+    
+    # Streaks: runs of consecutive days with at least one solve. Days in a
+    # run share the same (day number - row number).
+    cursor.execute("""
+        SELECT MAX(day) AS "last_day [DATE]", COUNT(*) AS length FROM (
+            SELECT day, day - ROW_NUMBER() OVER (ORDER BY day) AS run
+            FROM history_daily
+            WHERE solved > 0 AND day <= ?
+        )
+        GROUP BY run
+    """, (today,))
+    runs = cursor.fetchall()
+    longest_streak = max((row['length'] for row in runs), default=0)
+    # The current streak is still alive if it reached today or yesterday
+    current_streak = 0
+    alive_since = today - datetime.timedelta(days=1)
+    for row in runs:
+        if row['last_day'] >= alive_since:
+            current_streak = row['length']
     
     return {
         'total_problems': total_problems,
-        'total_solved': total_solved
+        'total_solved': total_solved,
+        'total_reviews': reviews,
+        'retention': (solved or 0) / reviews if reviews else None,
+        'avg_lag_days': lag_sum / lag_count if lag_count else None,
+        'current_streak': current_streak,
+        'longest_streak': longest_streak,
     }
 
+@cached_read
+def get_review_activity(start_date, end_date):
+    # Solved/failed reviews per day in [start_date, end_date)
+    return _read_sql_query("""
+        SELECT day, solved, failed,
+               CAST(solved AS REAL) / NULLIF(solved + failed, 0) AS solve_rate
+        FROM history_daily
+        WHERE day >= ? AND day < ?
+        ORDER BY day
+    """, connection(), params=(start_date, end_date))
+
+@cached_read
+def get_retention_by_difficulty():
+    return _read_sql_query("""
+        SELECT p.difficulty, COUNT(*) AS problems, SUM(s.solved) AS solved, SUM(s.failed) AS failed,
+               CAST(SUM(s.solved) AS REAL) / NULLIF(SUM(s.solved) + SUM(s.failed), 0) AS retention
+        FROM problem_stats s
+        JOIN problems p ON p.problem_id = s.problem_id
+        GROUP BY p.difficulty
+        ORDER BY p.difficulty
+    """, connection())
+
+@cached_read
+def get_tag_stats():
+    return _read_sql_query("""
+        SELECT t.name AS tag, COUNT(*) AS problems, SUM(s.solved) AS solved, SUM(s.failed) AS failed,
+               CAST(SUM(s.solved) AS REAL) / NULLIF(SUM(s.solved) + SUM(s.failed), 0) AS retention
+        FROM problem_tags pt
+        JOIN problem_stats s ON s.problem_id = pt.problem_id
+        JOIN tags t ON t.id = pt.tag_id
+        GROUP BY pt.tag_id
+        ORDER BY problems DESC, tag
+    """, connection())
+
+@cached_read
+def get_recent_history(limit=200):
+    return _read_sql_query("SELECT * FROM history ORDER BY id DESC LIMIT ?", connection(), params=(limit,))
+
+@write(batch=False)
+def reschedule_all():
+    # Recomputes the due date of every pending revision under the active
+    # scheduler in one vectorized pass and returns how many moved.
+    with transaction() as conn:
+        return _reschedule(conn)
+
+def _reschedule(conn):
+    # The body of reschedule_all(), for callers already in a transaction
+    frame = _read_sql_query("""
+        SELECT r.id, CAST(r.due_date AS INTEGER) AS due_date, r.step, CAST(p.anchor_date AS INTEGER) AS anchor_date,
+               p.interval_days, p.stability, CAST(p.last_review AS INTEGER) AS last_review
+        FROM revisions AS r JOIN problems AS p ON p.problem_id = r.problem_id
+        WHERE r.status = 'pending'
+    """, conn)
+    if frame.empty:
+        return 0
+    for column in ('due_date', 'anchor_date', 'last_review'):
+        frame[column] = frame[column].to_numpy(dtype=float).astype('datetime64[D]')
+    due = get_scheduler().batch_due(frame)
+    moved = due != frame['due_date'].to_numpy(dtype='datetime64[D]')
+    conn.executemany(
+        "UPDATE revisions SET due_date=? WHERE id=?",
+        zip(due[moved].astype('int64').tolist(), frame['id'].to_numpy()[moved].tolist())
+    )
+    return int(moved.sum())
+
+@write(batch=False)
+def rebuild_memory_state():
+    # Replays all of history through the scheduler models (see
+    # scheduler.rebuild_memory) and stores the result on problems.
+    with transaction() as conn:
+        history = _read_sql_query(
+            "SELECT problem_id, CAST(date AS INTEGER) AS date, quality FROM all_history ORDER BY problem_id, date, id", conn
+        )
+        state = scheduler.rebuild_memory(
+            history['problem_id'].to_numpy(),
+            history['date'].to_numpy(dtype=float).astype('datetime64[D]'),
+            history['quality'].to_numpy(dtype=float),
+        )
+        conn.execute(
+            "UPDATE problems SET ease=2.5, interval_days=0, reps=0, stability=NULL, memory_difficulty=NULL, last_review=NULL"
+        )
+        last_review = np.where(np.isnat(state['last_review']), None, state['last_review'].astype('int64'))
+        conn.executemany(
+            f"UPDATE problems SET {', '.join(f'{column}=?' for column in _MEMORY_COLUMNS)} WHERE problem_id=?",
+            zip(state['ease'].tolist(), state['interval_days'].tolist(), state['reps'].tolist(),
+                state['stability'].tolist(), state['memory_difficulty'].tolist(), last_review.tolist(),
+                state['problem_id'].tolist())
+        )
+
+@write(batch=False)
+def rebuild_analytics():
+    # Recomputes both rollups from history, archived reviews included, one
+    # set-based statement each
+    with transaction() as conn:
+        for statement in _analytics_rebuild("all_history"):
+            conn.execute(statement)
+
+@write(batch=False)
+def rebuild_search_index():
+    with transaction() as conn:
+        for statement in (*_SEARCH_REBUILD, _search_archived_notes_refresh(all_problems=True)):
+            conn.execute(statement)
+
+@write(batch=False)
+def rebuild_tag_index():
+    with transaction() as conn:
+        for statement in _TAG_REBUILD:
+            conn.execute(statement)
+
+ARCHIVE_BATCH_ROWS = 2000
+
+@write(batch=False)
+def archive_batch(cutoff, limit=ARCHIVE_BATCH_ROWS):
+    # Moves up to `limit` rows of each archived table from before `cutoff`
+    # (see _ARCHIVE_WHERE) to the archive and returns how many moved; 0
+    # means there are none left. A commit spanning two WAL databases is
+    # only atomic per file, so rows are copied and committed first, then
+    # deleted from the hot tables: a crash in between leaves them in both
+    # tiers, and the next batch copies them over again and deletes them.
+    moved = 0
+    params = {'cutoff': cutoff, 'limit': limit}
+    for table, columns in _ARCHIVE_TABLES.items():
+        names = ', '.join(name for name, _ in columns)
+        with transaction() as conn:
+            ids = json.dumps([row[0] for row in conn.execute(
+                f"SELECT id FROM main.{table} WHERE {_ARCHIVE_WHERE[table]} LIMIT :limit", params
+            )])
+            conn.execute(
+                f"INSERT OR REPLACE INTO archive.{table} ({names}) "
+                f"SELECT {names} FROM main.{table} WHERE id IN (SELECT value FROM json_each(?))", (ids,)
+            )
+        with transaction() as conn:
+            # The rollups already count these rows (see _ARCHIVING)
+            conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES ('archiving', '1')")
+            moved += conn.execute(
+                f"DELETE FROM main.{table} WHERE id IN (SELECT value FROM json_each(?)) "
+                f"AND id IN (SELECT id FROM archive.{table})", (ids,)
+            ).rowcount
+            conn.execute("DELETE FROM config WHERE key = 'archiving'")
+            # The search triggers dropped the moved notes from the hot ones
+            conn.execute(_search_archived_notes_refresh(), {'problem_ids': json.dumps([row[0] for row in conn.execute(
+                f"SELECT DISTINCT problem_id FROM archive.{table} WHERE id IN (SELECT value FROM json_each(?)) "
+                f"AND notes <> ''", (ids,)
+            )])})
+    return moved
+
+@cached_read
+def get_archive_stats():
+    # Rows per table and file size of each tier: {'hot': {...}, 'archive': {...}}
+    conn = connection()
+    stats = {}
+    for tier, schema in (('hot', 'main'), ('archive', 'archive')):
+        stats[tier] = {table: conn.execute(f"SELECT COUNT(*) FROM {schema}.{table}").fetchone()[0]
+                       for table in _ARCHIVE_TABLES}
+        stats[tier]['bytes'] = conn.execute(
+            "SELECT page_count * page_size FROM pragma_page_count(?), pragma_page_size(?)", (schema, schema)
+        ).fetchone()[0]
+    return stats
+
+@write(batch=False)
+def compact(min_free=0.1):
+    # VACUUMs the hot database when at least `min_free` of its pages are
+    # free, as after archiving a large backlog, and returns whether it did.
+    # Smaller gaps are left for new rows to fill, since VACUUM rewrites the
+    # whole file.
+    conn = connection()
+    free = conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+    pages = conn.execute("PRAGMA main.page_count").fetchone()[0]
+    if not pages or free / pages < min_free:
+        return False
+    conn.execute("VACUUM main")
+    conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+    return True
+
+@write
 def delete_problem(problem_id):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        # Delete from history
-        cursor.execute("DELETE FROM history WHERE problem_id=?", (problem_id,))
-        # Delete from revisions
-        cursor.execute("DELETE FROM revisions WHERE problem_id=?", (problem_id,))
-        # Delete from problems
-        cursor.execute("DELETE FROM problems WHERE problem_id=?", (problem_id,))
-        conn.commit()
+        with transaction() as conn:
+            cursor = conn.cursor()
+            # Delete archived history and revisions
+            for statement in _ARCHIVED_HISTORY_DAILY_REMOVE:
+                cursor.execute(statement, {'problem_id': problem_id})
+            for table in _ARCHIVE_TABLES:
+                cursor.execute(f"DELETE FROM archive.{table} WHERE problem_id=?", (problem_id,))
+            # Delete from history
+            cursor.execute("DELETE FROM history WHERE problem_id=?", (problem_id,))
+            cursor.execute("DELETE FROM problem_stats WHERE problem_id=?", (problem_id,))
+            # Delete from revisions
+            cursor.execute("DELETE FROM revisions WHERE problem_id=?", (problem_id,))
+            # Delete from problems
+            cursor.execute("DELETE FROM problems WHERE problem_id=?", (problem_id,))
         return True
     except Exception as e:
         print(f"Error deleting problem: {e}")
         return False
-    finally:
-        conn.close()
 
+@write
 def update_problem(problem_id, new_data):
-    conn = get_connection()
-    cursor = conn.cursor()
     try:
-        # 1. Update problems table
-        cursor.execute("""
-            UPDATE problems 
-            SET title=?, difficulty=?, tags=?, date_added=?
-            WHERE problem_id=?
-        """, (new_data['title'], new_data['difficulty'], new_data['tags'], new_data['date_added'], problem_id))
-        
-        # 2. Check if date changed to handle rescheduling
-        # We need to know if the date actually changed. 
-        # But since we already updated it, we can just assume we need to reschedule if the user requested it.
-        # However, to be efficient, we might want to check. 
-        # For simplicity, if this function is called, we assume the intention is to update.
-        # But wait, if we just update the title, we shouldn't wipe revisions.
-        # So let's check if we need to reschedule.
-        # The caller should probably handle the logic of "did date change", but let's be safe and just always reschedule if date is passed.
-        # Actually, let's look at the logic:
-        # If we update the date_added, the entire schedule shifts.
-        # So we should delete PENDING revisions and recreate them.
-        
-        # Get current config
-        intervals = json.loads(get_config('intervals'))
-        day1_behavior = get_config('day1_behavior')
-        new_date_added = new_data['date_added']
-        
-        # Delete only PENDING revisions. Completed ones (history) stay.
-        cursor.execute("DELETE FROM revisions WHERE problem_id=? AND status='pending'", (problem_id,))
-        
-        # Re-create revisions based on new date
-        for i, days in enumerate(intervals):
-            if i == 0 and day1_behavior == 'same_day':
-                due_date = new_date_added
-            else:
-                due_date = new_date_added + datetime.timedelta(days=days)
-            
-            # Only insert if it's in the future? 
-            # No, if we backdate a problem, we might want to see past due revisions immediately.
-            # But we shouldn't insert revisions that "should have been done" already if we want to be strict?
-            # Actually, standard spaced repetition: if I missed it, it's overdue.
-            # So we insert ALL of them.
-            # But wait, if I solved it 3 times, I don't want those 3 pending again.
-            # We need to know how many we solved.
-            # This is getting complex.
-            # SIMPLIFICATION: 
-            # If we change the date, we assume we are "resetting" the schedule relative to that date.
-            # BUT, if we already have 'done' revisions, we shouldn't duplicate them.
-            # So, we should only insert revisions if they don't overlap with completed ones?
-            # Or simpler: Just delete pending and re-insert pending starting from where we left off?
-            # No, "where we left off" is hard to determine if we change the start date.
-            
-            # LET'S DO THIS:
-            # 1. Delete all pending.
-            # 2. Generate the ideal schedule based on new date.
-            # 3. For each ideal revision, check if we already have a 'done' revision around that time? No that's messy.
-            
-            # ALTERNATIVE APPROACH (Robust):
-            # Just delete pending.
-            # Re-schedule ALL intervals.
-            # But check if a revision for that "step" (index) is already done?
-            # We don't store "step index" in revisions table.
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT date_added FROM problems WHERE problem_id=?", (problem_id,))
+            row = cursor.fetchone()
             
-            # PRAGMATIC APPROACH:
-            # If the user changes the date, they are likely fixing a mistake on a NEW problem.
-            # If it's an old problem with history, changing the start date is weird.
-            # Let's just Delete Pending and Re-insert ALL intervals as pending.
-            # If the user has history, they will have duplicate "done" items in history, but the schedule will be fresh.
-            # This might mean they see "Day 1" revision again even if they did it.
-            # This is acceptable for a "fix" feature.
+            new_date_added = datetime.date.fromisoformat(str(new_data['date_added']))
+            cursor.execute("""
+                UPDATE problems 
+                SET title=?, difficulty=?, tags=?, date_added=?
+                WHERE problem_id=?
+            """, (new_data['title'], new_data['difficulty'], new_data['tags'], new_date_added, problem_id))
             
-            cursor.execute(
-                "INSERT INTO revisions (problem_id, due_date, status) VALUES (?, ?, 'pending')",
-                (problem_id, due_date)
-            )
-            
-        conn.commit()
+            # Changing the date resets the schedule relative to the new date:
+            # replace the pending revision with step 0. Completed revisions and
+            # history stay as they are.
+            if row and row['date_added'] != new_date_added:
+                cursor.execute("UPDATE problems SET anchor_date=? WHERE problem_id=?", (new_date_added, problem_id))
+                cursor.execute("DELETE FROM revisions WHERE problem_id=? AND status='pending'", (problem_id,))
+                cursor.execute(
+                    "INSERT INTO revisions (problem_id, due_date, status, step) VALUES (?, ?, 'pending', 0)",
+                    (problem_id, first_due_date(new_date_added))
+                )
         return True
     except Exception as e:
         print(f"Error updating problem: {e}")
         return False
-    finally:
-        conn.close()
@@ -0,0 +1,146 @@
+import csv
+import gzip
+import importlib.util
+import io
+import os
+import sqlite3
+import tempfile
+import database as db
+
+# Exports that stream rows from one SELECT in chunks of CHUNK_ROWS, so a
+# table is never held in memory as a whole; the single statement also
+# reads one consistent snapshot of the table while writers carry on (WAL).
+# Each export opens its own connection to `path` (the current user's
+# database by default) so it can run outside the app's script thread.
+# Revisions and history are exported in full, archived rows included;
+# problems without the scheduler's state (db.PROBLEM_COLUMNS).
+
+EXPORT_TABLES = ("problems", "revisions", "history")
+CHUNK_ROWS = 5000
+
+# format -> (file extension, MIME type)
+FORMATS = {
+    'csv': (".csv", "text/csv"),
+    'csv.gz': (".csv.gz", "application/gzip"),
+    'parquet': (".parquet", "application/vnd.apache.parquet"),
+}
+
+def available_formats():
+    # Parquet needs the optional pyarrow package
+    if importlib.util.find_spec("pyarrow") is None:
+        return [fmt for fmt in FORMATS if fmt != 'parquet']
+    return list(FORMATS)
+
+def _select(conn, table):
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"cannot export table: {table!r}")
+    source = f"all_{table}" if table in db.ARCHIVED_TABLES else table
+    columns = ", ".join(db.PROBLEM_COLUMNS) if table == "problems" else "*"
+    cursor = conn.execute(f"SELECT {columns} FROM {source}")
+    return cursor, [column[0] for column in cursor.description]
+
+def _write_csv(cursor, columns, out, chunksize):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    rows = 0
+    while chunk := cursor.fetchmany(chunksize):
+        writer.writerows(chunk)
+        rows += len(chunk)
+    text.flush()
+    text.detach()  # leave `out` open for the caller
+    return rows
+
+def _write_parquet(conn, table, cursor, columns, out, chunksize):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Column types come from the declared SQLite types
+    declared = {row['name']: (row['type'] or "").upper() for row in conn.execute(f"PRAGMA table_info({table})")}
+    types = {"INTEGER": pa.int64(), "REAL": pa.float64(), "DATE": pa.date32()}
+    schema = pa.schema([(name, types.get(declared.get(name), pa.string())) for name in columns])
+    rows = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        while chunk := cursor.fetchmany(chunksize):
+            writer.write_batch(pa.RecordBatch.from_arrays(
+                [pa.array([row[i] for row in chunk], type=field.type) for i, field in enumerate(schema)],
+                schema=schema,
+            ))
+            rows += len(chunk)
+    return rows
+
+def export_table(table, out, fmt='csv', path=None, chunksize=CHUNK_ROWS):
+    # Writes `table` to the binary file-like `out` in `fmt`; returns the
+    # number of rows written
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format: {fmt!r}")
+    conn = db.get_connection(path)
+    try:
+        cursor, columns = _select(conn, table)
+        if fmt == 'parquet':
+            return _write_parquet(conn, table, cursor, columns, out, chunksize)
+        if fmt == 'csv.gz':
+            with gzip.GzipFile(fileobj=out, mode="wb") as compressed:
+                return _write_csv(cursor, columns, compressed, chunksize)
+        return _write_csv(cursor, columns, out, chunksize)
+    finally:
+        conn.close()
+
+def export_file(table, fmt='csv', path=None):
+    # The export in a temporary file (in memory while small), rewound
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    export_table(table, out, fmt, path)
+    out.seek(0)
+    return out
+
+def export_bytes(table, fmt='csv', path=None):
+    # The whole export as bytes, for st.download_button: its deferred data
+    # callables may return bytes or io.BytesIO, not a spooled temporary file
+    with export_file(table, fmt, path) as f:
+        return f.read()
+
+def snapshot(dest, path=None):
+    # Copies the database to the file `dest` with SQLite's online backup
+    # API: the copy is a consistent snapshot taken in one read transaction,
+    # which WAL lets run alongside writers. The copy uses a rollback
+    # journal, so it is a single self-contained file, with the archived
+    # rows merged back into its tables.
+    path = path or db.db_path()
+    source = db.get_connection(path)
+    target = sqlite3.connect(dest, isolation_level=None)
+    try:
+        source.backup(target)
+        _merge_archive(target, db.archive_path(path))
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+
+def _merge_archive(target, archive_file):
+    # Read after the hot file was copied, the archive holds every row the
+    # copy lacks (rows are archived before they are deleted); rows in both
+    # are skipped. The copy's rollups and search index already count the
+    # archived rows, so its triggers are set aside while they go in.
+    target.execute("ATTACH DATABASE ? AS archive", (archive_file,))
+    try:
+        target.execute("BEGIN")
+        triggers = target.execute("SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger'").fetchall()
+        for name, _ in triggers:
+            target.execute(f"DROP TRIGGER main.{name}")
+        for table in db.ARCHIVED_TABLES:
+            columns = ", ".join(row[1] for row in target.execute(f"PRAGMA archive.table_info({table})"))
+            target.execute(f"INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM archive.{table}")
+        for _, sql in triggers:
+            target.execute(sql)
+        target.execute("COMMIT")
+    finally:
+        if target.in_transaction:
+            target.execute("ROLLBACK")
+        target.execute("DETACH DATABASE archive")
+
+def snapshot_bytes(path=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        dest = os.path.join(tmp, "snapshot.db")
+        snapshot(dest, path)
+        with open(dest, "rb") as f:
+            return f.read()
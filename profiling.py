@@ -0,0 +1,97 @@
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+
+# Opt-in profiling of a single app run. start() binds a Profile to the
+# calling context; while one is bound, every SQLite statement run through
+# database.py is recorded with its text, duration (execute plus fetches) and
+# row count, and section()/mark() record how long parts of the script take.
+# With no Profile bound all of this is a context variable lookup.
+
+SLOW_QUERY_MS = 50.0
+logger = logging.getLogger(__name__)
+
+# The Profile statements are recorded into. database.py carries it over to
+# the writer thread with each queued write.
+current = contextvars.ContextVar('profile', default=None)
+
+class Profile:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self.started = time.perf_counter()
+        self.finished = None
+        self.statements = []  # [sql, seconds, rows, thread]; updated as rows are fetched
+        self.sections = []  # (name, seconds)
+        self._mark = None
+
+    def statement(self, sql, seconds, rows):
+        entry = [sql, seconds, rows, threading.current_thread().name]
+        self.statements.append(entry)
+        return entry
+
+    def close_mark(self):
+        if self._mark is not None:
+            name, started = self._mark
+            self.sections.append((name, time.perf_counter() - started))
+            self._mark = None
+
+    def slow_queries(self):
+        return [s for s in self.to_dict()['statements'] if s['ms'] >= self.slow_query_ms]
+
+    def to_dict(self):
+        end = self.finished or time.perf_counter()
+        statements = [
+            {'sql': " ".join(sql.split()), 'ms': round(seconds * 1000, 3), 'rows': rows, 'thread': thread}
+            for sql, seconds, rows, thread in self.statements
+        ]
+        return {
+            'total_ms': round((end - self.started) * 1000, 3),
+            'sql_ms': round(sum(s['ms'] for s in statements), 3),
+            'slow_query_ms': self.slow_query_ms,
+            'sections': [{'name': name, 'ms': round(seconds * 1000, 3)} for name, seconds in self.sections],
+            'statements': statements,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+def start(slow_query_ms=SLOW_QUERY_MS):
+    # Starts profiling the calling context; returns the new Profile
+    profile = Profile(slow_query_ms)
+    current.set(profile)
+    return profile
+
+def stop():
+    # Ends the bound profile, logs its slow queries and returns it (or None)
+    profile = current.get()
+    if profile is None:
+        return None
+    current.set(None)
+    profile.close_mark()
+    profile.finished = time.perf_counter()
+    for s in profile.slow_queries():
+        logger.warning("slow query (%.1f ms, %d rows): %s", s['ms'], s['rows'], s['sql'])
+    return profile
+
+@contextlib.contextmanager
+def section(name):
+    profile = current.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.sections.append((name, time.perf_counter() - started))
+
+def mark(name):
+    # Starts a section that runs until the next mark() or stop(), for
+    # stretches of a script that are awkward to wrap in section()
+    profile = current.get()
+    if profile is not None:
+        profile.close_mark()
+        profile._mark = (name, time.perf_counter())
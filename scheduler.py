@@ -0,0 +1,243 @@
+import numpy as np
+
+# Scheduling models. Every review updates a problem's memory state for both
+# adaptive models (SM-2 ease/interval/repetitions and FSRS stability/
+# difficulty), so switching models never loses history; the active
+# scheduler then decides when the next revision is due.
+#
+# The update functions work on NumPy arrays as well as scalars: a single
+# review passes plain numbers, while rebuild_memory() and batch_due() run
+# them over the whole collection at once.
+
+# FSRS v4.5 default weights
+FSRS_WEIGHTS = np.array([0.4, 0.6, 2.4, 5.8, 4.93, 0.94, 0.86, 0.01, 1.49, 0.14, 0.94, 2.18, 0.05, 0.34, 1.26, 0.29, 2.61])
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 19 / 81
+MAX_INTERVAL_DAYS = 36500
+
+def quality_to_grade(quality):
+    # App quality (0-5) to FSRS grades: 1 again, 2 hard, 3 good, 4 easy
+    quality = np.asarray(quality)
+    return np.select([quality <= 1, quality <= 3, quality == 4], [1, 2, 3], 4)
+
+def sm2_update(ease, interval, reps, quality):
+    quality = np.asarray(quality, dtype=float)
+    passed = quality >= 3
+    grown = np.where(reps == 0, 1, np.where(reps == 1, 6, np.round(interval * ease)))
+    interval = np.where(passed, grown, 1)
+    reps = np.where(passed, reps + 1, 0)
+    ease = np.maximum(1.3, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return ease, interval, reps
+
+def fsrs_retrievability(elapsed, stability):
+    return (1 + FSRS_FACTOR * elapsed / stability) ** FSRS_DECAY
+
+def fsrs_update(stability, difficulty, elapsed, grade, w=FSRS_WEIGHTS):
+    # stability is NaN for problems that have never been reviewed
+    grade = np.asarray(grade)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        first = np.isnan(stability)
+        initial_stability = np.take(w, grade - 1)
+        initial_difficulty = np.clip(w[4] - (grade - 3) * w[5], 1, 10)
+
+        r = fsrs_retrievability(elapsed, stability)
+        # Difficulty moves with the grade and reverts towards the initial
+        # difficulty of a 'good' first review (w[4])
+        next_difficulty = np.clip(w[7] * w[4] + (1 - w[7]) * (difficulty - w[6] * (grade - 3)), 1, 10)
+        hard_penalty = np.where(grade == 2, w[15], 1)
+        easy_bonus = np.where(grade == 4, w[16], 1)
+        recall = stability * (np.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                              * (np.exp(w[10] * (1 - r)) - 1) * hard_penalty * easy_bonus + 1)
+        forget = w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1) * np.exp(w[14] * (1 - r))
+        next_stability = np.where(grade == 1, np.minimum(forget, stability), recall)
+
+    return (np.where(first, initial_stability, next_stability),
+            np.where(first, initial_difficulty, next_difficulty))
+
+def fsrs_interval(stability, desired_retention):
+    with np.errstate(invalid='ignore'):
+        days = stability / FSRS_FACTOR * (desired_retention ** (1 / FSRS_DECAY) - 1)
+    return np.clip(np.round(days), 1, MAX_INTERVAL_DAYS)
+
+MEMORY_FIELDS = ('ease', 'interval_days', 'reps', 'stability', 'memory_difficulty', 'last_review')
+
+def advance_memory(memory, quality, review_date):
+    # memory: mapping of MEMORY_FIELDS to arrays (stability/memory_difficulty
+    # NaN and last_review NaT before the first review); quality and
+    # review_date (datetime64[D]) are arrays or scalars. Returns the memory
+    # after the review; a missing quality counts as 'good' (4).
+    quality = np.asarray(quality, dtype=float)
+    quality = np.where(np.isnan(quality), 4, quality)
+    review_date = np.asarray(review_date, dtype='datetime64[D]')
+    last_review = np.asarray(memory['last_review'], dtype='datetime64[D]')
+
+    ease, interval, reps = sm2_update(memory['ease'], memory['interval_days'], memory['reps'], quality)
+    elapsed = np.where(np.isnat(last_review), 0, (review_date - last_review).astype(int))
+    stability, difficulty = fsrs_update(
+        np.asarray(memory['stability'], dtype=float), np.asarray(memory['memory_difficulty'], dtype=float),
+        np.maximum(elapsed, 0), quality_to_grade(quality)
+    )
+    return {
+        'ease': ease,
+        'interval_days': interval,
+        'reps': reps,
+        'stability': stability,
+        'memory_difficulty': difficulty,
+        'last_review': np.broadcast_to(review_date, np.shape(ease)),
+    }
+
+def update_memory(state, quality, review_date):
+    # Single-review form of advance_memory: state holds plain values (None
+    # for unset stability/difficulty/last_review) and so does the result.
+    memory = advance_memory({
+        'ease': state['ease'],
+        'interval_days': state['interval_days'],
+        'reps': state['reps'],
+        'stability': np.nan if state['stability'] is None else state['stability'],
+        'memory_difficulty': np.nan if state['memory_difficulty'] is None else state['memory_difficulty'],
+        'last_review': np.datetime64(state['last_review'] or 'NaT', 'D'),
+    }, np.nan if quality is None else quality, np.datetime64(review_date, 'D'))
+    return {
+        'ease': float(memory['ease']),
+        'interval_days': float(memory['interval_days']),
+        'reps': int(memory['reps']),
+        'stability': float(memory['stability']),
+        'memory_difficulty': float(memory['memory_difficulty']),
+        'last_review': review_date,
+    }
+
+def rebuild_memory(problem_ids, dates, qualities):
+    # Replays review history for the whole collection. Inputs are parallel
+    # arrays sorted by (problem, date); the loop runs once per review depth
+    # (the most reviews any problem has), each pass vectorized over every
+    # problem that has a review at that depth. Returns a dict of arrays
+    # indexed like np.unique(problem_ids).
+    problems, first_index, counts = np.unique(problem_ids, return_index=True, return_counts=True)
+    n = len(problems)
+    memory = {
+        'ease': np.full(n, 2.5),
+        'interval_days': np.zeros(n),
+        'reps': np.zeros(n, dtype=int),
+        'stability': np.full(n, np.nan),
+        'memory_difficulty': np.full(n, np.nan),
+        'last_review': np.full(n, np.datetime64('NaT'), dtype='datetime64[D]'),
+    }
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    qualities = np.asarray(qualities, dtype=float)
+
+    for depth in range(counts.max() if n else 0):
+        active = np.nonzero(counts > depth)[0]
+        rows = first_index[active] + depth
+        updated = advance_memory({key: values[active] for key, values in memory.items()}, qualities[rows], dates[rows])
+        for key, values in updated.items():
+            memory[key][active] = values
+
+    return {'problem_id': problems, **memory}
+
+class Scheduler:
+    # Interface: plan() places the next revision after a batch of reviews,
+    # batch_due() re-dates pending revisions after the parameters change.
+    name = None
+
+    def plan(self, state, success, review_date):
+        # state: mapping of arrays with step, anchor_date (datetime64[D]) and
+        # the memory fields after the review. Returns arrays due_date, step,
+        # anchor_date, restarted (the fixed schedule started over) and
+        # finished (no further revision).
+        raise NotImplementedError
+
+    def batch_due(self, frame):
+        raise NotImplementedError
+
+    def next_review(self, state, success, review_date):
+        # Single-review form of plan(): returns {'due_date', 'step',
+        # 'anchor_date', 'restarted'} as plain values, or None when the
+        # schedule is finished.
+        arrays = {key: np.asarray([value]) for key, value in state.items()}
+        arrays['anchor_date'] = np.asarray([state['anchor_date']], dtype='datetime64[D]')
+        plan = self.plan(arrays, success, np.datetime64(review_date, 'D'))
+        if plan['finished'][0]:
+            return None
+        return {
+            'due_date': plan['due_date'][0].astype(object),
+            'step': int(plan['step'][0]),
+            'anchor_date': plan['anchor_date'][0].astype(object),
+            'restarted': bool(plan['restarted'][0]),
+        }
+
+class FixedIntervalScheduler(Scheduler):
+    # The original schedule: revisions fall on anchor_date + intervals[step].
+    name = 'fixed'
+
+    def __init__(self, intervals, fail_behavior='short_repeat'):
+        self.intervals = intervals
+        self.fail_behavior = fail_behavior
+
+    def plan(self, state, success, review_date):
+        intervals = np.asarray(self.intervals)
+        step = np.asarray(state['step'])
+        anchor = np.asarray(state['anchor_date'], dtype='datetime64[D]')
+        no = np.zeros(step.shape, dtype=bool)
+        if not success:
+            if self.fail_behavior == 'restart':
+                # The intervals now count from the failure
+                return {'due_date': np.full(step.shape, review_date + intervals[0]), 'step': np.zeros_like(step),
+                        'anchor_date': np.full(step.shape, review_date), 'restarted': ~no, 'finished': no}
+            # Repeat the same step in 2 days; completing it moves on
+            return {'due_date': np.full(step.shape, review_date + 2), 'step': step,
+                    'anchor_date': anchor, 'restarted': no, 'finished': no}
+
+        next_step = step + 1
+        offsets = intervals[np.minimum(next_step, len(intervals) - 1)].astype('timedelta64[D]')
+        # Anchored to the schedule, but never on or before the review day
+        due = np.maximum(anchor + offsets, review_date + 1)
+        return {'due_date': due, 'step': next_step, 'anchor_date': anchor,
+                'restarted': no, 'finished': next_step >= len(intervals)}
+
+    def batch_due(self, frame):
+        # Re-dates pending revisions against the current intervals, with the
+        # same never-on-the-review-day rule as plan()
+        steps = np.minimum(frame['step'].to_numpy(), len(self.intervals) - 1)
+        offsets = np.asarray(self.intervals)[steps].astype('timedelta64[D]')
+        due = frame['anchor_date'].to_numpy(dtype='datetime64[D]') + offsets
+        last_review = frame['last_review'].to_numpy(dtype='datetime64[D]')
+        return np.where(np.isnat(last_review), due, np.maximum(due, last_review + 1))
+
+class _AdaptiveScheduler(Scheduler):
+    def plan(self, state, success, review_date):
+        # The memory in `state` already reflects the review, failures included
+        reps = np.asarray(state['reps'])
+        no = np.zeros(reps.shape, dtype=bool)
+        return {'due_date': review_date + self.interval(state).astype('timedelta64[D]'), 'step': reps,
+                'anchor_date': np.asarray(state['anchor_date'], dtype='datetime64[D]'),
+                'restarted': no, 'finished': no}
+
+    def batch_due(self, frame):
+        # Problems that were never reviewed keep their current due date
+        last_review = frame['last_review'].to_numpy(dtype='datetime64[D]')
+        due = last_review + self.interval(frame).astype('timedelta64[D]')
+        return np.where(np.isnat(last_review), frame['due_date'].to_numpy(dtype='datetime64[D]'), due)
+
+class SM2Scheduler(_AdaptiveScheduler):
+    name = 'sm2'
+
+    def interval(self, state):
+        return np.clip(np.asarray(state['interval_days'], dtype=float), 1, MAX_INTERVAL_DAYS)
+
+class FSRSScheduler(_AdaptiveScheduler):
+    name = 'fsrs'
+
+    def __init__(self, desired_retention=0.9):
+        self.desired_retention = desired_retention
+
+    def interval(self, state):
+        return fsrs_interval(np.asarray(state['stability'], dtype=float), self.desired_retention)
+
+SCHEDULERS = ('fixed', 'sm2', 'fsrs')
+
+def from_settings(settings):
+    if settings.scheduler == 'sm2':
+        return SM2Scheduler()
+    if settings.scheduler == 'fsrs':
+        return FSRSScheduler(settings.desired_retention)
+    return FixedIntervalScheduler(settings.intervals, settings.fail_behavior)
@@ -0,0 +1,62 @@
+import pytest
+import database as db
+import datetime
+
+def _review(problem_id, day, solved=True):
+    rev = db.get_due_page(datetime.date(2100, 1, 1), after=None, limit=1000)[0]
+    rev = next(r for r in rev if r['problem_id'] == problem_id)
+    if solved:
+        db.mark_revision_done(rev['id'], problem_id, day, quality=5)
+    else:
+        db.mark_revision_failed(rev['id'], problem_id, day)
+
+def _rollups():
+    conn = db.connection()
+    return (
+        [tuple(r) for r in conn.execute("SELECT * FROM history_daily ORDER BY day")],
+        [tuple(r) for r in conn.execute("SELECT * FROM problem_stats ORDER BY problem_id")],
+    )
+
+@pytest.fixture
+def reviewed(setup_db):
+    start = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array, hash-table", start)
+    db.add_problem("n-queens", "N-Queens", "Hard", "backtracking", start)
+    # Solves on Jan 2, 3, 4 and 7; a failure on Jan 3
+    _review("two-sum", datetime.date(2024, 1, 2))
+    _review("n-queens", datetime.date(2024, 1, 3), solved=False)
+    _review("two-sum", datetime.date(2024, 1, 3))
+    _review("n-queens", datetime.date(2024, 1, 4))
+    _review("two-sum", datetime.date(2024, 1, 7))
+    return start
+
+def test_streaks(reviewed):
+    stats = db.get_analytics_stats(datetime.date(2024, 1, 8))
+    assert stats['longest_streak'] == 3
+    assert stats['current_streak'] == 1
+
+    # A gap of more than a day ends the current streak
+    assert db.get_analytics_stats(datetime.date(2024, 1, 10))['current_streak'] == 0
+
+def test_retention_and_lag(reviewed):
+    stats = db.get_analytics_stats(datetime.date(2024, 1, 8))
+    assert stats['total_solved'] == 2
+    assert stats['total_reviews'] == 5
+    assert stats['retention'] == pytest.approx(4 / 5)
+    # two-sum: on time twice, then 3 days late (due Jan 4);
+    # n-queens: failed a day late (+1), its short repeat a day early (-1)
+    assert stats['avg_lag_days'] == pytest.approx((0 + 0 + 3 + 1 - 1) / 5)
+
+    by_difficulty = db.get_retention_by_difficulty().set_index('difficulty')
+    assert by_difficulty.loc['Hard', 'retention'] == pytest.approx(0.5)
+    tags = db.get_tag_stats().set_index('tag')
+    assert tags.loc['hash-table', 'solved'] == 3
+    assert tags.loc['backtracking', 'failed'] == 1
+
+def test_rollups_survive_delete_and_rebuild(reviewed):
+    db.delete_problem("n-queens")
+    incremental = _rollups()
+
+    db.rebuild_analytics()
+    assert _rollups() == incremental
+    assert db.get_analytics_stats(datetime.date(2024, 1, 8))['total_reviews'] == 3
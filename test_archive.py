@@ -0,0 +1,168 @@
+import pytest
+import database as db
+import archive
+import backup
+import datetime
+import export
+import os
+import sqlite3
+
+DAY = datetime.date(2024, 6, 1)
+START = DAY - datetime.timedelta(days=400)
+
+def _pending(problem_id):
+    return db.connection().execute(
+        "SELECT id FROM revisions WHERE problem_id=? AND status='pending'", (problem_id,)
+    ).fetchone()[0]
+
+def _rows(table):
+    return [tuple(row) for row in db.connection().execute(f"SELECT * FROM {table} ORDER BY 1")]
+
+def _rollups():
+    # daily_load keeps days that have emptied until it is rebuilt
+    return [_rows(table) for table in ("history_daily", "problem_stats", "(SELECT * FROM daily_load WHERE pending > 0)")]
+
+@pytest.fixture
+def reviewed(setup_db):
+    # Reviews spread over 400 days, archived when older than 100
+    db.set_config('archive_after_days', '100')
+    for problem_id in ("two-sum", "lru-cache", "word-ladder"):
+        db.add_problem(problem_id, problem_id.title(), "Medium", "array", START)
+        for offset in (1, 30, 200, 350, 390):
+            if problem_id == "lru-cache" and offset == 200:
+                db.mark_revision_failed(_pending(problem_id), problem_id, START + datetime.timedelta(days=offset))
+            else:
+                db.mark_revision_done(_pending(problem_id), problem_id, START + datetime.timedelta(days=offset), 4,
+                                      notes=f"review {offset}")
+
+def test_archive_moves_old_rows_and_keeps_rollups(reviewed):
+    history, revisions = _rows("history"), _rows("revisions")
+    rollups, stats = _rollups(), db.get_analytics_stats(DAY)
+
+    result = archive.archive_old(DAY, batch_rows=2, pause=0)
+    cutoff = DAY - datetime.timedelta(days=100)
+    assert result['rows'] == 9 + 9 and result['batches'] == 5
+
+    hot = db.get_history_df()
+    assert len(hot) == 6 and (hot['date'] >= cutoff).all()
+    assert db.get_archive_stats()['archive'] == {**db.get_archive_stats()['archive'], 'revisions': 9, 'history': 9}
+    # Pending revisions stay hot
+    assert (db.get_revisions_df()['status'] == 'pending').sum() == 3
+
+    # The unified views hold every row, and the rollups still count them all
+    assert _rows("all_history") == history and _rows("all_revisions") == revisions
+    assert len(db.get_history_df(archived=True)) == len(history)
+    assert _rollups() == rollups and db.get_analytics_stats(DAY) == stats
+    db.rebuild_analytics()
+    assert db.rebuild_daily_load() == 0
+    assert _rollups() == rollups
+
+    # Nothing left to move
+    assert archive.archive_old(DAY)['rows'] == 0
+
+def test_reviews_after_archiving(reviewed):
+    db.rebuild_memory_state()
+    memory = _rows("problems")
+    db.archive_batch(DAY - datetime.timedelta(days=100))
+    # Replaying the memory state reads archived history too
+    db.rebuild_memory_state()
+    assert _rows("problems") == memory
+
+    # New reviews are folded into the rollups on top of the archived ones
+    db.mark_revision_done(_pending("two-sum"), "two-sum", DAY, 5)
+    db.mark_revision_failed(_pending("lru-cache"), "lru-cache", DAY)
+    maintained = _rollups()
+    db.rebuild_analytics()
+    assert _rollups() == maintained
+    stats = {row['problem_id']: (row['solved'], row['failed'], row['last_result'])
+             for row in db.connection().execute("SELECT * FROM problem_stats")}
+    assert stats == {"two-sum": (6, 0, 'solved'), "lru-cache": (4, 2, 'failed'), "word-ladder": (5, 0, 'solved')}
+
+def test_interrupted_batch_is_finished(reviewed):
+    # A crash after the copy committed but before the hot rows were deleted
+    rollups = _rollups()
+    cutoff = DAY - datetime.timedelta(days=100)
+    db.connection().execute("INSERT INTO archive.history SELECT * FROM main.history WHERE date < ? LIMIT 4", (cutoff,))
+    assert len(_rows("all_history")) == 15 + 4
+
+    db.archive_batch(cutoff)
+    ids = [row[0] for row in _rows("all_history")]
+    assert len(ids) == len(set(ids)) == 15
+    assert _rollups() == rollups
+
+def test_delete_problem_clears_both_tiers(reviewed):
+    db.archive_batch(DAY - datetime.timedelta(days=100))
+    db.delete_problem("two-sum")
+    assert not [row for row in _rows("all_history") + _rows("all_revisions") if row[1] == "two-sum"]
+    maintained = _rollups()
+    db.rebuild_analytics()
+    assert _rollups() == maintained
+
+def test_exports_and_restores_see_both_tiers(reviewed, tmp_path):
+    snapshot = tmp_path / "before.db"
+    export.snapshot(snapshot)
+    history = _rows("history")
+    db.archive_batch(DAY - datetime.timedelta(days=100))
+
+    out = export.export_file("history")
+    assert len(out.read().decode().splitlines()) == 1 + len(history)
+
+    # The snapshot predates the archive run: its rows are hot again, once
+    db.restore_from(str(snapshot))
+    assert _rows("history") == history
+    assert _rows("all_history") == history
+
+def test_maybe_archive_runs_in_the_background_once(reviewed, monkeypatch):
+    monkeypatch.setattr(archive, "_last_run", {})
+    future = archive.maybe_archive()
+    assert future.result()['rows'] == 15 + 15  # everything is old by now
+    assert archive.maybe_archive() is None
+    assert db.get_history_df().empty
+
+def _found(query):
+    return sorted(row['problem_id'] for row in db.search_problems(query))
+
+def test_archived_notes_stay_searchable(reviewed):
+    # Only the archived reviews at offset 200 have this note
+    assert _found("review 200") == ["two-sum", "word-ladder"]
+    db.archive_batch(DAY - datetime.timedelta(days=100))
+    assert _found("review 200") == ["two-sum", "word-ladder"]
+    # A new note refreshes the hot notes; the archived ones stay
+    db.mark_revision_done(_pending("two-sum"), "two-sum", DAY, 4, notes="fresh")
+    assert _found("review 200") == ["two-sum", "word-ladder"] and _found("fresh") == ["two-sum"]
+    db.rebuild_search_index()
+    assert _found("review 200") == ["two-sum", "word-ladder"]
+
+def test_backups_keep_the_archive(reviewed, tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "backups"))
+    history, revisions, rollups = _rows("history"), _rows("revisions"), _rollups()
+    db.archive_batch(DAY - datetime.timedelta(days=100))
+    taken, _ = backup.take_backup()
+    assert os.path.exists(db.archive_path(taken.path))
+
+    db.delete_problem("two-sum")
+    backup.restore_backup(taken.name)
+    assert _rows("all_history") == history and _rows("all_revisions") == revisions
+    assert len(_rows("history")) < len(history)  # still archived
+    assert _rollups() == rollups
+    assert _found("review 200") == ["two-sum", "word-ladder"]
+
+    backup.prune_backups(keep_last=0, keep_daily=0)
+    assert os.listdir(backup.backup_dir()) == []
+
+def test_downloaded_snapshot_merges_the_archive(reviewed, tmp_path):
+    history, revisions = _rows("history"), _rows("revisions")
+    stats = _rows("problem_stats")
+    db.archive_batch(DAY - datetime.timedelta(days=100))
+    dest = tmp_path / "download.db"
+    dest.write_bytes(export.snapshot_bytes())
+
+    copy = sqlite3.connect(dest, detect_types=sqlite3.PARSE_DECLTYPES)
+    assert [tuple(row) for row in copy.execute("SELECT * FROM history ORDER BY 1")] == history
+    assert [tuple(row) for row in copy.execute("SELECT * FROM revisions ORDER BY 1")] == revisions
+    # The rollups were not counted twice, and the triggers are back
+    assert [tuple(row) for row in copy.execute("SELECT * FROM problem_stats ORDER BY 1")] == stats
+    assert copy.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0] == \
+        db.connection().execute("SELECT COUNT(*) FROM main.sqlite_master WHERE type = 'trigger'").fetchone()[0]
+    assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    copy.close()
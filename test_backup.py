@@ -0,0 +1,92 @@
+import pytest
+import database as db
+import backup
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+DAY = datetime.date(2024, 1, 10)
+UTC = datetime.timezone.utc
+
+@pytest.fixture
+def backups(setup_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path / "backups"))
+
+def _add(n, prefix="p"):
+    for i in range(n):
+        db.add_problem(f"{prefix}-{i}", f"Problem {i} " + "x" * 200, "Easy", "array", DAY)
+
+def _count(file):
+    conn = sqlite3.connect(file)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM problems").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_backup_and_restore(backups):
+    _add(10)
+    taken, stats = backup.take_backup(pages=1, pause=0)
+    assert stats['steps'] > 1 and stats['bytes'] > 0 and stats['mb_per_s'] > 0
+    assert backup.list_backups() == [taken]
+    assert _count(taken.path) == 10
+
+    _add(5, prefix="later")
+    db.set_config('scheduler', 'sm2')
+    safety = backup.restore_backup(taken.name)
+
+    assert len(db.get_all_problems_df()) == 10
+    assert db.get_settings().scheduler == 'fixed'
+    assert db.connection().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # The replaced data was kept, so the restore can be undone
+    assert _count(safety.path) == 15
+    with pytest.raises(ValueError):
+        backup.restore_backup("../../leetrepeat.db")
+
+def test_writes_proceed_during_backup(backups):
+    _add(300)
+    done = threading.Event()
+    def run():
+        backup.take_backup(pages=4, pause=0.02)
+        done.set()
+    thread = threading.Thread(target=run)
+    thread.start()
+
+    latencies = []
+    for i in range(5):
+        start = time.perf_counter()
+        db.add_problem(f"during-{i}", "", "Easy", "", DAY)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    assert not done.is_set()  # the writes really overlapped the backup
+    thread.join()
+
+    assert max(latencies) < 0.5
+    # The backup restarted after each write, so it holds every committed row
+    latest = backup.list_backups()[0]
+    assert _count(latest.path) == 305
+    conn = sqlite3.connect(latest.path)
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    conn.close()
+
+def test_retention(backups):
+    now = datetime.datetime(2024, 3, 10, 12, tzinfo=UTC)
+    times = [now - datetime.timedelta(hours=6 * i) for i in range(40)]  # four a day for ten days
+    directory = backup.backup_dir()
+    os.makedirs(directory)
+    for t in times:
+        open(os.path.join(directory, f"{t:%Y%m%dT%H%M%S%f}Z.db"), "w").close()
+
+    removed = backup.prune_backups(keep_last=3, keep_daily=5, now=now)
+    kept = [b.created for b in backup.list_backups()]
+    # The three newest, plus the newest of each of the last five days
+    newest_per_day = {max(t for t in times if t.date() == now.date() - datetime.timedelta(days=d)) for d in range(5)}
+    assert kept == sorted(set(times[:3]) | newest_per_day, reverse=True)
+    assert len(removed) == 40 - len(kept)
+
+def test_maybe_backup_respects_interval(backups):
+    future = backup.maybe_backup()
+    taken, _ = future.result()
+    assert backup.maybe_backup() is None
+    assert backup.maybe_backup(interval=datetime.timedelta(0)).result()[0].created > taken.created
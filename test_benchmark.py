@@ -0,0 +1,51 @@
+import database as db
+import benchmark
+
+def _snapshot():
+    return [df.drop(columns='id', errors='ignore').to_dict('records')
+            for df in (db.get_all_problems_df(), db.get_revisions_df(), db.get_history_df())]
+
+def test_generate_is_deterministic(setup_db):
+    n = benchmark.generate(db.DB_FILE, revisions=300, seed=1)
+    first = _snapshot()
+    assert n == 30 and len(first[0]) == 30
+    # One pending revision per problem, and no history after TODAY
+    pending = [r for r in first[1] if r['status'] == 'pending']
+    assert len(pending) == 30
+    assert all(h["date"] < benchmark.TODAY for h in first[2])
+
+    benchmark.generate(db.DB_FILE, revisions=300, seed=1)
+    assert _snapshot() == first
+    benchmark.generate(db.DB_FILE, revisions=300, seed=2)
+    assert _snapshot() != first
+
+def test_every_function_has_a_case(setup_db, tmp_path):
+    # Cases write snapshots and backups next to the database
+    benchmark.generate(str(tmp_path / "benchmark.db"), revisions=300)
+    timed = benchmark.cases()
+    assert benchmark.untimed_functions(timed) == []
+    # Rolled-back writes leave the data as it was
+    before = _snapshot()
+    for name, fn in timed.items():
+        if name not in ('submit_write', 'add_problem (committed)'):
+            fn()
+    assert _snapshot() == before
+
+def test_compare_flags_regressions():
+    rows = benchmark.compare(
+        {'fast': 0.0011, 'slow': 0.2, 'same': 0.1, 'new': 0.5},
+        {'fast': 0.0005, 'slow': 0.1, 'same': 0.11},
+    )
+    assert [(name, regressed) for name, _, _, regressed in rows] == [
+        ('fast', False),  # doubled, but by well under min_delta
+        ('slow', True),
+        ('same', False),
+        ('new', False),
+    ]
+
+def test_baselines_round_trip(tmp_path):
+    path = tmp_path / "baselines.json"
+    assert benchmark.load_baselines(path) == {}
+    benchmark.save_baseline("revisions=10", {'a': 0.1234567}, path)
+    benchmark.save_baseline("revisions=20", {'a': 0.2}, path)
+    assert benchmark.load_baselines(path) == {'revisions=10': {'a': 0.123457}, 'revisions=20': {'a': 0.2}}
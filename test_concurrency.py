@@ -0,0 +1,98 @@
+import pytest
+import database as db
+import datetime
+import io
+import os
+import threading
+import time
+
+DAY = datetime.date(2024, 1, 10)
+
+def test_writes_run_on_writer_thread(setup_db):
+    threads = []
+    original = db.add_problem.direct
+    def record(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return original(*args, **kwargs)
+    future = db.submit_write(record, "two-sum", "Two Sum", "Easy", "array", DAY)
+    assert future.result() is True
+    assert threads == ["db-writer"]
+    assert db.add_problem.submit("two-sum", "Two Sum", "Easy", "array", DAY).result() is False
+
+def test_queued_writes_share_a_commit(setup_db):
+    release = threading.Event()
+    blocker = db.submit_write(release.wait)
+    while not blocker.running():
+        time.sleep(0.001)
+    futures = [db.add_problem.submit(f"p-{i}", f"P{i}", "Easy", "", DAY) for i in range(20)]
+    futures.append(db.add_problem.submit("p-0", "Duplicate", "Easy", "", DAY))
+    futures.append(db.submit_write(db.set_config, 'fail_behavior', 'explode'))
+
+    generation = db._shard_generations[db.db_path()]
+    release.set()
+    blocker.result()
+    assert [f.result() for f in futures[:21]] == [True] * 20 + [False]
+    # A failing call only undoes itself
+    with pytest.raises(ValueError):
+        futures[-1].result()
+    # The 22 queued calls went in as one group commit
+    assert db._shard_generations[db.db_path()] == generation + 2
+    assert len(db.get_all_problems_df()) == 20
+
+def test_concurrent_reviewers_and_import(setup_db):
+    problems = [f"p-{i}" for i in range(120)]
+    db.bulk_import(io.StringIO("problem_id,date\n" + "\n".join(f"{p},2024-01-01" for p in problems) + "\n"))
+    revision_ids = db.get_revisions_df().set_index('problem_id')['id'].to_dict()
+
+    errors = []
+    def reviewer(worker):
+        try:
+            for i, problem_id in enumerate(problems[worker::8]):
+                if i % 3 == 2:
+                    db.mark_revision_failed(revision_ids[problem_id], problem_id, DAY)
+                else:
+                    db.mark_revision_done(revision_ids[problem_id], problem_id, DAY)
+                db.get_due_summary(DAY)
+                db.get_due_page(DAY)
+        except Exception as e:
+            errors.append(e)
+
+    def importer():
+        try:
+            csv = "problem_id,date\n" + "\n".join(f"imported-{i},2024-01-05" for i in range(500)) + "\n"
+            db.bulk_import(io.StringIO(csv), chunksize=50)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reviewer, args=(w,)) for w in range(8)]
+    threads.append(threading.Thread(target=importer))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert len(db.get_history_df()) == len(problems)
+    assert len(db.get_all_problems_df()) == len(problems) + 500
+    # Every reviewed problem has exactly one pending revision left
+    revisions = db.get_revisions_df()
+    pending = revisions[revisions['status'] == 'pending']
+    assert pending['problem_id'].is_unique and len(pending) == len(problems) + 500
+    assert db.rebuild_daily_load() == 0
+
+def test_short_lived_threads_do_not_leak_connections(setup_db):
+    # Streamlit runs every rerun on a new thread
+    def rerun():
+        db.get_due_page(DAY)
+        db.add_problem.submit(f"p-{threading.get_ident()}", "", "Easy", "", DAY).result()
+    def churn(n):
+        for _ in range(n):
+            thread = threading.Thread(target=rerun)
+            thread.start()
+            thread.join()
+
+    churn(5)
+    pooled, fds = len(db._pool), len(os.listdir("/proc/self/fd"))
+    churn(100)
+    assert len(db._pool) <= pooled
+    assert len(os.listdir("/proc/self/fd")) <= fds + 4
@@ -0,0 +1,50 @@
+import database as db
+import datetime
+import io
+
+def _exercise_write_paths(today):
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+    db.add_problem("lru-cache", "LRU Cache", "Medium", "design", today - datetime.timedelta(days=3))
+    db.add_problem("n-queens", "N-Queens", "Hard", "backtracking", today - datetime.timedelta(days=10))
+    db.bulk_import(io.StringIO("problem_id,difficulty,date\nword-ladder,Hard,2024-01-02\njump-game,,2024-01-05\n"))
+
+    due = {r['problem_id']: r for r in db.get_due_revisions(today + datetime.timedelta(days=1))}
+    db.mark_revision_done(due['two-sum']['id'], "two-sum", today + datetime.timedelta(days=1))
+    db.mark_revision_failed(due['lru-cache']['id'], "lru-cache", today)
+    db.snooze_revision(due['n-queens']['id'], 7)
+    db.set_config('fail_behavior', 'restart')
+    db.mark_revision_failed(due['word-ladder']['id'], "word-ladder", today)
+    db.update_problem("jump-game", {'title': 'Jump Game', 'difficulty': 'Medium', 'tags': '', 'date_added': today})
+    db.delete_problem("lru-cache")
+
+def test_daily_load_matches_schedule(setup_db):
+    today = datetime.date(2024, 1, 10)
+    _exercise_write_paths(today)
+
+    assert db.rebuild_daily_load() == 0
+
+def test_daily_load_rebuilt_on_interval_change(setup_db):
+    today = datetime.date(2024, 1, 10)
+    _exercise_write_paths(today)
+    db.set_config('intervals', '[2, 4, 8]')
+
+    assert db.rebuild_daily_load() == 0
+    # Every remaining problem has 3 or fewer occurrences left
+    assert sum(db.get_load_between(today - datetime.timedelta(days=30), today + datetime.timedelta(days=60)).values()) <= 3 * 4
+
+def test_rebuild_repairs_drift(setup_db):
+    today = datetime.date(2024, 1, 10)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+    db.connection().execute("UPDATE daily_load SET pending = pending + 5")
+    db.close_connections()  # drop cached reads
+
+    assert db.rebuild_daily_load() > 0
+    assert sum(db.get_load_between(today, today + datetime.timedelta(days=61)).values()) == 9
+
+def test_daily_load_by_difficulty(setup_db):
+    today = datetime.date(2024, 1, 10)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+    db.add_problem("n-queens", "N-Queens", "Hard", "backtracking", today)
+
+    rows = db.get_daily_load(today, today + datetime.timedelta(days=2))
+    assert rows == [(datetime.date(2024, 1, 11), 'Easy', 1), (datetime.date(2024, 1, 11), 'Hard', 1)]
@@ -0,0 +1,112 @@
+import pytest
+import database as db
+import datetime
+import subprocess
+import sys
+import threading
+
+def test_connection_reused_per_thread(setup_db):
+    assert db.connection() is db.connection()
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(db.connection()))
+    t.start()
+    t.join()
+    assert other[0] is not db.connection()
+
+def test_pragmas_applied(setup_db):
+    conn = db.connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+
+def test_transaction_rolls_back_on_error(setup_db):
+    today = datetime.date.today()
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+            raise RuntimeError("boom")
+
+    assert db.get_analytics_stats()['total_problems'] == 0
+
+def test_nested_calls_join_outer_transaction(setup_db):
+    today = datetime.date.today()
+    with db.transaction() as conn:
+        assert db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+        # Duplicate fails inside its own savepoint without aborting the outer transaction
+        assert not db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+        assert conn.in_transaction
+
+    assert db.get_analytics_stats()['total_problems'] == 1
+
+def test_settings_parsed_and_cached(setup_db):
+    settings = db.get_settings()
+    assert settings.intervals == (1, 2, 3, 5, 9, 15, 20, 30, 60)
+    assert settings.fail_behavior == 'short_repeat'
+    assert db.get_settings() is settings
+
+    db.set_config('intervals', '[1, 7]')
+    assert db.get_settings().intervals == (1, 7)
+    assert db.get_config('intervals') == '[1, 7]'
+
+def test_settings_see_changes_from_other_connections(setup_db):
+    db.get_settings()
+
+    # Another process writing through set_config's protocol
+    other = db.get_connection()
+    other.execute("UPDATE config SET value='restart' WHERE key='fail_behavior'")
+    other.execute("UPDATE config SET value = CAST(value AS INTEGER) + 1 WHERE key='generation'")
+    other.close()
+
+    assert db.get_settings().fail_behavior == 'restart'
+
+def test_set_config_validates(setup_db):
+    for key, value in [('intervals', 'not json'), ('intervals', '[]'), ('intervals', '5'), ('fail_behavior', 'explode'),
+                       ('archive_after_days', '0'), ('archive_after_days', 'soon')]:
+        with pytest.raises(ValueError):
+            db.set_config(key, value)
+    assert db.get_settings().fail_behavior == 'short_repeat'
+
+def test_reads_cached_until_next_write(setup_db):
+    today = datetime.date(2024, 1, 10)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+
+    df = db.get_all_problems_df()
+    assert db.get_all_problems_df() is df
+
+    db.add_problem("three-sum", "3Sum", "Medium", "array", today)
+    assert len(db.get_all_problems_df()) == 2
+
+def test_reads_see_commits_from_other_processes(setup_db):
+    today = datetime.date(2024, 1, 10)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today - datetime.timedelta(days=5))
+    assert db.get_due_summary(today)['overdue'] == 1
+
+    # Another app process on the same file
+    subprocess.run([sys.executable, "-c", (
+        "import datetime, database as db\n"
+        f"db.DB_FILE = {db.db_path()!r}\n"
+        "db.add_problem('lru-cache', 'LRU Cache', 'Medium', 'design', datetime.date(2024, 1, 1))\n"
+    )], check=True)
+    assert db.get_due_summary(today)['overdue'] == 2
+
+def test_problem_readers_leave_out_scheduler_state(setup_db):
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", datetime.date(2024, 1, 10))
+    for df in (db.get_all_problems_df(), db.filter_problems(tags=["array"])):
+        assert tuple(df.columns) == db.PROBLEM_COLUMNS
+
+def test_read_cache_is_bounded(setup_db, monkeypatch):
+    monkeypatch.setattr(db, "READ_CACHE_MAX_ENTRIES", 3)
+    start = datetime.date(2024, 1, 1)
+    for day in range(10):
+        db.get_due_summary(start + datetime.timedelta(days=day))
+    assert len(db._read_cache) == 3
+
+def test_reads_inside_transaction_not_cached(setup_db):
+    today = datetime.date(2024, 1, 10)
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+            assert len(db.get_all_problems_df()) == 1
+            raise RuntimeError("roll back")
+    assert db.get_all_problems_df().empty
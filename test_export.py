@@ -0,0 +1,68 @@
+import pytest
+import database as db
+import export
+import datetime
+import gzip
+import io
+import sqlite3
+import pandas as pd
+
+DAY = datetime.date(2024, 1, 10)
+
+@pytest.fixture
+def problems(setup_db):
+    for i in range(12):
+        db.add_problem(f"p-{i}", f"Problem, \"{i}\"", "Easy", "array,dp", DAY)
+    revisions = db.get_revisions_df()
+    db.mark_revision_done(int(revisions['id'][0]), revisions['problem_id'][0], DAY, 4)
+
+def test_csv_matches_table(problems):
+    for table, frame in [("problems", db.get_all_problems_df()), ("revisions", db.get_revisions_df()),
+                         ("history", db.get_history_df())]:
+        out = io.BytesIO()
+        assert export.export_table(table, out, chunksize=5) == len(frame)
+        exported = pd.read_csv(io.BytesIO(out.getvalue()))
+        pd.testing.assert_frame_equal(exported, pd.read_csv(io.StringIO(frame.to_csv(index=False))))
+
+def test_gzip_and_file(problems):
+    with export.export_file("problems", 'csv.gz') as f:
+        exported = pd.read_csv(io.BytesIO(gzip.decompress(f.read())))
+    assert exported['title'].tolist() == [f"Problem, \"{i}\"" for i in range(12)]
+
+def test_parquet(problems):
+    pytest.importorskip("pyarrow")
+    with export.export_file("revisions", 'parquet') as f:
+        exported = pd.read_parquet(f)
+    revisions = db.get_revisions_df()
+    assert exported['id'].tolist() == revisions['id'].tolist()
+    assert exported['due_date'].tolist() == revisions['due_date'].tolist()
+    assert str(exported['step'].dtype) == 'int64'
+
+def test_rejects_unknown_tables_and_formats(problems):
+    with pytest.raises(ValueError):
+        export.export_table("config; DROP TABLE problems", io.BytesIO())
+    with pytest.raises(ValueError):
+        export.export_table("problems", io.BytesIO(), 'xlsx')
+
+def test_downloads_are_accepted_by_streamlit(problems):
+    # What the Export page's download buttons hand to Streamlit
+    from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+    unsupported = TypeError("unsupported download data")
+    for fmt in export.available_formats():
+        data, _ = convert_data_to_bytes_and_infer_mime(export.export_bytes("problems", fmt), unsupported)
+        with export.export_file("problems", fmt) as f:
+            assert data == f.read()
+    data, _ = convert_data_to_bytes_and_infer_mime(export.snapshot_bytes(), unsupported)
+    assert data.startswith(b"SQLite format 3")
+
+def test_snapshot_is_a_standalone_copy(problems, tmp_path):
+    dest = tmp_path / "copy.db"
+    dest.write_bytes(export.snapshot_bytes())
+    # A write after the snapshot is not in it
+    db.add_problem("later", "Later", "Easy", "", DAY)
+
+    copy = sqlite3.connect(dest)
+    assert copy.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert copy.execute("SELECT COUNT(*) FROM problems").fetchone()[0] == 12
+    assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    copy.close()
@@ -0,0 +1,43 @@
+import database as db
+import datetime
+import io
+
+CSV = """problem_id,title,difficulty,tags,date
+two-sum,Two Sum,Easy,"array,hash-table",2024-01-05
+https://leetcode.com/problems/add-two-numbers/description/,Add Two Numbers,Medium,linked-list,
+,No Slug,Easy,,
+two-sum,Two Sum Again,Easy,,
+valid-parentheses,Valid Parentheses,Easy,stack,not-a-date
+"""
+
+def test_bulk_import_report(setup_db):
+    report = db.bulk_import(io.StringIO(CSV), datetime.date(2024, 2, 1))
+
+    assert report['inserted'] == 3
+    assert report['duplicates'] == ['two-sum']
+    assert report['invalid'] == [(4, 'missing problem_id')]
+
+    df = db.get_all_problems_df().set_index('problem_id')
+    assert df.loc['two-sum', 'date_added'] == datetime.date(2024, 1, 5)
+    # URL normalized to slug; missing and unparseable dates fall back to the default
+    assert df.loc['add-two-numbers', 'date_added'] == datetime.date(2024, 2, 1)
+    assert df.loc['valid-parentheses', 'date_added'] == datetime.date(2024, 2, 1)
+
+def test_bulk_import_matches_add_problem_schedule(setup_db):
+    day = datetime.date(2024, 1, 5)
+    db.add_problem("reference", "Reference", "Easy", "array", day)
+    db.bulk_import(io.StringIO("problem_id,date\nimported,2024-01-05\n"))
+
+    revisions = db.get_revisions_df()
+    expected = revisions[revisions['problem_id'] == 'reference']['due_date'].tolist()
+    imported = revisions[revisions['problem_id'] == 'imported']['due_date'].tolist()
+    assert imported == expected
+
+def test_bulk_import_skips_existing_across_chunks(setup_db):
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", datetime.date(2024, 1, 1))
+    csv = "problem_id\n" + "\n".join(["two-sum", "a", "b", "a", "c"]) + "\n"
+
+    report = db.bulk_import(io.StringIO(csv), chunksize=2)
+
+    assert report['inserted'] == 3
+    assert sorted(report['duplicates']) == ['a', 'two-sum']
@@ -0,0 +1,116 @@
+import database as db
+import datetime
+import os
+from conftest import TEST_DB
+
+def test_migrations_applied_once(setup_db):
+    assert db.get_schema_version() == len(db.MIGRATIONS)
+
+    # Running init_db again on a current DB is a no-op
+    db.init_db()
+    assert db.get_schema_version() == len(db.MIGRATIONS)
+
+def test_migrate_upgrades_old_db(setup_db):
+    # Rebuild the DB as it was before any migration: base schema only,
+    # with the full schedule stored as one pending row per interval
+    db.close_connections()
+    os.remove(TEST_DB)
+    conn = db.connection()
+    with open("db_schema.sql") as f:
+        conn.executescript(f.read())
+    conn.executemany("INSERT INTO config (key, value) VALUES (?, ?)", db.DEFAULT_CONFIG.items())
+    conn.execute("INSERT INTO problems (problem_id, title, date_added) VALUES ('two-sum', 'Two Sum', '2024-01-01')")
+    conn.execute("INSERT INTO revisions (problem_id, due_date, status) VALUES ('two-sum', '2024-01-02', 'done')")
+    for due in ['2024-01-03', '2024-01-04', '2024-01-06']:
+        conn.execute("INSERT INTO revisions (problem_id, due_date, status) VALUES ('two-sum', ?, 'pending')", (due,))
+    # The old code's rows for failures, with the default intervals [1, 2, 3, 5, 9, ...]:
+    legacy = {
+        # Failed on 01-02 (short_repeat added 01-04), then the next three done
+        'lru-cache': (['2024-01-02'], [('2024-01-02', 'done'), ('2024-01-04', 'done'), ('2024-01-03', 'done'),
+                                       ('2024-01-04', 'done'), ('2024-01-06', 'pending'), ('2024-01-10', 'pending'),
+                                       ('2024-03-01', 'pending')]),
+        # Failed the 01-06 review; its repeat on 01-08 comes before the 9-day one
+        'coin-change': (['2024-01-06'], [('2024-01-02', 'done'), ('2024-01-03', 'done'), ('2024-01-04', 'done'),
+                                         ('2024-01-06', 'done'), ('2024-01-08', 'pending'), ('2024-01-10', 'pending'),
+                                         ('2024-03-01', 'pending')]),
+        # Failed on 01-03 with restart: the intervals count from then, and one
+        # review of the new run is done
+        'word-ladder': (['2024-01-03'], [('2024-01-02', 'done'), ('2024-01-03', 'skipped'), ('2024-01-04', 'done'),
+                                         ('2024-01-05', 'pending'), ('2024-01-06', 'pending'),
+                                         ('2024-03-03', 'pending')]),
+    }
+    for problem_id, (failures, revisions) in legacy.items():
+        conn.execute("INSERT INTO problems (problem_id, title, date_added) VALUES (?, '', '2024-01-01')", (problem_id,))
+        conn.executemany("INSERT INTO history (problem_id, date, result, quality) VALUES (?, ?, 'failed', 0)",
+                         [(problem_id, day) for day in failures])
+        conn.executemany("INSERT INTO revisions (problem_id, due_date, status) VALUES (?, ?, ?)",
+                         [(problem_id, due, status) for due, status in revisions])
+
+    db.init_db()
+
+    indexes = {row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert "idx_revisions_status_due" in indexes
+    assert "idx_history_result" in indexes
+    assert db.get_schema_version() == len(db.MIGRATIONS)
+
+    pending = {row['problem_id']: (row['due_date'], row['step'], row['anchor_date']) for row in conn.execute(
+        "SELECT r.problem_id, r.due_date, r.step, p.anchor_date FROM revisions AS r "
+        "JOIN problems AS p ON p.problem_id = r.problem_id WHERE r.status='pending'"
+    )}
+    day = lambda d: datetime.date(2024, 1, d)
+    assert pending == {
+        'two-sum': (day(3), 1, day(1)),
+        'lru-cache': (day(6), 3, day(1)),
+        # Completing the repeat moves on to the 9-day review
+        'coin-change': (day(8), 3, day(1)),
+        'word-ladder': (day(5), 1, day(3)),
+    }
+    # Dates are now stored as day numbers, and the calendar rollup agrees
+    assert conn.execute(
+        "SELECT typeof(anchor_date), anchor_date + 0 FROM problems WHERE problem_id = 'two-sum'"
+    ).fetchone()[:] == ('integer', 19723)
+    assert db.rebuild_daily_load() == 0
+
+ROLLUP_TABLES = ("history_daily", "problem_stats")
+
+def _traced_statements(fn):
+    statements = []
+    conn = db.connection()
+    conn.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith(("SELECT", "DELETE", "UPDATE"))]
+
+def test_hot_queries_use_indexes(setup_db):
+    today = datetime.date.today()
+    for i in range(20):
+        db.add_problem(f"problem-{i}", f"Problem {i}", "Easy", "array", today)
+    db.mark_revision_done(1, "problem-0", today)
+
+    hot_paths = [
+        lambda: db.get_due_revisions(today + datetime.timedelta(days=5)),
+        lambda: db.get_counts_per_day(today.year, today.month),
+        lambda: db.get_due_summary(today),
+        lambda: db.get_daily_load(today, today + datetime.timedelta(days=365)),
+        lambda: db.get_due_page(today, after=(today, 3)),
+        lambda: db.get_analytics_stats(),
+        lambda: db.search_problems("prob"),
+        lambda: db.get_due_page(today, tags=["array"]),
+        lambda: db.filter_problems(tags=["array"], due_by=today),
+        lambda: db.delete_problem("problem-1"),
+    ]
+    conn = db.connection()
+    for path in hot_paths:
+        for sql in _traced_statements(path):
+            if "FROM problems" in sql and "COUNT(*)" in sql:
+                continue  # counting a whole table is a scan by definition
+            if "'problem_search_" in sql:
+                continue  # fts5 reading its own config and segment tables
+            plan = [row['detail'] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            # Table scans only; walking a subquery or json_each() is fine, and
+            # the small analytics rollups are meant to be aggregated whole
+            scans = [d for d in plan if d.startswith("SCAN") and "VIRTUAL TABLE" not in d and "(subquery" not in d
+                     and d.split()[1] not in ROLLUP_TABLES]
+            assert not scans, f"{sql.strip()} -> {plan}"
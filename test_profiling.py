@@ -0,0 +1,69 @@
+import pytest
+import database as db
+import datetime
+import json
+import logging
+import profiling
+
+DAY = datetime.date(2024, 1, 10)
+
+@pytest.fixture
+def profile(setup_db):
+    for i in range(5):
+        db.add_problem(f"p-{i}", f"P{i}", "Easy", "array", DAY)
+    db._bump_write_generation()
+    yield profiling.start(slow_query_ms=0)
+    profiling.stop()
+
+def test_statements_recorded_with_rows(profile):
+    db.get_all_problems_df()
+    cursor = db.connection().execute("SELECT problem_id FROM problems")
+    assert len(list(cursor)) == 5
+    db.connection().execute("UPDATE problems SET title = title WHERE problem_id IN ('p-0', 'p-1')")
+
+    statements = profile.to_dict()['statements']
+    assert [(s['sql'], s['rows']) for s in statements] == [
+        ("SELECT problem_id, title, difficulty, tags, date_added FROM problems", 5),
+        ("SELECT problem_id FROM problems", 5),
+        ("UPDATE problems SET title = title WHERE problem_id IN ('p-0', 'p-1')", 2),
+    ]
+    assert all(s['ms'] >= 0 for s in statements)
+
+def test_writes_profiled_on_writer_thread(profile):
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", DAY)
+    statements = profile.to_dict()['statements']
+    threads = {s['thread'] for s in statements}
+    assert threads == {"db-writer"}
+    sql = [s['sql'] for s in statements]
+    assert sql[0] == "BEGIN IMMEDIATE" and sql[-1] == "COMMIT"
+    assert any(s.startswith("INSERT INTO problems") for s in sql)
+
+def test_nothing_recorded_without_a_profile(profile):
+    profiling.stop()
+    db.get_due_page(DAY)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", DAY)
+    assert profile.statements == []
+    assert type(db.connection().execute("SELECT 1")) is db.sqlite3.Cursor
+
+def test_sections_marks_and_export(profile):
+    with profiling.section("sidebar"):
+        db.get_due_summary(DAY)
+    profiling.mark("page")
+    db.get_due_page(DAY)
+    profiling.stop()
+
+    report = json.loads(profile.to_json())
+    assert [s['name'] for s in report['sections']] == ["sidebar", "page"]
+    assert report['total_ms'] >= sum(s['ms'] for s in report['sections'])
+    assert report['sql_ms'] == pytest.approx(sum(s['ms'] for s in report['statements']), abs=0.01)
+
+def test_slow_queries_logged(profile, caplog):
+    profile.slow_query_ms = 0
+    db.get_all_problems_df()
+    with caplog.at_level(logging.WARNING, logger="profiling"):
+        profiling.stop()
+    assert len(profile.slow_queries()) == 1
+    assert "slow query" in caplog.text and "FROM problems" in caplog.text
+
+    profile.slow_query_ms = 10_000
+    assert profile.slow_queries() == []
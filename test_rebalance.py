@@ -0,0 +1,67 @@
+import pytest
+import database as db
+import datetime
+
+TODAY = datetime.date(2024, 3, 1)
+
+def _backlog(n, difficulty="Easy", added=TODAY - datetime.timedelta(days=10), prefix="p"):
+    for i in range(n):
+        db.add_problem(f"{prefix}-{i}", f"{prefix} {i}", difficulty, "array", added)
+
+def _pending_due():
+    revisions = db.get_revisions_df()
+    return revisions[revisions['status'] == 'pending'].set_index('problem_id')['due_date']
+
+def test_rebalance_spreads_backlog_under_capacity(setup_db):
+    db.set_config('scheduler', 'sm2')  # no projected steps; only the backlog counts
+    _backlog(25)
+
+    preview = db.rebalance(TODAY, capacity=10, horizon_days=7, dry_run=True)
+    assert len(preview) == 25
+    assert (_pending_due() < TODAY).all()  # dry run wrote nothing
+    # Previewing again is served from the read cache
+    assert db.rebalance(TODAY, capacity=10, horizon_days=7, dry_run=True) is preview
+
+    moves = db.rebalance(TODAY, capacity=10, horizon_days=7)
+    assert moves.equals(preview)
+    assert db.rebalance(TODAY, capacity=10, horizon_days=7, dry_run=True).empty
+    counts = db.get_load_between(TODAY, TODAY + datetime.timedelta(days=30))
+    assert counts == {TODAY: 10, TODAY + datetime.timedelta(days=1): 10, TODAY + datetime.timedelta(days=2): 5}
+    assert db.rebuild_daily_load() == 0
+
+def test_rebalance_priority(setup_db):
+    db.set_config('scheduler', 'sm2')
+    _backlog(2, "Easy", prefix="easy")
+    _backlog(2, "Hard", prefix="hard")
+    _backlog(1, "Easy", added=TODAY - datetime.timedelta(days=30), prefix="old")
+    _backlog(1, "Medium", prefix="failed")
+    failed = db.get_revisions_df().set_index('problem_id').loc["failed-0", 'id']
+    db.mark_revision_failed(int(failed), "failed-0", TODAY - datetime.timedelta(days=5))
+
+    db.rebalance(TODAY, capacity=2, horizon_days=5)
+    due = _pending_due()
+    assert due["failed-0"] == TODAY
+    assert due["hard-0"] == TODAY
+    assert due["hard-1"] == TODAY + datetime.timedelta(days=1)
+    # Among equally difficult problems the longest overdue goes first
+    assert due["old-0"] == TODAY + datetime.timedelta(days=1)
+    assert due["easy-0"] == due["easy-1"] == TODAY + datetime.timedelta(days=2)
+
+def test_rebalance_never_moves_earlier_and_counts_projections(setup_db):
+    # Fixed schedule: the projected steps of problems added today use capacity too
+    _backlog(3, added=TODAY, prefix="new")
+    _backlog(4, added=TODAY + datetime.timedelta(days=2), prefix="later")
+
+    before = _pending_due()
+    moves = db.rebalance(TODAY, capacity=3, horizon_days=5)
+    after = _pending_due()
+    assert (after >= before).all()
+    # Days 1-5 are already full with the new problems and projected steps
+    assert set(moves['problem_id']) == {f"later-{i}" for i in range(4)}
+    assert (moves['new_due_date'] > TODAY + datetime.timedelta(days=5)).all()
+    assert db.rebuild_daily_load() == 0
+
+def test_rebalance_validates_arguments(setup_db):
+    with pytest.raises(ValueError):
+        db.rebalance(TODAY, capacity=0)
+    assert db.rebalance(TODAY, capacity=5).empty
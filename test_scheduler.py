@@ -0,0 +1,123 @@
+import pytest
+import database as db
+import scheduler
+import datetime
+import time
+import numpy as np
+import pandas as pd
+
+def _pending(problem_id):
+    revisions = db.get_revisions_df()
+    return revisions[(revisions['problem_id'] == problem_id) & (revisions['status'] == 'pending')].iloc[0]
+
+def _review(problem_id, day, quality):
+    revision = _pending(problem_id)
+    if quality == 0:
+        db.mark_revision_failed(int(revision['id']), problem_id, day)
+    else:
+        db.mark_revision_done(int(revision['id']), problem_id, day, quality)
+
+def test_sm2_intervals_follow_quality(setup_db):
+    db.set_config('scheduler', 'sm2')
+    day = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", day)
+
+    # 1 day, 6 days, then interval * ease
+    expected = [1, 6, 16]
+    for gap in expected:
+        day = _pending("two-sum")['due_date']
+        _review("two-sum", day, 5)
+        assert _pending("two-sum")['due_date'] == day + datetime.timedelta(days=gap)
+
+    # A lapse starts the repetitions over
+    day = _pending("two-sum")['due_date']
+    _review("two-sum", day, 0)
+    assert _pending("two-sum")['due_date'] == day + datetime.timedelta(days=1)
+
+def test_fsrs_grows_with_recall_and_shrinks_on_lapse(setup_db):
+    db.set_config('scheduler', 'fsrs')
+    day = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", day)
+
+    gaps = []
+    for quality in [4, 4, 4, 0]:
+        day = _pending("two-sum")['due_date']
+        _review("two-sum", day, quality)
+        gaps.append((_pending("two-sum")['due_date'] - day).days)
+    assert gaps[0] < gaps[1] < gaps[2]
+    assert gaps[3] < gaps[2]
+
+def test_replayed_memory_matches_incremental(setup_db):
+    day = datetime.date(2024, 1, 1)
+    for name in ["a", "b", "c"]:
+        db.add_problem(name, name, "Easy", "", day)
+    for offset, (name, quality) in enumerate([("a", 5), ("b", 0), ("a", 3), ("c", 4), ("a", 0), ("b", 5)]):
+        _review(name, day + datetime.timedelta(days=offset + 1), quality)
+
+    sql = "SELECT problem_id, ease, interval_days, reps, stability, memory_difficulty, last_review FROM problems ORDER BY problem_id"
+    incremental = pd.read_sql_query(sql, db.connection())
+    db.rebuild_memory_state()
+    replayed = pd.read_sql_query(sql, db.connection())
+    pd.testing.assert_frame_equal(incremental, replayed)
+
+def test_switching_scheduler_reschedules_pending(setup_db):
+    day = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", day)
+    _review("two-sum", datetime.date(2024, 1, 2), 5)
+    fixed_due = _pending("two-sum")['due_date']
+
+    db.set_config('scheduler', 'fsrs')
+    fsrs_due = _pending("two-sum")['due_date']
+    assert fsrs_due != fixed_due
+    db.set_config('desired_retention', '0.7')
+    assert _pending("two-sum")['due_date'] > fsrs_due
+
+    # Adaptive schedules have no projected steps; the rollup follows the switch
+    assert db.rebuild_daily_load() == 0
+    assert sum(count for *_, count in db.get_daily_load(day, day + datetime.timedelta(days=365))) == 1
+
+    db.set_config('scheduler', 'fixed')
+    assert _pending("two-sum")['due_date'] == fixed_due
+    assert db.rebuild_daily_load() == 0
+
+def test_scheduler_settings_saved_together_reschedule_once(setup_db, monkeypatch):
+    day = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", day)
+    _review("two-sum", datetime.date(2024, 1, 2), 5)
+    calls = []
+    reschedule = db._reschedule
+    monkeypatch.setattr(db, "_reschedule", lambda conn: calls.append(conn) or reschedule(conn))
+    db.set_configs({'scheduler': 'fsrs', 'desired_retention': '0.7'})
+    assert len(calls) == 1
+    settings = db.get_settings()
+    assert (settings.scheduler, settings.desired_retention) == ('fsrs', 0.7)
+
+    # One invalid value saves none of them
+    with pytest.raises(ValueError):
+        db.set_configs({'scheduler': 'sm2', 'desired_retention': '1.5'})
+    assert db.get_settings().scheduler == 'fsrs'
+
+def test_invalid_scheduler_settings_rejected(setup_db):
+    for key, value in [('scheduler', 'leitner'), ('desired_retention', '1.5'), ('desired_retention', 'high')]:
+        with pytest.raises(ValueError):
+            db.set_config(key, value)
+
+def test_batch_due_is_vectorized():
+    n = 100_000
+    rng = np.random.default_rng(0)
+    last_review = np.datetime64('2024-01-01') + rng.integers(0, 365, n).astype('timedelta64[D]')
+    frame = pd.DataFrame({
+        'due_date': last_review + 1,
+        'step': rng.integers(0, 9, n),
+        'anchor_date': last_review - 30,
+        'interval_days': rng.uniform(1, 100, n),
+        'stability': rng.uniform(0.5, 200, n),
+        'last_review': last_review,
+    })
+
+    start = time.perf_counter()
+    for model in [scheduler.FixedIntervalScheduler((1, 2, 3, 5, 9, 15, 20, 30, 60)),
+                  scheduler.SM2Scheduler(), scheduler.FSRSScheduler(0.9)]:
+        due = model.batch_due(frame)
+        assert len(due) == n and not np.isnat(due).any()
+    assert time.perf_counter() - start < 1.0
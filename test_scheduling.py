@@ -1,31 +1,11 @@
 import pytest
 import database as db
-import os
 import datetime
 import json
-
-# Use a temporary DB for testing
-TEST_DB = "test_leetrepeat.db"
-
-@pytest.fixture
-def setup_db():
-    # Override DB_FILE in database module for testing
-    # This is a bit hacky, better to have a class or pass db path, but for this script it works if we patch it or just swap the variable
-    original_db = db.DB_FILE
-    db.DB_FILE = TEST_DB
-    
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
-        
-    db.init_db()
-    yield
-    
-    db.DB_FILE = original_db
-    if os.path.exists(TEST_DB):
-        os.remove(TEST_DB)
+import pandas as pd
 
 def test_add_problem_scheduling(setup_db):
-    # Test that adding a problem creates revisions
+    # Test that adding a problem schedules its first revision
     today = datetime.date.today()
     db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
     
@@ -35,13 +15,82 @@ def test_add_problem_scheduling(setup_db):
     revisions = cursor.fetchall()
     conn.close()
     
-    # Default intervals: [1, 2, 3, 5, 9, 15, 20, 30, 60] -> 9 revisions
-    assert len(revisions) == 9
+    # Only the next revision is stored; the rest of the schedule is projected
+    assert len(revisions) == 1
+    assert revisions[0]['step'] == 0
     
     # Check first revision due date (today + 1)
-    first_due = datetime.datetime.strptime(revisions[0]['due_date'], '%Y-%m-%d').date()
+    first_due = revisions[0]['due_date']
     assert first_due == today + datetime.timedelta(days=1)
 
+def test_schedule_projection(setup_db):
+    today = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+    
+    # Default intervals: [1, 2, 3, 5, 9, 15, 20, 30, 60] -> 9 occurrences
+    load = db.get_load_between(today, today + datetime.timedelta(days=61))
+    assert sum(load.values()) == 9
+    expected = {today + datetime.timedelta(days=d) for d in [1, 2, 3, 5, 9, 15, 20, 30, 60]}
+    assert set(load) == expected
+
+def test_done_schedules_next_step(setup_db):
+    today = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+    
+    rev = db.get_due_revisions(today + datetime.timedelta(days=1))[0]
+    db.mark_revision_done(rev['id'], "two-sum", today + datetime.timedelta(days=1))
+    
+    pending = db.get_due_revisions(today + datetime.timedelta(days=100))
+    assert len(pending) == 1
+    assert pending[0]['step'] == 1
+    assert pending[0]['due_date'] == today + datetime.timedelta(days=2)
+    
+    # Completing late never schedules the next step in the past
+    db.mark_revision_done(pending[0]['id'], "two-sum", today + datetime.timedelta(days=10))
+    pending = db.get_due_revisions(today + datetime.timedelta(days=100))
+    assert pending[0]['step'] == 2
+    assert pending[0]['due_date'] == today + datetime.timedelta(days=11)
+
+def test_last_step_finishes_schedule(setup_db):
+    db.set_config('intervals', '[1, 2]')
+    today = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
+    for _ in range(2):
+        rev = db.get_due_revisions(today + datetime.timedelta(days=30))[0]
+        db.mark_revision_done(rev['id'], "two-sum", rev['due_date'])
+    
+    assert db.get_due_revisions(today + datetime.timedelta(days=365)) == []
+
+def test_fail_behavior_restart(setup_db):
+    db.set_config('fail_behavior', 'restart')
+    start = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", start)
+    rev = db.get_due_revisions(start + datetime.timedelta(days=1))[0]
+    db.mark_revision_done(rev['id'], "two-sum", start + datetime.timedelta(days=1))
+    
+    failed_on = start + datetime.timedelta(days=2)
+    rev = db.get_due_revisions(failed_on)[0]
+    db.mark_revision_failed(rev['id'], "two-sum", failed_on)
+    
+    pending = db.get_due_revisions(failed_on + datetime.timedelta(days=100))
+    assert len(pending) == 1
+    assert pending[0]['step'] == 0
+    assert pending[0]['due_date'] == failed_on + datetime.timedelta(days=1)
+
+def test_update_problem_date_resets_schedule(setup_db):
+    start = datetime.date(2024, 1, 1)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", start)
+    new_date = datetime.date(2024, 3, 1)
+    
+    # Title-only edits keep the schedule
+    db.update_problem("two-sum", {'title': 'Renamed', 'difficulty': 'Easy', 'tags': 'array', 'date_added': start})
+    assert db.get_due_revisions(start + datetime.timedelta(days=1))[0]['title'] == 'Renamed'
+    
+    db.update_problem("two-sum", {'title': 'Renamed', 'difficulty': 'Easy', 'tags': 'array', 'date_added': new_date})
+    pending = db.get_due_revisions(new_date + datetime.timedelta(days=100))
+    assert len(pending) == 1
+    assert pending[0]['due_date'] == new_date + datetime.timedelta(days=1)
+
 def test_mark_done(setup_db):
     today = datetime.date.today()
     db.add_problem("two-sum", "Two Sum", "Easy", "array", today)
@@ -89,7 +138,7 @@ def test_fail_behavior_short_repeat(setup_db):
     cursor.execute("SELECT * FROM revisions WHERE problem_id='two-sum' ORDER BY id DESC LIMIT 1")
     last_rev = cursor.fetchone()
     
-    due_date = datetime.datetime.strptime(last_rev['due_date'], '%Y-%m-%d').date()
+    due_date = last_rev['due_date']
     assert due_date == today + datetime.timedelta(days=2)
     
     # Check history
@@ -97,3 +146,102 @@ def test_fail_behavior_short_repeat(setup_db):
     history = cursor.fetchall()
     assert len(history) == 1
     conn.close()
+
+def test_due_summary(setup_db):
+    today = datetime.date(2024, 1, 10)
+    db.add_problem("overdue-easy", "A", "Easy", "", today - datetime.timedelta(days=5))
+    db.add_problem("today-hard", "B", "Hard", "", today - datetime.timedelta(days=1))
+    db.add_problem("upcoming-hard", "C", "Hard", "", today + datetime.timedelta(days=2))
+    db.add_problem("far-away", "D", "Hard", "", today + datetime.timedelta(days=30))
+    
+    summary = db.get_due_summary(today)
+    assert (summary['overdue'], summary['due_today'], summary['upcoming']) == (1, 1, 1)
+    assert summary['by_difficulty']['Easy'] == {'overdue': 1, 'due_today': 0, 'upcoming': 0}
+    assert summary['by_difficulty']['Hard'] == {'overdue': 0, 'due_today': 1, 'upcoming': 1}
+
+def test_due_page_keyset_pagination(setup_db):
+    today = datetime.date(2024, 1, 10)
+    for i in range(7):
+        db.add_problem(f"p-{i}", f"P{i}", "Hard" if i % 2 else "Easy", "graph, dp" if i < 3 else "array",
+                       today - datetime.timedelta(days=i + 1))
+    
+    seen = []
+    after = None
+    while True:
+        rows, has_more = db.get_due_page(today, after=after, limit=3)
+        seen.extend(r['problem_id'] for r in rows)
+        if not has_more:
+            break
+        after = (rows[-1]['due_date'], rows[-1]['id'])
+    # Oldest due first, every row exactly once
+    assert seen == [f"p-{i}" for i in reversed(range(7))]
+
+def test_due_page_filters(setup_db):
+    today = datetime.date(2024, 1, 10)
+    for i in range(7):
+        db.add_problem(f"p-{i}", f"P{i}", "Hard" if i % 2 else "Easy", "graph, dp" if i < 3 else "array",
+                       today - datetime.timedelta(days=i + 1))
+    
+    rows, _ = db.get_due_page(today, mode='today')
+    assert [r['problem_id'] for r in rows] == ["p-0"]
+    rows, _ = db.get_due_page(today, mode='overdue', difficulties=["Hard"])
+    assert sorted(r['problem_id'] for r in rows) == ["p-1", "p-3", "p-5"]
+    rows, _ = db.get_due_page(today, tags=["dp"])
+    assert sorted(r['problem_id'] for r in rows) == ["p-0", "p-1", "p-2"]
+
+def _bulk_fixture(prefix="p"):
+    day = datetime.date(2024, 1, 1)
+    for i in range(4):
+        db.add_problem(f"{prefix}-{i}", f"P{i}", "Easy", "array", day)
+    revisions = db.get_revisions_df()
+    return dict(zip(revisions['problem_id'], revisions['id'].tolist()))
+
+def _state(prefix):
+    # Revisions, history and problems of one fixture, comparable across prefixes
+    frames = []
+    for df, order in [(db.get_revisions_df(), ['problem_id', 'status', 'due_date']),
+                      (db.get_history_df(), ['problem_id']),
+                      (pd.read_sql_query("SELECT * FROM problems", db.connection()), ['problem_id'])]:
+        df = df[df['problem_id'].str.startswith(prefix + "-")].drop(columns=['id'], errors='ignore')
+        df = df.assign(problem_id=df['problem_id'].str[len(prefix):])
+        frames.append(df.sort_values(order).reset_index(drop=True))
+    return frames
+
+@pytest.mark.parametrize("scheduler, fail_behavior", [("fixed", "short_repeat"), ("fixed", "restart"), ("fsrs", "short_repeat")])
+def test_bulk_actions_match_single_actions(setup_db, scheduler, fail_behavior):
+    db.set_config('scheduler', scheduler)
+    db.set_config('fail_behavior', fail_behavior)
+    day = datetime.date(2024, 1, 3)
+
+    ids = _bulk_fixture("single")
+    db.mark_revision_done(ids["single-0"], "single-0", day, 4)
+    db.mark_revision_done(ids["single-1"], "single-1", day, 4)
+    db.mark_revision_failed(ids["single-2"], "single-2", day)
+    db.mark_revision_failed(ids["single-3"], "single-3", day)
+
+    ids = _bulk_fixture("bulk")
+    assert db.mark_revisions_done([ids["bulk-0"], ids["bulk-1"]], day, 4) == 2
+    assert db.mark_revisions_failed([ids["bulk-2"], ids["bulk-3"]], day) == 2
+
+    for bulk, single in zip(_state("bulk"), _state("single")):
+        pd.testing.assert_frame_equal(bulk, single)
+    assert db.rebuild_daily_load() == 0
+
+def test_bulk_ignores_non_pending(setup_db):
+    ids = _bulk_fixture()
+    day = datetime.date(2024, 1, 2)
+    assert db.mark_revisions_done([ids["p-0"]], day) == 1
+    # Already done: no second history row or next revision
+    assert db.mark_revisions_done([ids["p-0"], 9999], day) == 0
+    assert len(db.get_history_df()) == 1
+    assert db.mark_revisions_done([], day) == 0
+
+def test_snooze_revisions_in_sql(setup_db):
+    ids = _bulk_fixture()
+    assert db.snooze_revisions([ids["p-0"], ids["p-1"]], 7) == 2
+    db.snooze_revision(ids["p-2"], -1)
+    due = db.get_revisions_df().set_index('problem_id')['due_date']
+    assert due["p-0"] == due["p-1"] == datetime.date(2024, 1, 9)
+    assert due["p-2"] == datetime.date(2024, 1, 1)
+    assert due["p-3"] == datetime.date(2024, 1, 2)
+    assert db.rebuild_daily_load() == 0
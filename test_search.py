@@ -0,0 +1,77 @@
+import pytest
+import database as db
+import datetime
+import io
+
+DAY = datetime.date(2024, 1, 10)
+
+def _ids(query, limit=20):
+    return [row['problem_id'] for row in db.search_problems(query, limit)]
+
+@pytest.fixture
+def problems(setup_db):
+    db.add_problem("two-sum", "Two Sum", "Easy", "array,hash-table", DAY)
+    db.add_problem("3sum", "3Sum", "Medium", "array,two-pointers", DAY)
+    db.add_problem("lru-cache", "LRU Cache", "Medium", "design,hash-table", DAY)
+    db.add_problem("sum-of-two-integers", "Sum of Two Integers", "Medium", "bit-manipulation", DAY)
+
+def test_prefix_search_and_ranking(problems):
+    assert _ids("two su")[:2] == ["two-sum", "sum-of-two-integers"]
+    assert set(_ids("two su")) == {"two-sum", "sum-of-two-integers"}
+    assert set(_ids("hash")) == {"two-sum", "lru-cache"}
+    assert _ids("LRU") == ["lru-cache"]
+    assert _ids("pointer") == ["3sum"]
+    assert _ids("nothing here") == []
+    assert len(_ids("sum", limit=1)) == 1
+
+def test_empty_query_lists_recent_problems(problems):
+    assert _ids("") == ["sum-of-two-integers", "lru-cache", "3sum", "two-sum"]
+    assert _ids("  ,; ", limit=2) == ["sum-of-two-integers", "lru-cache"]
+
+def test_query_syntax_is_not_interpreted(problems):
+    for query in ['"', "two AND", "NOT sum", "sum*", "title:two", "(two", "-two", "NEAR(two sum)"]:
+        db.search_problems(query)  # no fts5 syntax errors
+    assert _ids('"two" OR "lru"') == []  # every word must match
+
+def test_index_follows_edits(problems):
+    db.update_problem("lru-cache", {'title': "Least Recently Used Cache", 'difficulty': "Medium",
+                                    'tags': "linked-list", 'date_added': DAY})
+    assert _ids("least") == ["lru-cache"]
+    assert _ids("design") == []
+
+    revision = db.get_revisions_df().set_index('problem_id').loc["3sum", 'id']
+    db.mark_revision_done(int(revision), "3sum", DAY, 4, notes="Sort first, then sweep with two pointers")
+    assert _ids("sweep") == ["3sum"]
+
+    db.delete_problem("3sum")
+    assert _ids("sweep") == [] and _ids("pointer") == []
+
+    db.bulk_import(io.StringIO("problem_id,title,tags\nvalid-anagram,Valid Anagram,string\n"), DAY)
+    assert _ids("anagr") == ["valid-anagram"]
+
+def _index(conn):
+    return sorted(tuple(row) for row in conn.execute(
+        "SELECT s.problem_id, s.title, s.tags, s.notes, d.doc FROM problem_search AS s "
+        "JOIN search_docs AS d ON d.doc = s.rowid"
+    ))
+
+def test_rebuild_matches_triggers(problems):
+    revision = db.get_revisions_df().set_index('problem_id').loc["two-sum", 'id']
+    db.mark_revision_done(int(revision), "two-sum", DAY, 4, notes="hash map of complements")
+    conn = db.connection()
+    maintained = [row[:4] for row in _index(conn)]
+    db.rebuild_search_index()
+    assert [row[:4] for row in _index(conn)] == maintained
+    assert _ids("complement") == ["two-sum"]
+
+def test_migration_indexes_existing_problems(setup_db):
+    db.add_problem("two-sum", "Two Sum", "Easy", "array", DAY)
+    conn = db.connection()
+    for statement in ("DROP TABLE problem_search", "DROP TABLE search_docs",
+                      *(f"DROP TRIGGER {row[0]}" for row in conn.execute(
+                          "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'search_%'").fetchall())):
+        conn.execute(statement)
+    conn.execute("UPDATE history SET notes = NULL")
+    for statement in db.MIGRATIONS[6]:  # migration 7
+        conn.execute(statement)
+    assert _ids("two") == ["two-sum"]
@@ -0,0 +1,78 @@
+import pytest
+import database as db
+import datetime
+import threading
+
+DAY = datetime.date(2024, 1, 10)
+
+@pytest.fixture
+def shard_dir(setup_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "SHARD_DIR", str(tmp_path))
+    yield tmp_path
+    db.set_current_user(None)
+
+def test_users_get_isolated_shards(shard_dir):
+    with db.user_scope("alice"):
+        db.add_problem("two-sum", "Two Sum", "Easy", "array", DAY)
+        db.set_config('scheduler', 'sm2')
+        alice_problems = db.get_all_problems_df()
+    with db.user_scope("bob"):
+        assert db.get_all_problems_df().empty
+        assert db.get_settings().scheduler == 'fixed'
+        db.add_problem("two-sum", "Two Sum (bob)", "Easy", "array", DAY)
+
+    assert len(alice_problems) == 1
+    # No user: the shared DB_FILE, untouched by either
+    assert db.get_all_problems_df().empty
+    assert sorted(p.name for p in shard_dir.glob("*.db")) == ["alice.db", "bob.db"]
+    with db.user_scope("alice"):
+        assert db.get_all_problems_df()['title'].tolist() == ["Two Sum"]
+
+def test_writer_routes_each_job_to_its_user(shard_dir):
+    users = [f"user-{i}" for i in range(4)]
+    for user in users:
+        db.set_current_user(user)
+    futures = []
+    for i in range(40):
+        with db.user_scope(users[i % 4]):
+            futures.append(db.add_problem.submit(f"p-{i}", f"P{i}", "Easy", "", DAY))
+    assert all(f.result() for f in futures)
+
+    for n, user in enumerate(users):
+        with db.user_scope(user):
+            assert sorted(db.get_all_problems_df()['problem_id']) == sorted(f"p-{i}" for i in range(n, 40, 4))
+
+def test_shard_pool_is_bounded(shard_dir, monkeypatch):
+    monkeypatch.setattr(db, "SHARD_POOL_SIZE", 3)
+    for i in range(10):
+        with db.user_scope(f"user-{i}"):
+            db.add_problem("two-sum", "Two Sum", "Easy", "array", DAY)
+            db.get_due_page(DAY)
+    assert len(db._local.conns) <= 3
+
+    # Evicted shards reopen transparently
+    with db.user_scope("user-0"):
+        assert len(db.get_all_problems_df()) == 1
+
+def test_invalid_user_ids_rejected(shard_dir):
+    for user in ["../escape", "", "a/b", ".hidden", "x" * 65, 42]:
+        with pytest.raises(ValueError):
+            db.set_current_user(user)
+    assert db.db_path() == db.DB_FILE
+
+def test_threads_route_independently(shard_dir):
+    errors = []
+    def worker(user):
+        try:
+            db.set_current_user(user)
+            for i in range(20):
+                db.add_problem(f"{user}-{i}", "", "Easy", "", DAY)
+            assert set(db.get_all_problems_df()['problem_id']) == {f"{user}-{i}" for i in range(20)}
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker, args=(f"user-{i}",)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
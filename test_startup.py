@@ -0,0 +1,58 @@
+import ast
+import subprocess
+import sys
+import database as db
+
+# The app's own modules, imported on every cold start. pandas alone takes
+# longer than this to import.
+IMPORT_BUDGET_MS = 300
+HEAVY_MODULES = ("pandas", "altair", "pyarrow")
+
+def _app_imports():
+    # Modules app.py imports before drawing any page
+    with open("app.py") as f:
+        tree = ast.parse(f.read())
+    return [alias.name for node in tree.body if isinstance(node, ast.Import) for alias in node.names]
+
+def _cold_import(modules):
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {', '.join(modules)}\n"
+        "print((time.perf_counter() - start) * 1000)\n"
+        f"print(*[m for m in {HEAVY_MODULES!r} if m in sys.modules])\n"
+    )
+    out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    ms, loaded = out.split("\n")[:2]
+    return float(ms), loaded.split()
+
+def test_app_imports_no_heavy_modules():
+    modules = _app_imports()
+    assert "database" in modules and "pandas" not in modules
+    assert _cold_import(modules)[1] == []
+
+def test_import_time_budget():
+    own = [m for m in _app_imports() if m != "streamlit"]
+    # Best of three, as timings on a busy machine only ever err high
+    best = min(_cold_import(own)[0] for _ in range(3))
+    assert best < IMPORT_BUDGET_MS, f"importing {own} took {best:.0f} ms"
+
+def test_init_db_on_current_db_is_one_read(setup_db):
+    conn = db.connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        db.init_db()
+    finally:
+        conn.set_trace_callback(None)
+    # pragma_user_version() traces its own "-- PRAGMA" line
+    statements = [s for s in statements if not s.startswith("--")]
+    assert len(statements) == 1 and statements[0].lstrip().startswith("SELECT")
+
+def test_init_db_finishes_partial_setup(setup_db):
+    # A config default added by a newer release is filled in
+    db.connection().execute("DELETE FROM config WHERE key = 'archive_after_days'")
+    assert not db._is_set_up()
+    db.init_db()
+    assert db._is_set_up()
+    assert db.get_settings().archive_after_days == int(db.DEFAULT_CONFIG['archive_after_days'])
@@ -0,0 +1,96 @@
+import pytest
+import database as db
+import datetime
+import io
+
+DAY = datetime.date(2024, 1, 10)
+
+def _tags():
+    # {problem_id: sorted tag names} from the normalized tables
+    tags = {}
+    for row in db.connection().execute(
+        "SELECT pt.problem_id, t.name FROM problem_tags pt JOIN tags t ON t.id = pt.tag_id ORDER BY t.name"
+    ):
+        tags.setdefault(row['problem_id'], []).append(row['name'])
+    return tags
+
+def _names():
+    return sorted(row[0] for row in db.connection().execute("SELECT name FROM tags"))
+
+def _counts(**facets):
+    return {row['tag']: row['problems'] for row in db.get_tag_counts(**facets)}
+
+@pytest.fixture
+def problems(setup_db):
+    # Due on DAY: everything but "dijkstra", added later
+    db.add_problem("clone-graph", "Clone Graph", "Medium", "graph, dfs, bfs", DAY - datetime.timedelta(days=3))
+    db.add_problem("word-ladder", "Word Ladder", "Hard", "Graph,BFS,string", DAY - datetime.timedelta(days=3))
+    db.add_problem("alien-dictionary", "Alien Dictionary", "Hard", "graph,topological-sort", DAY - datetime.timedelta(days=2))
+    db.add_problem("dijkstra", "Network Delay Time", "Hard", "graph,heap", DAY)
+    db.add_problem("two-sum", "Two Sum", "Easy", "array, hash-table", DAY - datetime.timedelta(days=1))
+
+def test_tags_are_parsed_and_merged(problems):
+    tags = _tags()
+    assert tags["clone-graph"] == ["bfs", "dfs", "graph"]
+    # Tags match case-insensitively and keep their first spelling
+    assert tags["word-ladder"] == ["bfs", "graph", "string"]
+    assert _counts()["graph"] == 4
+
+    db.add_problem("odd", "Odd", "Easy", ' "quoted" ,, back\\slash, ,graph,GRAPH', DAY)
+    assert _tags()["odd"] == ['"quoted"', "back\\slash", "graph"]
+
+def test_tags_follow_edits(problems):
+    db.update_problem("two-sum", {'title': "Two Sum", 'difficulty': "Easy", 'tags': "array,hashing", 'date_added': DAY})
+    assert _tags()["two-sum"] == ["array", "hashing"]
+    assert "hash-table" not in _names()  # no problem has it any more
+
+    db.delete_problem("alien-dictionary")
+    assert "alien-dictionary" not in _tags()
+    assert "topological-sort" not in _names()
+    assert _counts()["graph"] == 3
+
+    db.bulk_import(io.StringIO('problem_id,title,tags\nnumber-of-islands,Number of Islands,"graph,dfs,matrix"\n'), DAY)
+    assert _tags()["number-of-islands"] == ["dfs", "graph", "matrix"]
+
+    db.update_problem("dijkstra", {'title': "Network Delay Time", 'difficulty': "Hard", 'tags': "", 'date_added': DAY})
+    assert "dijkstra" not in _tags() and "heap" not in _names()
+
+def test_faceted_filters(problems):
+    # "Due Hard graph problems"
+    due_hard_graph = db.filter_problems(difficulties=["Hard"], tags=["graph"], due_by=DAY)
+    assert sorted(due_hard_graph['problem_id']) == ["alien-dictionary", "word-ladder"]
+    assert sorted(db.filter_problems(tags=["GRAPH", "bfs"])['problem_id']) == ["clone-graph", "word-ladder"]
+    assert db.filter_problems(tags=["graph", "array"]).empty
+    assert len(db.filter_problems()) == 5
+
+    rows, _ = db.get_due_page(DAY, difficulties=["Hard"], tags=["graph"])
+    assert [r['problem_id'] for r in rows] == ["word-ladder", "alien-dictionary"]
+    rows, _ = db.get_due_page(DAY, tags=["bfs", " graph ", "Bfs"])
+    assert [r['problem_id'] for r in rows] == ["clone-graph", "word-ladder"]
+
+    assert _counts(difficulties=["Hard"]) == {"graph": 3, "bfs": 1, "string": 1, "topological-sort": 1, "heap": 1}
+    assert _counts(tags=["bfs"], due_by=DAY) == {"bfs": 2, "graph": 2, "dfs": 1, "string": 1}
+
+def test_tag_counts_group_along_the_index(problems):
+    plan = [row['detail'] for row in db.connection().execute("""
+        EXPLAIN QUERY PLAN
+        SELECT t.name AS tag, COUNT(*) AS problems FROM problem_tags AS pt JOIN tags AS t ON t.id = pt.tag_id
+        WHERE true GROUP BY pt.tag_id ORDER BY problems DESC, t.name
+    """)]
+    assert "SCAN pt USING COVERING INDEX idx_problem_tags_tag" in plan
+    assert "USE TEMP B-TREE FOR GROUP BY" not in plan
+
+def test_rebuild_and_migration(problems):
+    maintained = _tags()
+    db.rebuild_tag_index()
+    assert _tags() == maintained
+
+    # An older database gets its tags parsed from problems.tags
+    conn = db.connection()
+    conn.execute("DROP TABLE problem_tags")
+    conn.execute("DROP TABLE tags")
+    for name in ("tags_problem_insert", "tags_problem_update", "tags_problem_delete"):
+        conn.execute(f"DROP TRIGGER {name}")
+    for statement in db.MIGRATIONS[7]:  # migration 8
+        conn.execute(statement)
+    assert _tags() == maintained